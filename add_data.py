@@ -1,14 +1,14 @@
-import json
+import argparse
 import asyncio
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, select, text
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 from datetime import datetime
-from app.db.models import Team, Player, Match, Goal, Base
-from app.core.config import DATABASE_URL  # Предполагается, что DATABASE_URL загружается из .env файла
+from app.db.database import async_engine, build_async_engine
+from app.db.migrate import verify_schema
+from app.services.export_service import EXPORT_TABLES, export_filename, export_to_file
+from app.services.ingest import DEFAULT_BATCH_SIZE, ingest_dataset
+from app.services.scraper import Scraper, photo_enricher
 import logging
-import aiohttp
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 import os
 
@@ -22,148 +22,45 @@ logger = logging.getLogger(__name__)
 # Получение значения DATABASE_URL из переменных окружения
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Создаем асинхронный движок для подключения к базе данных
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Создаем асинхронный движок для подключения к базе данных.
+# Эхо SQL отключено: при пакетной загрузке оно стоит дороже самих вставок.
+engine = build_async_engine(DATABASE_URL) if DATABASE_URL else async_engine
 async_session = sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
 )
 
-# Универсальная функция для парсинга изображений (команд и игроков)
-async def parse_image(url, css_class, http_session):
-    try:
-        async with http_session.get(url, headers={'User-Agent': 'Mozilla/5.0'}) as response:
-            content = await response.text()
-            soup = BeautifulSoup(content, 'html.parser')
-            image_div = soup.find('div', class_=css_class)
-            if image_div:
-                image_tag = image_div.find('img')
-                if image_tag:
-                    return image_tag.get('src')
-        return None
-    except Exception as e:
-        logger.error(f"Ошибка при парсинге изображения с URL {url}: {e}")
-        return None
+# Преобразование кортежей исходных данных в строки для пакетной вставки
+def team_rows(teams_data):
+    return [dict(name=name, city=city, founded=founded, stadium=stadium)
+            for name, city, founded, stadium in teams_data]
 
-# Функции для парсинга данных
-async def parse_team_photo(team_name, http_session):
-    search_url = f"https://www.transfermarkt.com/schnellsuche/ergebnis/schnellsuche?query={team_name.replace(' ', '+')}"
-    return await parse_image(search_url, 'vereinprofil_tooltip', http_session)
+def player_rows(players_data):
+    return [dict(name=name, position=position, team_id=team_id, goals=goals, is_starter=is_starter)
+            for name, position, team_id, goals, is_starter in players_data]
 
-async def parse_player_photo(player_name, http_session):
-    search_url = f"https://www.transfermarkt.com/schnellsuche/ergebnis/schnellsuche?query={player_name.replace(' ', '+')}"
-    return await parse_image(search_url, 'spielprofil_tooltip', http_session)
+def match_rows(matches_data):
+    return [dict(home_team_id=home_team_id, away_team_id=away_team_id, date=date,
+                 home_score=home_score, away_score=away_score)
+            for home_team_id, away_team_id, date, home_score, away_score in matches_data]
 
-# Функции для добавления записей
-async def add_team(session, name, city, founded, stadium, http_session):
-    existing_team = await session.execute(select(Team).where(Team.name == name))
-    if existing_team.scalars().first():
-        logger.warning(f"Team {name} already exists")
-        return
+def goal_rows(goals_data):
+    return [dict(match_id=match_id, player_id=player_id, minute=minute)
+            for match_id, player_id, minute in goals_data]
 
-    url_photo = await parse_team_photo(name, http_session)
-    team = Team(name=name, city=city, founded=founded, stadium=stadium, url_photo=url_photo)
-    session.add(team)
-    logger.info(f"Added team: {team.name}")
-
-async def add_player(session, name, position, team_id, goals, is_starter, http_session):
-    existing_player = await session.execute(select(Player).where(Player.name == name, Player.team_id == team_id))
-    if existing_player.scalars().first():
-        logger.warning(f"Player {name} already exists in team ID {team_id}")
-        return
-
-    url_photo = await parse_player_photo(name, http_session)
-    player = Player(name=name, position=position, team_id=team_id, goals=goals, url_photo=url_photo, is_starter=is_starter)
-    session.add(player)
-    logger.info(f"Added player: {player.name} to team ID {team_id}")
-
-async def add_match(session, home_team_id, away_team_id, date, home_score, away_score):
-    match = Match(
-        home_team_id=home_team_id,
-        away_team_id=away_team_id,
-        date=date,
-        home_score=home_score,
-        away_score=away_score
-    )
-    session.add(match)
-    logger.info(f"Added match on {match.date} between teams {home_team_id} and {away_team_id}")
-
-async def add_goal(session, match_id, player_id, minute):
-    goal = Goal(match_id=match_id, player_id=player_id, minute=minute)
-    session.add(goal)
-    logger.info(f"Added goal: Match ID {match_id}, Player ID {player_id}, Minute {minute}")
-
-# Функция для сохранения данных в файлы JSON
+# Функция для сохранения данных в файлы NDJSON.
+# Таблицы выгружаются потоково, пачками, без загрузки всей таблицы в память.
 async def save_to_json(session):
-    # Сохранение данных команд
-    result = await session.execute(text("SELECT * FROM teams"))
-    teams = result.scalars().all()
-    teams_data = [{
-        "id": team.id,
-        "name": team.name,
-        "city": team.city,
-        "founded": team.founded,
-        "stadium": team.stadium,
-        "points": team.points,
-        "url_photo": team.url_photo
-    } for team in teams]
-    
-    with open('teams.json', 'w', encoding='utf-8') as f:
-        json.dump(teams_data, f, ensure_ascii=False, indent=4)
-    logger.info("Teams data saved to teams.json")
-    
-    # Сохранение данных игроков
-    result = await session.execute(text("SELECT * FROM players"))
-    players = result.scalars().all()
-    players_data = [{
-        "id": player.id,
-        "name": player.name,
-        "position": player.position,
-        "goals": player.goals,
-        "team_id": player.team_id,
-        "url_photo": player.url_photo,
-        "is_starter": player.is_starter
-    } for player in players]
-    
-    with open('players.json', 'w', encoding='utf-8') as f:
-        json.dump(players_data, f, ensure_ascii=False, indent=4)
-    logger.info("Players data saved to players.json")
-    
-    # Сохранение данных матчей
-    result = await session.execute(text("SELECT * FROM matches"))
-    matches = result.scalars().all()
-    matches_data = [{
-        "id": match.id,
-        "home_team_id": match.home_team_id,
-        "away_team_id": match.away_team_id,
-        "date": match.date.strftime('%Y-%m-%d %H:%M:%S'),
-        "home_score": match.home_score,
-        "away_score": match.away_score
-    } for match in matches]
-    
-    with open('matches.json', 'w', encoding='utf-8') as f:
-        json.dump(matches_data, f, ensure_ascii=False, indent=4)
-    logger.info("Matches data saved to matches.json")
-    
-    # Сохранение данных голов
-    result = await session.execute(text("SELECT * FROM goals"))
-    goals = result.scalars().all()
-    goals_data = [{
-        "id": goal.id,
-        "match_id": goal.match_id,
-        "player_id": goal.player_id,
-        "minute": goal.minute
-    } for goal in goals]
-    
-    with open('goals.json', 'w', encoding='utf-8') as f:
-        json.dump(goals_data, f, ensure_ascii=False, indent=4)
-    logger.info("Goals data saved to goals.json")
+    for name in EXPORT_TABLES:
+        path = export_filename(name, "ndjson", compress=False)
+        await session.run_sync(export_to_file, name, path)
 
 # Добавление данных в базу
-async def add_data():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+async def add_data(batch_size=DEFAULT_BATCH_SIZE):
+    # Схема создается миграциями (python -m app.db.migrate), здесь только проверка версии
+    async with engine.connect() as conn:
+        await conn.run_sync(verify_schema)
 
-    async with async_session() as session, aiohttp.ClientSession() as http_session:
+    async with async_session() as session, Scraper() as scraper:
         try:
             # Данные команд
             teams_data = [
@@ -486,22 +383,20 @@ async def add_data():
                 (36, 85, 55), # Матч 36, игрок 85, 55-я минута
             ]
 
-            # Добавление данных в базу
-            for team in teams_data:
-                await add_team(session, *team, http_session)
-
-            for player in players_data:
-                await add_player(session, *player, http_session)
-
-            for match in matches_data:
-                await add_match(session, *match)
-
-            for goal in goals_data:
-                await add_goal(session, *goal)
-
-            await session.commit()
+            # Пакетное добавление данных в базу (существующие строки пропускаются)
+            await ingest_dataset(
+                session,
+                teams=team_rows(teams_data),
+                players=player_rows(players_data),
+                matches=match_rows(matches_data),
+                goals=goal_rows(goals_data),
+                batch_size=batch_size,
+                enrich_teams=photo_enricher(scraper.team_photo),
+                enrich_players=photo_enricher(scraper.player_photo),
+            )
             logger.info("All data added successfully")
-            
+            logger.info(f"Загрузка фотографий: {scraper.stats}")
+
             # Сохранение данных команд, игроков, матчей и голов в файлы JSON
             await save_to_json(session)
 
@@ -511,4 +406,7 @@ async def add_data():
             raise
 
 if __name__ == "__main__":
-    asyncio.run(add_data())
+    parser = argparse.ArgumentParser(description="Загрузка начальных данных")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Размер пачки вставки")
+    args = parser.parse_args()
+    asyncio.run(add_data(args.batch_size))
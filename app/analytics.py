@@ -1,29 +1,56 @@
 from datetime import datetime
 from sqlalchemy.orm import Session
 from app.db import models
+from app.services import retention, rollups, sketches
+from app.services.action_log import action_log_writer
+from app.services.rollups import lock_watermark, roll_up
 
-# Запись действия пользователя
-def log_user_action(db: Session, user_id: int, action: str):
+# Запись действия пользователя: событие ставится в очередь и записывается
+# в базу фоновым потоком пачками (False - очередь переполнена, событие отброшено)
+def log_user_action(user_id: int, action: str) -> bool:
+    return action_log_writer.submit(user_id, action)
+
+# Немедленная запись действия в отдельной транзакции (когда нужна сохраненная строка)
+def write_user_action(db: Session, user_id: int, action: str):
     action_log = models.ActionLog(
         user_id=user_id,
         action=action,
         timestamp=datetime.utcnow()
     )
     db.add(action_log)
+    lock_watermark(db.connection())
+    db.flush()
+    roll_up(db.connection())
     db.commit()
     db.refresh(action_log)
     return action_log
 
-# Получение статистики по действиям пользователей
+# Действия пользователя (id, user_id, action, timestamp) в порядке времени: из основной
+# таблицы, отделенных партиций и архивов (связь User.action_logs видит только action_logs)
 def get_user_actions(db: Session, user_id: int):
-    actions = db.query(models.ActionLog).filter(models.ActionLog.user_id == user_id).all()
-    return actions
+    return retention.read_actions(db, user_id=user_id)
 
-# Получение общего количества посещений
+# Получение общего количества посещений (по агрегатам, без полного COUNT(*) журнала)
 def get_visit_count(db: Session):
-    return db.query(models.ActionLog).count()
+    return rollups.total_count(db)
+
+# Приблизительное число уникальных пользователей за дни периода (HyperLogLog, ошибка около 1.6%)
+def get_unique_visitors(db: Session, start_date: datetime, end_date: datetime) -> int:
+    return sketches.distinct_users(db, start_date, end_date)
+
+# Самые частые действия за дни периода с оценкой числа событий (Count-Min, оценка сверху)
+def get_top_actions(db: Session, start_date: datetime, end_date: datetime, limit: int = 20) -> list:
+    return sketches.top_actions(db, start_date, end_date, limit)
 
 # Получение статистики по действиям за определенный период
+# (строки основной таблицы, отделенных партиций и архивов в порядке времени)
 def get_actions_by_period(db: Session, start_date: datetime, end_date: datetime):
-    actions = db.query(models.ActionLog).filter(models.ActionLog.timestamp.between(start_date, end_date)).all()
-    return actions
+    return retention.read_actions(db, start_date, end_date, end_inclusive=True)
+
+# Число действий за период [start_date, end_date) по агрегатам и непокрытым ими концам периода
+def count_actions_by_period(db: Session, start_date: datetime, end_date: datetime, action: str = None, user_id: int = None) -> int:
+    return rollups.count_actions(db, start_date, end_date, action=action, user_id=user_id)
+
+# Число действий за период по каждому действию или пользователю (group_by: "action" или "user_id")
+def get_action_counts_by_period(db: Session, start_date: datetime, end_date: datetime, group_by: str = "action") -> dict:
+    return rollups.count_by_period(db, start_date, end_date, group_by=group_by)
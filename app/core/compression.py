@@ -0,0 +1,164 @@
+"""
+Сжатие ответов на лету (brotli, если установлен, иначе gzip).
+
+Ответы меньше compression_minimum_size, уже сжатые (Content-Encoding) и
+несжимаемых типов (изображения и т.п.) передаются как есть. Потоковые ответы
+(выгрузки, StreamingResponse) сжимаются по частям: каждая часть сразу
+отправляется клиенту, тело целиком в памяти не собирается.
+"""
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/x-ndjson", "application/javascript",
+    "application/xml", "image/svg+xml",
+)
+
+
+class GzipCompressor:
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        # wbits=31 - формат gzip
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        # Z_SYNC_FLUSH отдает сжатые данные части сразу, не дожидаясь конца потока
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    encoding = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+# Выбор кодировки по Accept-Encoding; None - сжатие не поддерживается клиентом
+def choose_encoding(accept_encoding: str):
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def make_compressor(encoding: str):
+    if encoding == "br":
+        return BrotliCompressor(settings.brotli_quality)
+    return GzipCompressor(settings.gzip_level)
+
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware сжатия ответов с порогом по размеру и поддержкой потоковых ответов.
+    """
+
+    def __init__(self, app, minimum_size: int = None):
+        self.app = app
+        self.minimum_size = settings.compression_minimum_size if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressedResponder(self.app, encoding, self.minimum_size)
+        await responder(scope, receive, send)
+
+
+class _CompressedResponder:
+    def __init__(self, app, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    async def send_with_compression(self, message):
+        if message["type"] == "http.response.start":
+            # Заголовки откладываются до первой части тела: решение о сжатии зависит от ее размера
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = message["status"] in (204, 304) or not is_compressible(headers)
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        if self.passthrough:
+            if self.start_message is not None:
+                await self.send(self.start_message)
+                self.start_message = None
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            if not more_body and len(body) < self.minimum_size:
+                await self.send(self.start_message)
+                self.start_message = None
+                await self.send(message)
+                self.passthrough = True
+                return
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            # Сжатое тело отличается побайтно: сильный ETag становится слабым
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            self.compressor = make_compressor(self.encoding)
+            if not more_body:
+                # Тело целиком в одном сообщении: длина сжатого ответа известна
+                data = self.compressor.compress(body) + self.compressor.finish()
+                headers["Content-Length"] = str(len(data))
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": data})
+                return
+            del headers["Content-Length"]
+            await self.send(self.start_message)
+            self.start_message = None
+
+        data = self.compressor.compress(body) if body else b""
+        if more_body:
+            if data:
+                await self.send({"type": "http.response.body", "body": data, "more_body": True})
+        else:
+            await self.send({"type": "http.response.body", "body": data + self.compressor.finish()})
@@ -1,7 +1,108 @@
-DATABASE_URL = "sqlite:///C:/Users/maksi/Desktop/soccer_hub/instance/soccer_hub.db"
+import os
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///C:/Users/maksi/Desktop/soccer_hub/instance/soccer_hub.db")
 
 class Settings:
     debug: bool = True
     some_other_setting: str = "value"
 
+    # Запуск сервера (run.py): dev - один процесс с перезагрузкой, production - несколько воркеров
+    run_mode: str = os.getenv("RUN_MODE", "dev")
+    web_concurrency: int = int(os.getenv("WEB_CONCURRENCY", 0))  # Число воркеров; 0 - по числу ядер
+    event_loop: str = os.getenv("EVENT_LOOP", "auto")  # auto (uvloop, если установлен), uvloop, asyncio
+    http_impl: str = os.getenv("HTTP_IMPL", "auto")  # auto (httptools, если установлен), httptools, h11
+    keepalive_timeout: int = int(os.getenv("KEEPALIVE_TIMEOUT", 5))  # Секунды
+    backlog: int = int(os.getenv("BACKLOG", 2048))
+    graceful_timeout: int = int(os.getenv("GRACEFUL_TIMEOUT", 30))  # Секунды на завершение запросов при остановке
+    max_requests: int = int(os.getenv("MAX_REQUESTS", 0))  # Перезапуск воркера после N запросов; 0 - без перезапуска
+
+    # Пул соединений для серверных СУБД (PostgreSQL и т.п.)
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", 5))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    db_pool_timeout: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Секунды до пересоздания соединения
+    db_pool_pre_ping: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+    # Проверка версии схемы при запуске (миграции выполняет python -m app.db.migrate)
+    schema_check: bool = os.getenv("SCHEMA_CHECK", "true").lower() == "true"
+
+    # Профиль SQLite, применяется к каждому новому соединению
+    sqlite_journal_mode: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    sqlite_synchronous: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    sqlite_mmap_size: int = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # Байты
+    sqlite_cache_size: int = int(os.getenv("SQLITE_CACHE_SIZE", -64000))  # Отрицательное значение - в КиБ
+    sqlite_busy_timeout: int = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # Миллисекунды
+
+    # Кэш страницы аналитики
+    dashboard_cache_ttl: float = float(os.getenv("DASHBOARD_CACHE_TTL", 60))  # Секунды
+    dashboard_cache_size: int = int(os.getenv("DASHBOARD_CACHE_SIZE", 16))  # Записи
+
+    # Кэш загруженных столбцов сезона (stats_engine), запись - один период (start, end)
+    season_data_cache_ttl: float = float(os.getenv("SEASON_DATA_CACHE_TTL", 300))  # Секунды
+    season_data_cache_size: int = int(os.getenv("SEASON_DATA_CACHE_SIZE", 4))  # Записи
+
+    # Постраничный вывод списков
+    page_size: int = int(os.getenv("PAGE_SIZE", 50))
+    max_page_size: int = int(os.getenv("MAX_PAGE_SIZE", 500))
+
+    # Загрузка фотографий команд и игроков
+    scraper_base_url: str = os.getenv("SCRAPER_BASE_URL", "https://www.transfermarkt.com")
+    scraper_cache_dir: str = os.getenv("SCRAPER_CACHE_DIR", "instance/scraper_cache")
+    scraper_concurrency: int = int(os.getenv("SCRAPER_CONCURRENCY", 8))
+    scraper_rate_per_host: float = float(os.getenv("SCRAPER_RATE_PER_HOST", 2))  # Запросов в секунду к одному хосту
+    scraper_retries: int = int(os.getenv("SCRAPER_RETRIES", 3))
+    scraper_backoff: float = float(os.getenv("SCRAPER_BACKOFF", 0.5))  # Секунды, удваивается с каждой попыткой
+    scraper_timeout: float = float(os.getenv("SCRAPER_TIMEOUT", 10))  # Секунды
+
+    # Локальные копии и миниатюры фотографий (/media)
+    media_dir: str = os.getenv("MEDIA_DIR", "instance/media")
+    media_max_bytes: int = int(os.getenv("MEDIA_MAX_BYTES", 5 * 1024 * 1024))
+    media_max_age: int = int(os.getenv("MEDIA_MAX_AGE", 365 * 24 * 3600))  # Секунды
+
+    # Шаблоны: кэш байткода на диске и проверка изменений файлов (по умолчанию - везде, кроме RUN_MODE=production)
+    templates_cache_dir: str = os.getenv("TEMPLATES_CACHE_DIR", "instance/jinja_cache")  # Пустая строка - без кэша
+    templates_auto_reload: bool = os.getenv("TEMPLATES_AUTO_RELOAD", str(run_mode != "production")).lower() == "true"
+
+    # Кэш отрендеренных строк списков (ключ - id и updated_at сущностей)
+    fragment_cache_size: int = int(os.getenv("FRAGMENT_CACHE_SIZE", 5000))  # Фрагменты
+    fragment_cache_ttl: float = float(os.getenv("FRAGMENT_CACHE_TTL", 3600))  # Секунды
+
+    # Условные GET-запросы: браузер перепроверяет страницу каждый раз (дешевый ответ 304),
+    # обратный прокси может отдавать ее из своего кэша s-maxage секунд
+    http_cache_max_age: int = int(os.getenv("HTTP_CACHE_MAX_AGE", 0))
+    http_cache_shared_max_age: int = int(os.getenv("HTTP_CACHE_SHARED_MAX_AGE", 30))
+
+    # Сжатие ответов
+    compression_minimum_size: int = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 500))  # Байты; меньшие ответы не сжимаются
+    gzip_level: int = int(os.getenv("GZIP_LEVEL", 6))
+    brotli_quality: int = int(os.getenv("BROTLI_QUALITY", 5))  # Для ответов на лету; при сборке статики - максимум
+
+    # Статические файлы: исходники и результат сборки (отпечатки в именах, .gz/.br, manifest.json)
+    static_dir: str = os.getenv("STATIC_DIR", "app/static")
+    static_build_dir: str = os.getenv("STATIC_BUILD_DIR", "instance/static")
+
+    # Замеры времени запросов: заголовок Server-Timing и журнал медленных SQL-запросов
+    server_timing: bool = os.getenv("SERVER_TIMING", "true").lower() == "true"
+    slow_query_ms: float = float(os.getenv("SLOW_QUERY_MS", 200))  # Миллисекунды; 0 - не журналировать
+
+    # Метрики /metrics: каталог снимков процессов (пустая строка - один процесс, без снимков)
+    metrics_dir: str = os.getenv("METRICS_DIR", "")
+    metrics_flush_interval: float = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))  # Секунды
+
+    # Буферизованная запись журнала действий пользователей
+    action_log_queue_size: int = int(os.getenv("ACTION_LOG_QUEUE_SIZE", 10000))  # События; лишние отбрасываются
+    action_log_batch_size: int = int(os.getenv("ACTION_LOG_BATCH_SIZE", 500))  # Строк в одном INSERT
+    action_log_flush_interval: float = float(os.getenv("ACTION_LOG_FLUSH_INTERVAL", 1))  # Секунды
+    action_log_put_timeout: float = float(os.getenv("ACTION_LOG_PUT_TIMEOUT", 0))  # Секунды ожидания места; 0 - не ждать
+    action_log_drain_timeout: float = float(os.getenv("ACTION_LOG_DRAIN_TIMEOUT", 10))  # Секунды на дозапись при остановке
+    action_log_retry_attempts: int = int(os.getenv("ACTION_LOG_RETRY_ATTEMPTS", 5))  # Попыток записи пачки при OperationalError
+    action_log_retry_delay: float = float(os.getenv("ACTION_LOG_RETRY_DELAY", 0.5))  # Секунды между попытками
+
+    # Хранение журнала действий: партиции по дням или месяцам, истекшие архивируются или удаляются
+    action_log_partition: str = os.getenv("ACTION_LOG_PARTITION", "month")  # day, month
+    action_log_retention_days: int = int(os.getenv("ACTION_LOG_RETENTION_DAYS", 90))
+    action_log_expire: str = os.getenv("ACTION_LOG_EXPIRE", "archive")  # archive, drop
+    action_log_archive_dir: str = os.getenv("ACTION_LOG_ARCHIVE_DIR", "instance/archive")
+    action_log_partitions_ahead: int = int(os.getenv("ACTION_LOG_PARTITIONS_AHEAD", 2))  # Заранее создаваемые партиции (PostgreSQL)
+
 settings = Settings()  # Создаем экземпляр класса
@@ -0,0 +1,156 @@
+"""
+Условные GET-запросы (ETag / Last-Modified / 304).
+
+Перед выполнением обработчика зависимость conditional_get вычисляет валидатор
+страницы по дешевым запросам состояния таблиц: число строк и max(updated_at)
+(читается из индекса). Если валидатор совпадает с If-None-Match, обработчик не
+вызывается и клиент получает 304. Иначе middleware добавляет к успешному ответу
+ETag, Last-Modified и Cache-Control.
+
+If-Modified-Since не проверяется: max(updated_at) не меняется при удалении строк
+и добавлении голов (у них нет updated_at), а после удаления самой новой строки
+даже уменьшается. Last-Modified отдается только как справочный заголовок.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import NamedTuple, Optional
+from fastapi import Depends, Request
+from fastapi.responses import Response
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.templates import TEMPLATES_DIR
+from app.db.database import get_async_db
+from app.db.models import Goal, Match, Player, Team
+
+
+class NotModified(Exception):
+    """Копия клиента актуальна: ответить 304 без выполнения обработчика."""
+
+    def __init__(self, validator):
+        self.validator = validator
+
+
+class Validator(NamedTuple):
+    etag: str
+    last_modified: Optional[datetime]
+
+
+# Версия шаблонов: после их изменения старые ETag HTML-страниц перестают совпадать
+def templates_version(directory: str = TEMPLATES_DIR) -> str:
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(directory)):
+        stat = os.stat(os.path.join(directory, name))
+        digest.update(f"{name}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+    return digest.hexdigest()[:12]
+
+
+TEMPLATES_VERSION = templates_version()
+
+
+# Состояние набора строк: количество (ловит удаления) и версия последнего изменения
+def rows_state(model, *criteria, version=None):
+    version = model.updated_at if version is None else version
+    return select(func.count(), func.max(version)).select_from(model).where(*criteria)
+
+
+# Таблицы, от которых зависит каждая страница: имя -> функция параметров пути -> запросы состояния.
+# Страница должна перечислять все сущности, которые она выводит, включая связанные.
+def _match_teams(match_id: int):
+    match_teams = select(Match.home_team_id, Match.away_team_id).where(Match.id == match_id).subquery()
+    return rows_state(Team, or_(Team.id == match_teams.c.home_team_id, Team.id == match_teams.c.away_team_id))
+
+
+PAGE_STATES = {
+    "teams": lambda params: [rows_state(Team)],
+    "team": lambda params: [
+        rows_state(Team, Team.id == int(params["team_id"])),
+        rows_state(Player, Player.team_id == int(params["team_id"])),
+    ],
+    "players": lambda params: [rows_state(Player), rows_state(Team)],
+    "player": lambda params: [
+        rows_state(Player, Player.id == int(params["player_id"])),
+        rows_state(Team, Team.id == select(Player.team_id).where(Player.id == int(params["player_id"])).scalar_subquery()),
+    ],
+    "matches": lambda params: [rows_state(Match), rows_state(Team)],
+    "match": lambda params: [
+        rows_state(Match, Match.id == int(params["match_id"])),
+        _match_teams(int(params["match_id"])),
+        # У голов нет updated_at: добавление и удаление видны по количеству и max(id)
+        rows_state(Goal, Goal.match_id == int(params["match_id"]), version=Goal.id),
+        rows_state(Player, Player.id.in_(select(Goal.player_id).where(Goal.match_id == int(params["match_id"])))),
+    ],
+}
+
+
+async def compute_validator(db: AsyncSession, request: Request, states) -> Validator:
+    parts = [request.url.path, request.url.query, TEMPLATES_VERSION]
+    last_modified = None
+    for stmt in states:
+        count, version = (await db.execute(stmt)).one()
+        parts.append([count, version])
+        if isinstance(version, datetime) and (last_modified is None or version > last_modified):
+            last_modified = version
+    digest = hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:20]
+    if last_modified is not None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+    # Слабый ETag: совпадает смысл страницы, а не побайтовое содержимое
+    return Validator(etag=f'W/"{digest}"', last_modified=last_modified)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Слабое сравнение: префикс W/ не учитывается
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+# 304 только по ETag: он учитывает количество строк и версии всех таблиц страницы
+def is_not_modified(request: Request, validator: Validator) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    return if_none_match is not None and _etag_matches(if_none_match, validator.etag)
+
+
+# Зависимость для маршрута: dependencies=[Depends(conditional_get("teams"))]
+def conditional_get(page: str):
+    builder = PAGE_STATES[page]
+
+    async def dependency(request: Request, db: AsyncSession = Depends(get_async_db)):
+        try:
+            states = builder(request.path_params)
+        except (KeyError, ValueError):
+            return  # Некорректные параметры пути - ответит сам обработчик
+        validator = await compute_validator(db, request, states)
+        request.state.validator = validator
+        if is_not_modified(request, validator):
+            raise NotModified(validator)
+
+    return dependency
+
+
+def cache_headers(validator: Validator) -> dict:
+    headers = {
+        "ETag": validator.etag,
+        "Cache-Control": f"public, max-age={settings.http_cache_max_age}, s-maxage={settings.http_cache_shared_max_age}",
+    }
+    if validator.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(validator.last_modified, usegmt=True)
+    return headers
+
+
+def not_modified_response(validator: Validator) -> Response:
+    return Response(status_code=304, headers=cache_headers(validator))
+
+
+# Middleware: заголовки валидатора для успешных ответов страниц с conditional_get
+async def conditional_get_middleware(request: Request, call_next):
+    response = await call_next(request)
+    validator = getattr(request.state, "validator", None)
+    if validator is not None and response.status_code == 200:
+        for name, value in cache_headers(validator).items():
+            response.headers.setdefault(name, value)
+    return response
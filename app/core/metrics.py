@@ -0,0 +1,364 @@
+"""
+Метрики приложения в текстовом формате Prometheus (GET /metrics).
+
+Реестр живет в памяти процесса: счетчики (Counter), значения (Gauge) и
+гистограммы с фиксированными границами корзин (Histogram). Обновление метрики -
+несколько операций со словарем под собственной блокировкой метрики, без
+обращений к диску и сети.
+
+Несколько воркеров (RUN_MODE=production): каждый процесс раз в
+metrics_flush_interval секунд (и перед ответом на /metrics) сохраняет снимок
+своего реестра в файл <metrics_dir>/<pid>.json. Обработчик /metrics суммирует
+снимки всех процессов: счетчики и гистограммы - включая завершившиеся воркеры
+(значения не должны уменьшаться), значения Gauge - только живых процессов
+(снимок обновлялся недавно).
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from bisect import bisect_left
+from app.core.config import settings
+from app.core.timing import route_name
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_METRICS_DIR = "instance/metrics"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> dict:
+        with self._lock:
+            return {json.dumps(key): value for key, value in self._values.items()}
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    # Перенос накопленного значения из внешнего счетчика (например, попаданий в кэш)
+    def set_total(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    Гистограмма с фиксированными границами корзин. Значение для набора меток -
+    список: число наблюдений в каждой корзине (последняя - +Inf), сумма, количество.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def samples(self) -> dict:
+        with self._lock:
+            return {json.dumps(key): list(value) for key, value in self._values.items()}
+
+
+class Registry:
+    """
+    Реестр метрик процесса и функции, обновляющие метрики перед снимком
+    (состояние пулов соединений, кэшей и т.п.).
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, func):
+        self.collectors.append(func)
+        return func
+
+    def snapshot(self) -> dict:
+        for collect in self.collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.warning(f"Ошибка сбора метрик {collect.__name__}: {e}")
+        return {
+            name: {
+                "type": metric.type,
+                "help": metric.documentation,
+                "labelnames": metric.labelnames,
+                "buckets": getattr(metric, "buckets", None),
+                "samples": metric.samples(),
+            }
+            for name, metric in self.metrics.items()
+        }
+
+
+# Объединение снимков нескольких процессов
+def merge_snapshots(snapshots) -> dict:
+    merged = {}
+    for snapshot, alive in snapshots:
+        for name, metric in snapshot.items():
+            if metric["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            for key, value in metric["samples"].items():
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    target["samples"][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target["samples"][key] = current + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Текстовый формат Prometheus 0.0.4
+def render(snapshot: dict) -> str:
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for key, value in sorted(metric["samples"].items()):
+            labelvalues = json.loads(key)
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_labels(labelnames, labelvalues)} {_number(value)}")
+                continue
+            *counts, total, count = value
+            cumulative = 0
+            bounds = [repr(float(b)) for b in metric["buckets"]] + ["+Inf"]
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labelnames, labelvalues, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labelnames, labelvalues)} {_number(float(total))}")
+            lines.append(f"{name}_count{_labels(labelnames, labelvalues)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.counter("http_requests_total", "Число HTTP-запросов", ("method", "route", "status"))
+REQUEST_DURATION = registry.histogram("http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route"))
+IN_PROGRESS = registry.gauge("http_requests_in_progress", "Запросы в обработке")
+POOL_CONNECTIONS = registry.gauge("db_pool_connections", "Соединения пула по состоянию", ("engine", "state"))
+POOL_CHECKOUTS = registry.counter("db_pool_checkouts_total", "Выдачи соединений из пула", ("engine",))
+POOL_TIMEOUTS = registry.counter("db_pool_timeouts_total", "Таймауты ожидания соединения из пула", ("engine",))
+POOL_WAIT = registry.counter("db_pool_wait_seconds_total", "Суммарное ожидание соединения из пула", ("engine",))
+CACHE_REQUESTS = registry.counter("cache_requests_total", "Обращения к кэшам по результату", ("cache", "result"))
+CACHE_ENTRIES = registry.gauge("cache_entries", "Записи в кэше", ("cache",))
+
+
+@registry.collector
+def collect_pool_stats():
+    from app.db.database import get_pool_stats
+
+    for engine_name, stats in get_pool_stats().items():
+        for state in ("checked_out", "checked_in", "overflow"):
+            POOL_CONNECTIONS.set(stats[state], engine=engine_name, state=state)
+        POOL_CHECKOUTS.set_total(stats["checkouts"], engine=engine_name)
+        POOL_TIMEOUTS.set_total(stats["timeouts"], engine=engine_name)
+        POOL_WAIT.set_total(stats["total_wait_seconds"], engine=engine_name)
+
+
+@registry.collector
+def collect_cache_stats():
+    from app.core.templates import get_fragment_cache_stats
+    from app.services.analytics_service import get_dashboard_cache_stats
+
+    for cache_name, stats in (("fragments", get_fragment_cache_stats()), ("dashboard", get_dashboard_cache_stats())):
+        CACHE_REQUESTS.set_total(stats["hits"], cache=cache_name, result="hit")
+        CACHE_REQUESTS.set_total(stats["misses"], cache=cache_name, result="miss")
+        CACHE_ENTRIES.set(stats["size"], cache=cache_name)
+
+
+ACTION_LOG_EVENTS = registry.counter("action_log_events_total", "События журнала действий по результату", ("result",))
+ACTION_LOG_QUEUE = registry.gauge("action_log_queue_size", "События журнала действий в очереди на запись")
+
+
+@registry.collector
+def collect_action_log_stats():
+    from app.services.action_log import get_action_log_stats
+
+    stats = get_action_log_stats()
+    for result in ("written", "dropped", "failed", "retried"):
+        ACTION_LOG_EVENTS.set_total(stats[result], result=result)
+    ACTION_LOG_QUEUE.set(stats["queued"])
+
+
+# Метка маршрута - шаблон пути; запросы без маршрута (404) объединяются,
+# чтобы произвольные адреса не порождали новые временные ряды
+def route_label(scope) -> str:
+    if scope.get("route") is None:
+        return "unmatched"
+    return route_name(scope)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: число, длительность и количество одновременных HTTP-запросов.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_PROGRESS.dec()
+            route = route_label(scope)
+            REQUESTS.inc(method=scope["method"], route=route, status=status)
+            REQUEST_DURATION.observe(time.perf_counter() - started, method=scope["method"], route=route)
+
+
+# Каталог снимков. Главный процесс (run.py) передает его воркерам через окружение:
+# воркеры uvicorn - новые процессы, а gunicorn импортирует настройки еще до prepare_metrics_dir
+def metrics_dir() -> str:
+    return os.getenv("METRICS_DIR") or settings.metrics_dir
+
+
+# Снимки процессов (режим нескольких воркеров)
+def snapshot_path(directory: str, pid: int = None) -> str:
+    return os.path.join(directory, f"{pid or os.getpid()}.json")
+
+
+def write_snapshot(directory: str = None):
+    directory = directory or metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, path)
+
+
+def read_snapshots(directory: str) -> list:
+    snapshots = []
+    # Gauge считается живым, если процесс обновлял снимок в последние несколько интервалов
+    stale_before = time.time() - 3 * settings.metrics_flush_interval
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            alive = os.path.getmtime(path) >= stale_before
+            with open(path, encoding="utf-8") as f:
+                snapshots.append((json.load(f), alive))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать снимок метрик {path}: {e}")
+    return snapshots
+
+
+def collect() -> dict:
+    directory = metrics_dir()
+    if not directory:
+        return registry.snapshot()
+    write_snapshot(directory)
+    return merge_snapshots(read_snapshots(directory))
+
+
+def render_metrics() -> str:
+    return render(collect())
+
+
+# Каталог снимков очищается главным процессом перед запуском воркеров
+def prepare_metrics_dir(directory: str = None) -> str:
+    directory = directory or metrics_dir() or DEFAULT_METRICS_DIR
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+    os.environ["METRICS_DIR"] = directory
+    return directory
+
+
+async def flush_periodically():
+    while True:
+        await asyncio.sleep(settings.metrics_flush_interval)
+        try:
+            await asyncio.to_thread(write_snapshot)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить снимок метрик: {e}")
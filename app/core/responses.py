@@ -0,0 +1,20 @@
+from typing import Any
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, без него используется стандартный json
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON-ответ, сериализуемый через orjson (даты, перечисления и UUID поддерживаются без
+    предварительного обхода данных). Если orjson не установлен - обычный JSONResponse.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(jsonable_encoder(content))
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,143 @@
+"""
+Статические файлы.
+
+Сборка (python -m app.core.static) копирует app/static в каталог сборки, добавляя
+к каждому файлу копию с отпечатком содержимого в имени (css/styles.3f2a9c1b.css),
+сжатые варианты .gz и .br для текстовых файлов и manifest.json с соответствием
+исходных имен и имен с отпечатком. Файлы с отпечатком неизменяемы и кэшируются
+браузером навсегда; шаблоны получают их адреса через static_url().
+
+Без сборки статика отдается прямо из app/static.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from app.core.config import settings
+from app.core.compression import COMPRESSIBLE_TYPES, brotli, choose_encoding
+
+logger = logging.getLogger(__name__)
+
+STATIC_URL = "/static/"
+MANIFEST_NAME = "manifest.json"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+VARIANTS = {"br": ".br", "gzip": ".gz"}
+
+
+def fingerprinted_name(path: str, data: bytes) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:8]}{ext}"
+
+
+def is_text_file(path: str) -> bool:
+    media_type, _ = mimetypes.guess_type(path)
+    return bool(media_type) and media_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+# Сборка статики: копии с отпечатками, сжатые варианты и манифест
+def build_static(source_dir: str = None, build_dir: str = None) -> dict:
+    source_dir = source_dir or settings.static_dir
+    build_dir = build_dir or settings.static_build_dir
+    if os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    manifest = {}
+    for root, _, files in os.walk(source_dir):
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, source_dir).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                data = f.read()
+            hashed = fingerprinted_name(name, data)
+            manifest[name] = hashed
+            for target in (name, hashed):
+                path = os.path.join(build_dir, target)
+                _write(path, data)
+                if is_text_file(name):
+                    # mtime=0 - одинаковый результат при повторной сборке
+                    _write(path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+                    if brotli is not None:
+                        _write(path + ".br", brotli.compress(data, quality=11))
+    _write(os.path.join(build_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    logger.info(f"Собрано статических файлов: {len(manifest)} в {build_dir}")
+    return manifest
+
+
+def load_manifest(build_dir: str = None) -> dict:
+    try:
+        with open(os.path.join(build_dir or settings.static_build_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles, отдающий заранее сжатый вариант файла (.br или .gz), если клиент
+    его принимает, и неизменяемый Cache-Control для файлов с отпечатком в имени.
+    """
+
+    def __init__(self, *args, manifest: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable = set((manifest or {}).values())
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        response = None
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        if encoding is not None:
+            variant = str(full_path) + VARIANTS[encoding]
+            if os.path.isfile(variant):
+                media_type, _ = mimetypes.guess_type(str(full_path))
+                response = FileResponse(variant, status_code=status_code, media_type=media_type,
+                                        stat_result=os.stat(variant))
+                response.headers["Content-Encoding"] = encoding
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        response.headers.add_vary_header("Accept-Encoding")
+        path = os.path.relpath(str(full_path), str(self.directory)).replace(os.sep, "/")
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if path in self.immutable else REVALIDATE_CACHE_CONTROL
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+manifest = load_manifest()
+
+
+# Приложение для монтирования в /static: собранная статика, если она есть, иначе исходники
+def static_app() -> PrecompressedStaticFiles:
+    if manifest:
+        return PrecompressedStaticFiles(directory=settings.static_build_dir, manifest=manifest)
+    return PrecompressedStaticFiles(directory=settings.static_dir)
+
+
+# Адрес статического файла для шаблонов (с отпечатком, если статика собрана)
+def static_url(path: str) -> str:
+    return STATIC_URL + manifest.get(path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сборка статических файлов с отпечатками и сжатыми вариантами")
+    parser.add_argument("--source-dir", default=None)
+    parser.add_argument("--build-dir", default=None)
+    args = parser.parse_args(argv)
+    build_static(args.source_dir, args.build_dir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
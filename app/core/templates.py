@@ -0,0 +1,100 @@
+"""
+Общее окружение шаблонов Jinja2 для всего приложения.
+
+Шаблоны разбираются и компилируются один раз на процесс, скомпилированный
+байткод сохраняется на диск (FileSystemBytecodeCache) и переиспользуется
+другими процессами и следующими запусками. Проверка изменений файлов
+(auto_reload) включена только в режиме разработки.
+
+Строки списков рендерятся через render_fragment и берутся из LRU-кэша готового
+HTML, пока не изменится ни одна из сущностей, переданных во фрагмент.
+
+Предварительная компиляция (например, при сборке или перед запуском воркеров):
+    python -m app.core.templates
+"""
+import argparse
+import logging
+import os
+import jinja2
+from fastapi.templating import Jinja2Templates
+from markupsafe import Markup
+from app.core.config import settings
+from app.services.cache import TTLCache
+from app.core.static import static_url
+from app.core.timing import TimedTemplate
+from app.services.media_service import media_url
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+
+fragment_cache = TTLCache(maxsize=settings.fragment_cache_size, ttl=settings.fragment_cache_ttl)
+
+
+# Версия сущности для ключа фрагмента: таблица, id и время последнего изменения
+def version_key(value):
+    if hasattr(value, "__tablename__"):
+        return value.__tablename__, value.id, value.updated_at
+    return value
+
+
+# Рендер фрагмента с кэшированием.
+# Ключ строится из всех переданных значений, поэтому во фрагмент нужно передавать
+# каждую сущность, данные которой он выводит (например, матч и обе команды).
+@jinja2.pass_environment
+def render_fragment(env: jinja2.Environment, name: str, **context) -> Markup:
+    key = (name,) + tuple((field, version_key(value)) for field, value in sorted(context.items()))
+    html = fragment_cache.get(key)
+    if html is None:
+        html = Markup(env.get_template(name).render(**context))
+        fragment_cache.set(key, html)
+    return html
+
+
+def get_fragment_cache_stats() -> dict:
+    return fragment_cache.stats()
+
+
+def build_environment(directory: str = TEMPLATES_DIR, cache_dir: str = None, auto_reload: bool = None) -> jinja2.Environment:
+    cache_dir = settings.templates_cache_dir if cache_dir is None else cache_dir
+    bytecode_cache = None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(directory),
+        autoescape=jinja2.select_autoescape(),
+        auto_reload=settings.templates_auto_reload if auto_reload is None else auto_reload,
+        bytecode_cache=bytecode_cache,
+    )
+    # Время рендера попадает в замеры запроса (Server-Timing)
+    env.template_class = TimedTemplate
+    env.globals["media_url"] = media_url
+    env.globals["render_fragment"] = render_fragment
+    env.globals["static_url"] = static_url
+    return env
+
+
+# Компиляция всех HTML-шаблонов: заполняет кэш окружения и кэш байткода на диске
+def precompile(env: jinja2.Environment = None) -> int:
+    env = env or templates.env
+    names = env.list_templates(filter_func=lambda name: name.endswith(".html"))
+    for name in names:
+        env.get_template(name)
+    logger.info(f"Скомпилировано шаблонов: {len(names)}")
+    return len(names)
+
+
+templates = Jinja2Templates(env=build_environment())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Предварительная компиляция шаблонов Jinja2")
+    parser.add_argument("--cache-dir", default=None, help="Каталог кэша байткода (по умолчанию из настроек)")
+    args = parser.parse_args(argv)
+    precompile(build_environment(cache_dir=args.cache_dir))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
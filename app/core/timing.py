@@ -0,0 +1,178 @@
+"""
+Замеры времени обработки запросов.
+
+TimingMiddleware заводит для каждого запроса объект RequestTimings (contextvar),
+в который попадают:
+- время и число SQL-запросов (события before/after_cursor_execute движков из
+  app/db/database.py, см. instrument_engine);
+- время рендера шаблонов (класс шаблона окружения Jinja2, см. TimedTemplate).
+
+Итог отдается клиенту в заголовке Server-Timing (виден в DevTools браузера)
+и пишется в журнал одной записью с полями в extra (route, status, duration_ms,
+db_ms, db_queries, template_ms). SQL-запросы дольше settings.slow_query_ms
+журналируются отдельно с текстом запроса.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+import jinja2
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("app.slow_query")
+
+MAX_STATEMENT_LENGTH = 1000
+
+
+class RequestTimings:
+    """
+    Накопленные замеры одного запроса (миллисекунды).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_ms = 0.0
+        self.db_queries = 0
+        self.template_ms = 0.0
+        self.template_depth = 0
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self, total_ms: float) -> str:
+        return ", ".join([
+            f"app;dur={total_ms:.1f}",
+            f'db;dur={self.db_ms:.1f};desc="{self.db_queries} queries"',
+            f"tpl;dur={self.template_ms:.1f}",
+        ])
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+# SQL-запросы: время от before_cursor_execute до after_cursor_execute.
+# Время начала хранится в info соединения (стеком - на случай вложенных выполнений).
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    record_query((time.perf_counter() - started) * 1000, statement, parameters)
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+def record_query(duration_ms: float, statement: str, parameters=None):
+    timings = _current.get()
+    if timings is not None:
+        timings.db_ms += duration_ms
+        timings.db_queries += 1
+    if settings.slow_query_ms and duration_ms >= settings.slow_query_ms:
+        text = " ".join(statement.split())[:MAX_STATEMENT_LENGTH]
+        slow_query_logger.warning(
+            f"Медленный SQL-запрос ({duration_ms:.1f} мс): {text}",
+            extra={"duration_ms": round(duration_ms, 1), "statement": text, "parameters": repr(parameters)[:MAX_STATEMENT_LENGTH]},
+        )
+
+
+# Подключение замеров к движку (для асинхронного - к его sync_engine)
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    return engine
+
+
+class TimedTemplate(jinja2.Template):
+    """
+    Шаблон Jinja2 с замером времени рендера. Вложенные рендеры (render_fragment)
+    входят во время внешнего шаблона и повторно не учитываются.
+    """
+
+    def render(self, *args, **kwargs):
+        timings = _current.get()
+        if timings is None:
+            return super().render(*args, **kwargs)
+        timings.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            timings.template_depth -= 1
+            if timings.template_depth == 0:
+                timings.template_ms += (time.perf_counter() - started) * 1000
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware: замеры запроса, заголовок Server-Timing и запись в журнал.
+    """
+
+    def __init__(self, app, server_timing: bool = None):
+        self.app = app
+        self.server_timing = settings.server_timing if server_timing is None else server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", timings.server_timing(timings.elapsed_ms()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            log_request(scope, status, timings)
+
+
+# Шаблон маршрута (/teams/{team_id}) группирует запросы лучше, чем фактический путь.
+# Строится из пути и параметров: у маршрутов подключенных роутеров path не содержит префикса.
+def route_name(scope) -> str:
+    path = scope.get("path", "")
+    for name, value in scope.get("path_params", {}).items():
+        head, sep, tail = path.rpartition(f"/{value}")
+        if sep and (not tail or tail.startswith("/")):
+            path = f"{head}/{{{name}}}{tail}"
+    return path
+
+
+def log_request(scope, status: int, timings: RequestTimings):
+    total_ms = timings.elapsed_ms()
+    route = route_name(scope)
+    logger.info(
+        f"{scope['method']} {route} {status} {total_ms:.1f} мс "
+        f"(SQL: {timings.db_queries} за {timings.db_ms:.1f} мс, шаблоны: {timings.template_ms:.1f} мс)",
+        extra={
+            "method": scope["method"],
+            "route": route,
+            "path": scope.get("path", ""),
+            "status": status,
+            "duration_ms": round(total_ms, 1),
+            "db_ms": round(timings.db_ms, 1),
+            "db_queries": timings.db_queries,
+            "template_ms": round(timings.template_ms, 1),
+        },
+    )
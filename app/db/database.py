@@ -5,22 +5,168 @@ from app.core.config import settings
 
 # app/db/database.py
 
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from app.core.config import DATABASE_URL, settings
+from app.core.timing import instrument_engine
 
 Base = declarative_base()
 
+# Асинхронные драйверы для синхронных схем подключения
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+# Получение URL для асинхронного движка из синхронного URL
+def to_async_url(url: str) -> str:
+    drivername = make_url(url).drivername
+    driver = ASYNC_DRIVERS.get(drivername)
+    if driver is None:
+        return url
+    return driver + url[len(drivername):]
+
+
+class PoolStatsMixin:
+    """
+    Сбор статистики выдачи соединений из пула: число выдач, время ожидания и таймауты.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            checkouts, timeouts, total_wait, max_wait = self.checkouts, self.timeouts, self.total_wait, self.max_wait
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": self.overflow(),
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "total_wait_seconds": total_wait,
+            "max_wait_seconds": max_wait,
+            "avg_wait_seconds": total_wait / checkouts if checkouts else 0.0,
+        }
+
+
+class InstrumentedQueuePool(PoolStatsMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(PoolStatsMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# Проверка, что URL указывает на SQLite в памяти
+def is_sqlite_memory(url) -> bool:
+    return url.database in (None, "", ":memory:") or "mode=memory" in str(url)
+
+# Параметры движка в зависимости от типа базы данных
+def engine_options(url: str, is_async: bool = False) -> dict:
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        # Соединения SQLite передаются между потоками пула и потоками FastAPI
+        options = {"connect_args": {"check_same_thread": False}}
+        if is_sqlite_memory(url):
+            return options
+    else:
+        options = {
+            "pool_pre_ping": settings.db_pool_pre_ping,
+            "pool_recycle": settings.db_pool_recycle,
+        }
+    options.update(
+        poolclass=InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+    )
+    return options
+
+# PRAGMA, выполняемые для каждого нового соединения SQLite
+def sqlite_pragmas() -> dict:
+    return {
+        "journal_mode": settings.sqlite_journal_mode,
+        "synchronous": settings.sqlite_synchronous,
+        "mmap_size": settings.sqlite_mmap_size,
+        "cache_size": settings.sqlite_cache_size,
+        "busy_timeout": settings.sqlite_busy_timeout,
+    }
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+# Создание движка с настройками пула и профилем SQLite
+def build_engine(url: str = DATABASE_URL, **kwargs):
+    engine = create_engine(url, **{**engine_options(url), **kwargs})
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+    return instrument_engine(engine)
+
+# Создание асинхронного движка с теми же настройками
+def build_async_engine(url: str = DATABASE_URL, **kwargs):
+    url = to_async_url(url)
+    engine = create_async_engine(url, **{**engine_options(url, is_async=True), **kwargs})
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    instrument_engine(engine.sync_engine)
+    return engine
+
 # Создаем движок для подключения к базе данных
-engine = create_engine(DATABASE_URL)
+engine = build_engine()
 
 # Создание локальной сессии
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок и сессии для обработчиков FastAPI
+async_engine = build_async_engine()
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Базовый класс для всех моделей
 Base = declarative_base()
 
+# Статистика пулов соединений синхронного и асинхронного движков
+def get_pool_stats() -> dict:
+    stats = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        if isinstance(pool, PoolStatsMixin):
+            stats[name] = pool.stats()
+    return stats
+
 # Функция для создания сессии для каждого запроса
 def get_db():
     db = SessionLocal()
@@ -28,3 +174,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Функция для создания асинхронной сессии для каждого запроса
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Фабрика асинхронных сессий для потоковых ответов, которые открывают сессию сами
+def get_async_sessionmaker():
+    return AsyncSessionLocal
@@ -0,0 +1,138 @@
+"""
+Аудит индексов: выполняет запросы сервисов, перехватывает их SQL и прогоняет через EXPLAIN.
+Полные просмотры таблиц и сортировки без индекса выводятся как предупреждения.
+
+Запуск: python -m app.db.index_audit [--url sqlite:///./instance/soccer_hub.db]
+Код возврата 1 означает, что найден неожиданный полный просмотр таблицы.
+"""
+import argparse
+import logging
+import re
+import sys
+from datetime import datetime
+from sqlalchemy import event, select
+from sqlalchemy.orm import sessionmaker
+from app import analytics
+from app.db import models
+from app.services import analytics_service, match_service, player_service, standings_service, team_service
+
+logger = logging.getLogger(__name__)
+
+# Проверяемые запросы: имя, функция с сессией и допустим ли полный просмотр.
+# Полный просмотр ожидаем только для выборок всех строк таблицы.
+PROBES = (
+    ("teams.list", lambda db: team_service.get_all_teams(db), True),
+    ("teams.detail", lambda db: team_service.get_team_by_id(db, 1), False),
+    ("players.list", lambda db: player_service.get_all_players(db), True),
+    ("players.detail", lambda db: player_service.get_player_by_id(db, 1), False),
+    ("matches.list", lambda db: match_service.get_all_matches(db), True),
+    ("matches.detail", lambda db: match_service.get_match_by_id(db, 1), False),
+    ("matches.team_fixtures", lambda db: db.scalars(
+        select(models.Match).where(models.Match.home_team_id == 1).order_by(models.Match.date)
+    ).all(), False),
+    ("standings.table", lambda db: standings_service.get_standings(db), True),
+    ("standings.form", lambda db: standings_service.refresh_form(db, 1), False),
+    ("analytics.top_teams", lambda db: db.scalars(standings_service.top_teams_query(10)).all(), False),
+    ("analytics.top_scorers", lambda db: db.scalars(analytics_service.top_scorers_query(10)).all(), False),
+    ("analytics.match_totals", lambda db: db.execute(analytics_service.match_totals_query()).all(), True),
+    ("action_logs.by_user", lambda db: analytics.get_user_actions(db, 1), False),
+    ("action_logs.by_period", lambda db: analytics.get_actions_by_period(
+        db, datetime(2024, 1, 1), datetime(2024, 1, 2)
+    ), False),
+)
+
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+POSTGRES_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+# Сбор SQL-запросов, выполненных функцией
+def capture_statements(db, probe):
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    bind = db.get_bind()
+    event.listen(bind, "before_cursor_execute", on_execute)
+    try:
+        probe(db)
+    finally:
+        event.remove(bind, "before_cursor_execute", on_execute)
+        db.rollback()
+    return statements
+
+
+# План запроса в виде списка строк
+def explain(connection, statement, parameters):
+    cursor = connection.connection.cursor()
+    try:
+        if connection.dialect.name == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute("EXPLAIN " + statement, parameters)
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+# Таблицы, которые план читает целиком
+def full_scans(plan, dialect: str):
+    pattern = SQLITE_FULL_SCAN if dialect == "sqlite" else POSTGRES_FULL_SCAN
+    return [match.group(1) for line in plan for match in [pattern.search(line.strip())] if match]
+
+
+# Аудит всех запросов сервисов, возвращает список результатов
+def audit(engine):
+    Session = sessionmaker(bind=engine, autoflush=False)
+    results = []
+    with Session() as db:
+        for name, probe, scan_allowed in PROBES:
+            for statement, parameters in capture_statements(db, probe):
+                with engine.connect() as connection:
+                    plan = explain(connection, statement, parameters)
+                scans = full_scans(plan, engine.dialect.name)
+                results.append({
+                    "query": name,
+                    "statement": " ".join(statement.split()),
+                    "plan": plan,
+                    "full_scans": scans,
+                    "temp_sort": any("TEMP B-TREE" in line for line in plan),
+                    "flagged": bool(scans) and not scan_allowed,
+                })
+    return results
+
+
+def main(argv=None):
+    from app.db.database import build_engine
+    from app.core.config import DATABASE_URL
+
+    parser = argparse.ArgumentParser(description="EXPLAIN для запросов сервисов и поиск полных просмотров таблиц")
+    parser.add_argument("--url", default=DATABASE_URL, help="URL базы данных (по умолчанию DATABASE_URL)")
+    parser.add_argument("--verbose", action="store_true", help="Печатать SQL и полный план каждого запроса")
+    args = parser.parse_args(argv)
+
+    engine = build_engine(args.url)
+    flagged = 0
+    for result in audit(engine):
+        if result["flagged"]:
+            status = "FULL SCAN"
+            flagged += 1
+        elif result["full_scans"]:
+            status = "scan (ожидаемо)"
+        else:
+            status = "ok"
+        if result["temp_sort"]:
+            status += ", сортировка без индекса"
+        log = logger.warning if result["flagged"] else logger.info
+        log(f"[{status}] {result['query']}: {', '.join(result['plan'])}")
+        if args.verbose:
+            logger.info(f"    {result['statement']}")
+    engine.dispose()
+    logger.info(f"Проверено запросов: {len(PROBES)}, проблемных: {flagged}")
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
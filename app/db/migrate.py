@@ -0,0 +1,102 @@
+"""
+Схема базы данных управляется миграциями Alembic (каталог migrations).
+
+При запуске приложения выполняется только проверка версии схемы: один запрос
+к таблице alembic_version и сравнение с последней ревизией из каталога миграций.
+Создание и обновление схемы - отдельная разовая команда:
+    python -m app.db.migrate                 # обновить до последней ревизии
+    python -m app.db.migrate --check         # только проверить версию
+    python -m app.db.migrate --stamp 0004    # отметить базу, созданную без миграций
+"""
+import argparse
+import logging
+import os
+from functools import lru_cache
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from app.core.config import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "alembic.ini")
+
+
+class SchemaOutOfDate(RuntimeError):
+    """Версия схемы базы данных не совпадает с последней миграцией."""
+
+
+def alembic_config(url: str = DATABASE_URL) -> Config:
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    config.attributes["sqlalchemy.url"] = url
+    # Логирование настраивает приложение, а не alembic.ini
+    config.attributes["configure_logger"] = False
+    return config
+
+
+# Последняя ревизия читается из файлов миграций один раз на процесс
+@lru_cache(maxsize=None)
+def head_revision() -> str:
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+def current_revision(connection):
+    return MigrationContext.configure(connection).get_current_revision()
+
+
+# Проверка версии схемы для открытого соединения
+def verify_schema(connection):
+    current, head = current_revision(connection), head_revision()
+    if current != head:
+        raise SchemaOutOfDate(
+            f"Схема базы данных устарела (версия {current or 'отсутствует'}, нужна {head}). "
+            f"Выполните: python -m app.db.migrate"
+        )
+    return current
+
+
+def check_schema(engine):
+    with engine.connect() as connection:
+        return verify_schema(connection)
+
+
+def upgrade(url: str = DATABASE_URL, revision: str = "head"):
+    command.upgrade(alembic_config(url), revision)
+    logger.info(f"Схема базы данных обновлена до ревизии {revision}.")
+
+
+def stamp(url: str = DATABASE_URL, revision: str = "head"):
+    command.stamp(alembic_config(url), revision)
+    logger.info(f"База данных отмечена ревизией {revision}.")
+
+
+def main(argv=None):
+    from sqlalchemy import create_engine
+
+    parser = argparse.ArgumentParser(description="Миграции схемы базы данных")
+    parser.add_argument("--url", default=DATABASE_URL)
+    parser.add_argument("--revision", default="head", help="Целевая ревизия (по умолчанию последняя)")
+    parser.add_argument("--check", action="store_true", help="Только проверить версию схемы")
+    parser.add_argument("--stamp", metavar="REVISION", help="Отметить ревизию без выполнения миграций")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        engine = create_engine(args.url)
+        try:
+            logger.info(f"Схема базы данных актуальна (ревизия {check_schema(engine)}).")
+        except SchemaOutOfDate as e:
+            logger.error(str(e))
+            raise SystemExit(1)
+        finally:
+            engine.dispose()
+    elif args.stamp:
+        stamp(args.url, args.stamp)
+    else:
+        upgrade(args.url, args.revision)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
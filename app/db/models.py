@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, UniqueConstraint, Enum as SQLAEnum
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, LargeBinary, UniqueConstraint, Index, Enum as SQLAEnum
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -25,16 +25,46 @@ class Team(Base):
     city = Column(String, index=True)
     founded = Column(Integer)  # Год основания
     stadium = Column(String)   # Стадион
-    points = Column(Integer, default=0)
+    points = Column(Integer, default=0, index=True)
     url_photo = Column(String, nullable=True)  # URL фотографии
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # Версия строки для кэша фрагментов
 
     # Связь с игроками
     players = relationship("Player", back_populates="team", cascade="all, delete-orphan")
+    # Строка турнирной таблицы
+    standing = relationship("Standing", back_populates="team", uselist=False, cascade="all, delete-orphan")
 
     def __repr__(self) -> str:
         return f"<Team(id={self.id}, name={self.name}, city={self.city}, url_photo={self.url_photo})>"
 
 
+class Standing(Base):
+    """
+    Строка турнирной таблицы команды.
+    Обновляется инкрементально при каждом изменении результата матча.
+    """
+    __tablename__ = 'standings'
+
+    team_id = Column(Integer, ForeignKey('teams.id'), primary_key=True)
+    played = Column(Integer, nullable=False, default=0)
+    won = Column(Integer, nullable=False, default=0)
+    drawn = Column(Integer, nullable=False, default=0)
+    lost = Column(Integer, nullable=False, default=0)
+    goals_for = Column(Integer, nullable=False, default=0)
+    goals_against = Column(Integer, nullable=False, default=0)
+    goal_difference = Column(Integer, nullable=False, default=0)
+    points = Column(Integer, nullable=False, default=0)
+    form = Column(String(5), nullable=False, default="")  # Последние результаты, новые слева: "WDLWW"
+
+    team = relationship("Team", back_populates="standing")
+
+    # Порядок турнирной таблицы читается прямо из индекса
+    __table_args__ = (Index('ix_standings_table_order', 'points', 'goal_difference', 'goals_for'),)
+
+    def __repr__(self) -> str:
+        return f"<Standing(team_id={self.team_id}, played={self.played}, points={self.points}, form={self.form})>"
+
+
 class Match(Base):
     """
     Модель матча, связывающая команды, дату и результаты.
@@ -47,12 +77,19 @@ class Match(Base):
     date = Column(DateTime, nullable=False)
     home_score = Column(Integer, default=0)
     away_score = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     home_team = relationship('Team', foreign_keys=[home_team_id], backref=backref('home_matches', cascade='all, delete-orphan'))
     away_team = relationship('Team', foreign_keys=[away_team_id], backref=backref('away_matches', cascade='all, delete-orphan'))
     goals = relationship("Goal", back_populates="match", cascade="all, delete-orphan")
 
-    __table_args__ = (UniqueConstraint('home_team_id', 'away_team_id', 'date', name='unique_match_constraint'),)
+    __table_args__ = (
+        UniqueConstraint('home_team_id', 'away_team_id', 'date', name='unique_match_constraint'),
+        # Матчи команды по дате: календарь, форма, соединения с командами
+        Index('ix_matches_home_team_id_date', 'home_team_id', 'date'),
+        Index('ix_matches_away_team_id_date', 'away_team_id', 'date'),
+        Index('ix_matches_date', 'date'),
+    )
 
     def __repr__(self) -> str:
         return f"<Match(id={self.id}, home_team_id={self.home_team_id}, away_team_id={self.away_team_id}, date={self.date})>"
@@ -67,10 +104,11 @@ class Player(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     position = Column(SQLAEnum(PositionEnum), nullable=False)
-    goals = Column(Integer, default=0)
-    team_id = Column(Integer, ForeignKey('teams.id'), nullable=False)
+    goals = Column(Integer, default=0, index=True)
+    team_id = Column(Integer, ForeignKey('teams.id'), nullable=False, index=True)
     url_photo = Column(String, nullable=True)
     is_starter = Column(Boolean, default=True)  # Новое поле для указания, является ли игрок основным
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     team = relationship("Team", back_populates="players")
     goals_scored = relationship("Goal", back_populates="player", cascade="all, delete-orphan")
@@ -88,8 +126,8 @@ class Goal(Base):
     __tablename__ = 'goals'
 
     id = Column(Integer, primary_key=True, index=True)
-    match_id = Column(Integer, ForeignKey('matches.id'), nullable=False)
-    player_id = Column(Integer, ForeignKey('players.id'), nullable=False)
+    match_id = Column(Integer, ForeignKey('matches.id'), nullable=False, index=True)
+    player_id = Column(Integer, ForeignKey('players.id'), nullable=False, index=True)
     minute = Column(Integer, nullable=False)
 
     match = relationship("Match", back_populates="goals")
@@ -106,9 +144,9 @@ class ActionLog(Base):
     __tablename__ = 'action_logs'
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     action = Column(String)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
 
     user = relationship("User", back_populates="action_logs")
 
@@ -116,6 +154,66 @@ class ActionLog(Base):
         return f"<ActionLog(id={self.id}, user_id={self.user_id}, action={self.action}, timestamp={self.timestamp})>"
 
 
+class ActionRollup(Base):
+    """
+    Число действий пользователей за интервал времени (минута, час или день)
+    по действию и пользователю. Строится из action_logs, см. app/services/rollups.py.
+    """
+    __tablename__ = 'action_rollups'
+
+    granularity = Column(String, primary_key=True)  # minute, hour, day
+    bucket_start = Column(DateTime, primary_key=True)  # Начало интервала
+    action = Column(String, primary_key=True)  # Пустая строка - действие не указано
+    user_id = Column(Integer, primary_key=True)  # 0 - без пользователя
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return f"<ActionRollup({self.granularity} {self.bucket_start}, action={self.action}, user_id={self.user_id}, count={self.count})>"
+
+
+class ActionSketch(Base):
+    """
+    Сжатая вероятностная сводка журнала действий за день: HyperLogLog пользователей
+    или частые действия (Count-Min). См. app/services/sketches.py.
+    """
+    __tablename__ = 'action_sketches'
+
+    bucket_start = Column(DateTime, primary_key=True)  # Начало дня
+    kind = Column(String, primary_key=True)  # users_hll, actions_topk
+    data = Column(LargeBinary, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<ActionSketch({self.bucket_start}, kind={self.kind}, {len(self.data)} bytes)>"
+
+
+class RollupState(Base):
+    """
+    Водяной знак агрегации: id последней строки журнала, учтенной в агрегатах.
+    """
+    __tablename__ = 'rollup_state'
+
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+
+
+class ActionLogPartition(Base):
+    """
+    Партиция журнала действий за день или месяц: отделенная таблица (SQLite),
+    партиция action_logs (PostgreSQL) или колоночный архив. См. app/services/retention.py.
+    """
+    __tablename__ = 'action_log_partitions'
+
+    name = Column(String, primary_key=True)  # Имя таблицы партиции
+    period_start = Column(DateTime, nullable=False, index=True)
+    period_end = Column(DateTime, nullable=False)
+    state = Column(String, nullable=False)  # attached, sealed, archived, dropped
+    rows = Column(Integer, nullable=False, default=0)
+    archive_path = Column(String, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<ActionLogPartition({self.name}, {self.state}, rows={self.rows})>"
+
+
 class User(Base):
     """
     Модель пользователя, содержащая информацию о логине и пароле.
@@ -126,6 +224,7 @@ class User(Base):
     username = Column(String, unique=True, nullable=False)
     password = Column(String, nullable=False)
 
+    # Только строки основной таблицы action_logs; вся история - analytics.get_user_actions
     action_logs = relationship("ActionLog", back_populates="user")
 
     def __repr__(self) -> str:
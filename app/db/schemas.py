@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Generic, List, Optional, TypeVar
 from pydantic import BaseModel
 
 # --- Схемы для команд ---
@@ -17,6 +17,8 @@ class TeamUpdate(TeamBase):
 
 class Team(TeamBase):
     id: int
+    points: Optional[int] = None
+    url_photo: Optional[str] = None
     players: List["Player"] = []  # Список игроков, если нужно включить их в ответе
 
     class Config:
@@ -37,6 +39,10 @@ class PlayerUpdate(PlayerBase):
 
 class Player(PlayerBase):
     id: int
+    team_id: Optional[int] = None
+    goals: Optional[int] = None
+    url_photo: Optional[str] = None
+    is_starter: Optional[bool] = None
     team: Optional[Team] = None  # Включение информации о команде в ответе, если нужно
 
     class Config:
@@ -66,3 +72,12 @@ class Match(MatchBase):
 
     class Config:
         from_attributes = True
+
+
+# --- Постраничный ответ API ---
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None  # Курсор следующей страницы, None - страница последняя
+    limit: int
@@ -1,17 +1,29 @@
+import asyncio
 import logging
 import traceback
+from typing import Optional
 from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from app.db.database import engine, Base, get_db
-from app.db.models import Match, Player, Team
-from app.routes import teams_router, matches_router, analytics_router, players_router
+from app.db.database import engine, get_async_db
+from app.db.migrate import check_schema
+from app.routes import teams_router, matches_router, analytics_router, players_router, api_router, media_router
+from app.services.match_service import get_matches_page_async
+from app.services.player_service import get_players_page_async
+from app.services.team_service import get_teams_page_async
+from app.services.analytics_service import get_dashboard_async
+from app.services.pagination import InvalidCursor
+from app.services.action_log import action_log_writer
 from app.core.config import Settings
+from app.core.templates import precompile, templates
+from app.core.compression import CompressionMiddleware
+from app.core.timing import TimingMiddleware
+from app.core.metrics import CONTENT_TYPE, MetricsMiddleware, flush_periodically, metrics_dir, render_metrics, write_snapshot
+from app.core.static import static_app
+from app.core.http_cache import NotModified, conditional_get, conditional_get_middleware, not_modified_response
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -19,7 +31,6 @@ logging.basicConfig(level=logging.INFO)
 
 # Создание экземпляра FastAPI
 app = FastAPI(title="Soccer Hub API")
-templates = Jinja2Templates(directory="app/templates")
 
 # Получение настроек из класса Settings
 settings = Settings()
@@ -32,12 +43,25 @@ app.add_middleware(
     allow_headers=["*"],
     allow_origins=["*"],  # Можно ограничить, если нужно
 )
+# ETag, Last-Modified и Cache-Control для страниц с условными запросами
+app.middleware("http")(conditional_get_middleware)
+# Число, длительность и количество одновременных запросов для /metrics
+app.add_middleware(MetricsMiddleware)
+# Время обработки, SQL-запросов и рендера шаблонов: Server-Timing и журнал
+app.add_middleware(TimingMiddleware)
+# Сжатие ответов (добавляется последним, поэтому оборачивает все остальные middleware)
+app.add_middleware(CompressionMiddleware)
+
+# Статические файлы (собранные с отпечатками и сжатыми вариантами, если есть сборка)
+app.mount("/static", static_app(), name="static")
 
 # Подключение маршрутов
 app.include_router(teams_router, prefix="/teams", tags=["Команды"])
 app.include_router(matches_router, prefix="/matches", tags=["Матчи"])
 app.include_router(analytics_router, prefix="/analytics", tags=["Аналитика"])
 app.include_router(players_router, prefix="/players", tags=["Игроки"])
+app.include_router(api_router, prefix="/api/v1", tags=["API"])
+app.include_router(media_router, prefix="/media", tags=["Медиа"])
 
 # Обработка ошибки валидации
 @app.exception_handler(RequestValidationError)
@@ -57,45 +81,94 @@ async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError):
         content={"detail": "Ошибка базы данных. Пожалуйста, попробуйте позже."},
     )
 
-# Создание таблиц базы данных
+# Обработка некорректного курсора страницы
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_exception_handler(request: Request, exc: InvalidCursor):
+    logger.warning(f"Некорректный курсор: {exc} на запросе: {request.url}")
+    return JSONResponse(
+        status_code=400,
+        content={"detail": "Некорректный курсор страницы."},
+    )
+
+# Копия клиента актуальна: 304 без выполнения обработчика
+@app.exception_handler(NotModified)
+async def not_modified_exception_handler(request: Request, exc: NotModified):
+    return not_modified_response(exc.validator)
+
+# Проверка версии схемы базы данных: один запрос вместо create_all в каждом воркере.
+# Схему создает и обновляет отдельная команда python -m app.db.migrate.
 @app.on_event("startup")
 async def startup():
-    Base.metadata.create_all(bind=engine)
-    logger.info("База данных инициализирована.")
+    if settings.schema_check:
+        revision = check_schema(engine)
+        logger.info(f"Схема базы данных актуальна (ревизия {revision}).")
+    # Без auto_reload шаблоны не меняются во время работы: компилируем их заранее
+    if not settings.templates_auto_reload:
+        precompile()
+    # Несколько воркеров: снимки метрик процесса периодически сохраняются для /metrics
+    if metrics_dir():
+        app.state.metrics_flush = asyncio.create_task(flush_periodically())
+    # Фоновая пакетная запись журнала действий пользователей
+    action_log_writer.start()
 
 @app.on_event("shutdown")
 async def shutdown():
+    # Дописываем накопленные события журнала действий до завершения процесса
+    await asyncio.to_thread(action_log_writer.stop)
+    if metrics_dir():
+        app.state.metrics_flush.cancel()
+        write_snapshot()
     logger.info("Приложение завершает работу.")
 
+# Метрики в текстовом формате Prometheus (суммарно по всем воркерам)
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    return Response(await asyncio.to_thread(render_metrics), media_type=CONTENT_TYPE)
+
 # Основной маршрут
 @app.get("/", response_class=HTMLResponse, summary="Главная страница")
 async def root(request: Request) -> HTMLResponse:
     logger.info("Запрос к главной странице.")
-    return templates.TemplateResponse("index.html", {"request": request})
+    return templates.TemplateResponse(request, "index.html")
 
 # Страница команд
-@app.get("/teams", response_class=HTMLResponse, summary="Команды")
-async def teams_page(request: Request, db: Session = Depends(get_db)):
-    teams = db.query(Team).all()  # Получаем все команды из базы данных
-    logger.info(f"Найдено {len(teams)} команд.")
-    return templates.TemplateResponse("teams.html", {"request": request, "teams": teams})
+@app.get("/teams", response_class=HTMLResponse, dependencies=[Depends(conditional_get("teams"))], summary="Команды")
+async def teams_page(request: Request, cursor: Optional[str] = None, limit: Optional[int] = None,
+                     db: AsyncSession = Depends(get_async_db)):
+    page = await get_teams_page_async(db, cursor, limit)  # Получаем страницу команд из базы данных
+    logger.info(f"Найдено {len(page.items)} команд на странице.")
+    return templates.TemplateResponse(request, "teams.html", {
+        "teams": page.items,
+        "next_cursor": page.next_cursor,
+        "limit": page.limit,
+    })
 
 # Страница матчей
-@app.get("/matches", response_class=HTMLResponse, summary="Матчи")
-async def matches_page(request: Request, db: Session = Depends(get_db)):
-    matches = db.query(Match).all()
-    logger.info(f"Найдено {len(matches)} матчей.")
-    return templates.TemplateResponse("matches.html", {"request": request, "matches": matches})
+@app.get("/matches", response_class=HTMLResponse, dependencies=[Depends(conditional_get("matches"))], summary="Матчи")
+async def matches_page(request: Request, cursor: Optional[str] = None, limit: Optional[int] = None,
+                       db: AsyncSession = Depends(get_async_db)):
+    page = await get_matches_page_async(db, cursor, limit)
+    logger.info(f"Найдено {len(page.items)} матчей на странице.")
+    return templates.TemplateResponse(request, "matches.html", {
+        "matches": page.items,
+        "next_cursor": page.next_cursor,
+        "limit": page.limit,
+    })
 
 # Страница игроков
-@app.get("/players", response_class=HTMLResponse, summary="Игроки")
-async def get_players(request: Request, db: Session = Depends(get_db)):
-    players = db.query(Player).all()  # Получаем всех игроков
-    logger.info(f"Найдено {len(players)} игроков.")
-    return templates.TemplateResponse("players.html", {"request": request, "players": players})
+@app.get("/players", response_class=HTMLResponse, dependencies=[Depends(conditional_get("players"))], summary="Игроки")
+async def get_players(request: Request, cursor: Optional[str] = None, limit: Optional[int] = None,
+                      db: AsyncSession = Depends(get_async_db)):
+    page = await get_players_page_async(db, cursor, limit)  # Получаем страницу игроков вместе с командами
+    logger.info(f"Найдено {len(page.items)} игроков на странице.")
+    return templates.TemplateResponse(request, "players.html", {
+        "players": page.items,
+        "next_cursor": page.next_cursor,
+        "limit": page.limit,
+    })
 
 @app.get("/analytics", response_class=HTMLResponse, summary="Аналитика")
-async def analytics_page(request: Request, db: Session = Depends(get_db)) -> HTMLResponse:
+async def analytics_page(request: Request, db: AsyncSession = Depends(get_async_db)) -> HTMLResponse:
     logger.info("Запрос к странице аналитики.")
     
     top_teams = []
@@ -103,22 +176,11 @@ async def analytics_page(request: Request, db: Session = Depends(get_db)) -> HTM
     match_stats = {}
 
     try:
-        # Получаем топ команд
-        top_teams = db.query(Team).order_by(Team.points.desc()).limit(10).all()
-
-        # Получаем топ бомбардиров
-        top_scorers = db.query(Player).order_by(Player.goals.desc()).limit(10).all()
-
-        # Получаем статистику матчей
-        total_goals = db.query(func.sum(Match.home_score + Match.away_score)).scalar() or 0
-        total_matches = db.query(Match).count()
-        avg_goals_per_match = (total_goals / total_matches) if total_matches > 0 else 0
-
-        match_stats = {
-            'total_goals': total_goals,
-            'total_matches': total_matches,
-            'avg_goals_per_match': avg_goals_per_match,
-        }
+        # Данные страницы берутся из кэша и пересчитываются только после изменений
+        dashboard = await get_dashboard_async(db)
+        top_teams = dashboard["top_teams"]
+        top_scorers = dashboard["top_scorers"]
+        match_stats = dashboard["match_stats"]
         
         logger.info(f"Статистика матчей: {match_stats}")
 
@@ -127,8 +189,7 @@ async def analytics_page(request: Request, db: Session = Depends(get_db)) -> HTM
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail="Ошибка при получении данных аналитики.")
 
-    return templates.TemplateResponse("analytics.html", {
-        "request": request,
+    return templates.TemplateResponse(request, "analytics.html", {
         "top_teams": top_teams,
         "top_scorers": top_scorers,
         "match_stats": match_stats,
@@ -9,6 +9,8 @@ from .teams_router import router as teams_router
 from .matches_router import router as matches_router
 from .analytics_router import router as analytics_router
 from .players_router import router as players_router
+from .api_router import router as api_router
+from .media_router import router as media_router
 
 # Экспортируем маршруты
-__all__ = ["teams_router", "matches_router", "analytics_router", "players_router"]
+__all__ = ["teams_router", "matches_router", "analytics_router", "players_router", "api_router", "media_router"]
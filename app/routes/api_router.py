@@ -0,0 +1,114 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.http_cache import conditional_get
+from app.core.responses import FastJSONResponse
+from app.db import schemas
+from app.db.database import get_async_db, get_async_sessionmaker
+from app.services.export_service import (
+    DEFAULT_BATCH_SIZE, EXPORT_TABLES, FORMATS, MEDIA_TYPES, export_filename, stream_export_async,
+)
+from app.services.match_service import get_match_by_id_async, get_matches_page_async
+from app.services.player_service import get_player_by_id_async, get_players_page_async
+from app.services.team_service import get_team_by_id_async, get_teams_page_async
+
+router = APIRouter(default_response_class=FastJSONResponse)
+
+# Вложенные объекты схем: поле -> схема вложенного объекта.
+# Вложенные объекты попадают в ответ только если перечислены в параметре include.
+NESTED = {
+    schemas.Team: {"players": schemas.Player},
+    schemas.Player: {"team": schemas.Team},
+    schemas.Match: {"home_team": schemas.Team, "away_team": schemas.Team},
+}
+
+# Разбор параметра include вида "home_team,away_team"
+def parse_include(include: Optional[str], schema) -> tuple:
+    names = tuple(dict.fromkeys(name.strip() for name in (include or "").split(",") if name.strip()))
+    unknown = set(names) - set(NESTED[schema])
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Недопустимые значения include: {', '.join(sorted(unknown))}")
+    return names
+
+# Преобразование ORM-объекта в словарь по полям схемы.
+# Читаются только столбцы и явно запрошенные связи, поэтому ленивые загрузки
+# (и рекурсия Team -> players -> team -> ...) не происходят.
+def serialize(schema, obj, include=()) -> dict:
+    nested = NESTED[schema]
+    data = {name: getattr(obj, name) for name in schema.model_fields if name not in nested}
+    for name in include:
+        value = getattr(obj, name)
+        if isinstance(value, list):
+            data[name] = [serialize(nested[name], item) for item in value]
+        else:
+            data[name] = serialize(nested[name], value) if value is not None else None
+    return data
+
+# Ответ со страницей и курсором для запроса следующей страницы
+def page_response(schema, page, include=()) -> FastJSONResponse:
+    return FastJSONResponse({
+        "items": [serialize(schema, item, include) for item in page.items],
+        "next_cursor": page.next_cursor,
+        "limit": page.limit,
+    })
+
+@router.get("/teams", dependencies=[Depends(conditional_get("teams"))], response_model=schemas.Page[schemas.Team], summary="Команды")
+async def list_teams(cursor: Optional[str] = None, limit: Optional[int] = None, include: Optional[str] = None,
+                     db: AsyncSession = Depends(get_async_db)):
+    include = parse_include(include, schemas.Team)
+    page = await get_teams_page_async(db, cursor, limit, profile="api", include=include)
+    return page_response(schemas.Team, page, include)
+
+@router.get("/teams/{team_id}", dependencies=[Depends(conditional_get("team"))], response_model=schemas.Team, summary="Команда")
+async def get_team(team_id: int, include: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    include = parse_include(include, schemas.Team)
+    team = await get_team_by_id_async(db, team_id, profile="api", include=include)
+    if team is None:
+        raise HTTPException(status_code=404, detail="Команда не найдена")
+    return FastJSONResponse(serialize(schemas.Team, team, include))
+
+@router.get("/players", dependencies=[Depends(conditional_get("players"))], response_model=schemas.Page[schemas.Player], summary="Игроки")
+async def list_players(cursor: Optional[str] = None, limit: Optional[int] = None, include: Optional[str] = None,
+                       db: AsyncSession = Depends(get_async_db)):
+    include = parse_include(include, schemas.Player)
+    page = await get_players_page_async(db, cursor, limit, profile="api", include=include)
+    return page_response(schemas.Player, page, include)
+
+@router.get("/players/{player_id}", dependencies=[Depends(conditional_get("player"))], response_model=schemas.Player, summary="Игрок")
+async def get_player(player_id: int, include: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    include = parse_include(include, schemas.Player)
+    player = await get_player_by_id_async(db, player_id, profile="api", include=include)
+    if player is None:
+        raise HTTPException(status_code=404, detail="Игрок не найден")
+    return FastJSONResponse(serialize(schemas.Player, player, include))
+
+@router.get("/matches", dependencies=[Depends(conditional_get("matches"))], response_model=schemas.Page[schemas.Match], summary="Матчи")
+async def list_matches(cursor: Optional[str] = None, limit: Optional[int] = None, include: Optional[str] = None,
+                       db: AsyncSession = Depends(get_async_db)):
+    include = parse_include(include, schemas.Match)
+    page = await get_matches_page_async(db, cursor, limit, profile="api", include=include)
+    return page_response(schemas.Match, page, include)
+
+@router.get("/matches/{match_id}", dependencies=[Depends(conditional_get("match"))], response_model=schemas.Match, summary="Матч")
+async def get_match(match_id: int, include: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    include = parse_include(include, schemas.Match)
+    match = await get_match_by_id_async(db, match_id, profile="api", include=include)
+    if match is None:
+        raise HTTPException(status_code=404, detail="Матч не найден")
+    return FastJSONResponse(serialize(schemas.Match, match, include))
+
+@router.get("/export/{table}", summary="Потоковая выгрузка таблицы")
+async def export_table(table: str, format: str = "ndjson", gzip: bool = False, batch_size: int = DEFAULT_BATCH_SIZE,
+                       session_factory=Depends(get_async_sessionmaker)):
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Таблица {table} недоступна для выгрузки")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Формат должен быть одним из: {', '.join(FORMATS)}")
+    batch_size = max(1, min(batch_size, 10 * DEFAULT_BATCH_SIZE))
+    filename = export_filename(table, format, gzip)
+    return StreamingResponse(
+        stream_export_async(session_factory, table, format, gzip, batch_size),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
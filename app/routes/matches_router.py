@@ -1,22 +1,28 @@
+from typing import Optional
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
 from app.db.models import Match
-from app.services.match_service import get_all_matches, get_match_by_id
+from app.services.match_service import get_matches_page_async, get_match_by_id_async
+from app.core.templates import templates
+from app.core.http_cache import conditional_get
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
-@router.get("/{match_id}", response_class=HTMLResponse)
-async def get_match(request: Request, match_id: int, db: Session = Depends(get_db)):
-    match = get_match_by_id(db, match_id)
+@router.get("/{match_id}", response_class=HTMLResponse, dependencies=[Depends(conditional_get("match"))])
+async def get_match(request: Request, match_id: int, db: AsyncSession = Depends(get_async_db)):
+    match = await get_match_by_id_async(db, match_id)
     if match:
-        return templates.TemplateResponse("match.html", {"request": request, "match": match})
+        return templates.TemplateResponse(request, "match.html", {"match": match})
     raise HTTPException(status_code=404, detail="Матч не найден")
 
-@router.get("/", response_class=HTMLResponse)
-async def list_matches(request: Request, db: Session = Depends(get_db)):
-    matches = get_all_matches(db)
-    return templates.TemplateResponse("matches.html", {"request": request, "matches": matches})
\ No newline at end of file
+@router.get("/", response_class=HTMLResponse, dependencies=[Depends(conditional_get("matches"))])
+async def list_matches(request: Request, cursor: Optional[str] = None, limit: Optional[int] = None,
+                       db: AsyncSession = Depends(get_async_db)):
+    page = await get_matches_page_async(db, cursor, limit)
+    return templates.TemplateResponse(request, "matches.html", {
+        "matches": page.items,
+        "next_cursor": page.next_cursor,
+        "limit": page.limit,
+    })
\ No newline at end of file
@@ -0,0 +1,32 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.database import get_async_db
+from app.services.media_service import DEFAULT_SIZE, KINDS, THUMBNAIL_SIZES, MediaUnavailable, get_media_async
+
+router = APIRouter()
+
+# Миниатюра фотографии команды (kind=team) или игрока (kind=player).
+# Адрес с параметром v (версия url_photo) неизменяем и кэшируется браузером надолго.
+@router.get("/{kind}/{item_id}", summary="Миниатюра фотографии")
+async def get_media(request: Request, kind: str, item_id: int, size: int = DEFAULT_SIZE, v: Optional[str] = None,
+                    db: AsyncSession = Depends(get_async_db)):
+    if kind not in KINDS:
+        raise HTTPException(status_code=404, detail="Неизвестный тип изображения")
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"Размер должен быть одним из: {', '.join(map(str, THUMBNAIL_SIZES))}")
+    try:
+        media = await get_media_async(db, kind, item_id, size)
+    except MediaUnavailable as e:
+        # Страница не должна остаться без картинки из-за недоступного источника
+        return RedirectResponse(e.url, status_code=302)
+    if media is None:
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+
+    cache_control = f"public, max-age={settings.media_max_age}, immutable" if v else "public, max-age=3600"
+    headers = {"ETag": media.etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == media.etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(media.path, media_type=media.media_type, headers=headers)
@@ -1,22 +1,28 @@
+from typing import Optional
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
 from app.db.models import Player
-from app.services.player_service import get_player_by_id, get_all_players
+from app.services.player_service import get_player_by_id_async, get_players_page_async
+from app.core.templates import templates
+from app.core.http_cache import conditional_get
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
-@router.get("/{player_id}", response_class=HTMLResponse)
-async def get_player(request: Request, player_id: int, db: Session = Depends(get_db)):
-    player = get_player_by_id(db, player_id)
+@router.get("/{player_id}", response_class=HTMLResponse, dependencies=[Depends(conditional_get("player"))])
+async def get_player(request: Request, player_id: int, db: AsyncSession = Depends(get_async_db)):
+    player = await get_player_by_id_async(db, player_id)
     if player:
-        return templates.TemplateResponse("player.html", {"request": request, "player": player})
+        return templates.TemplateResponse(request, "player.html", {"player": player})
     raise HTTPException(status_code=404, detail="Игрок не найден")
 
-@router.get("/", response_class=HTMLResponse)
-async def list_players(request: Request, db: Session = Depends(get_db)):
-    players = get_all_players(db)
-    return templates.TemplateResponse("players.html", {"request": request, "players": players})
\ No newline at end of file
+@router.get("/", response_class=HTMLResponse, dependencies=[Depends(conditional_get("players"))])
+async def list_players(request: Request, cursor: Optional[str] = None, limit: Optional[int] = None,
+                       db: AsyncSession = Depends(get_async_db)):
+    page = await get_players_page_async(db, cursor, limit)
+    return templates.TemplateResponse(request, "players.html", {
+        "players": page.items,
+        "next_cursor": page.next_cursor,
+        "limit": page.limit,
+    })
\ No newline at end of file
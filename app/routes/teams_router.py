@@ -1,22 +1,34 @@
+from typing import Optional
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
 from app.db.models import Team
-from app.services.team_service import get_team_by_id, get_all_teams
+from app.services.team_service import get_team_by_id_async, get_teams_page_async
+from app.services.standings_service import get_standings_async
+from app.core.templates import templates
+from app.core.http_cache import conditional_get
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
-@router.get("/{team_id}", response_class=HTMLResponse)
-async def get_team(request: Request, team_id: int, db: Session = Depends(get_db)):
-    team = get_team_by_id(db, team_id)
+@router.get("/standings", response_class=HTMLResponse)
+async def standings_table(request: Request, db: AsyncSession = Depends(get_async_db)):
+    standings = await get_standings_async(db)
+    return templates.TemplateResponse(request, "standings.html", {"standings": standings})
+
+@router.get("/{team_id}", response_class=HTMLResponse, dependencies=[Depends(conditional_get("team"))])
+async def get_team(request: Request, team_id: int, db: AsyncSession = Depends(get_async_db)):
+    team = await get_team_by_id_async(db, team_id)
     if team:
-        return templates.TemplateResponse("team.html", {"request": request, "team": team})
+        return templates.TemplateResponse(request, "team.html", {"team": team})
     raise HTTPException(status_code=404, detail="Команда не найдена")
 
-@router.get("/", response_class=HTMLResponse)
-async def list_teams(request: Request, db: Session = Depends(get_db)):
-    teams = get_all_teams(db)
-    return templates.TemplateResponse("teams.html", {"request": request, "teams": teams})
+@router.get("/", response_class=HTMLResponse, dependencies=[Depends(conditional_get("teams"))])
+async def list_teams(request: Request, cursor: Optional[str] = None, limit: Optional[int] = None,
+                     db: AsyncSession = Depends(get_async_db)):
+    page = await get_teams_page_async(db, cursor, limit)
+    return templates.TemplateResponse(request, "teams.html", {
+        "teams": page.items,
+        "next_cursor": page.next_cursor,
+        "limit": page.limit,
+    })
@@ -0,0 +1,170 @@
+"""
+Колоночные архивы журнала действий.
+
+Файл архива хранит строки одной партиции по столбцам, каждый столбец - отдельным
+сжатым (zlib) блоком:
+- id и timestamp (микросекунды от эпохи) - разности соседних значений,
+  строки упорядочены по времени, поэтому разности малы и хорошо сжимаются;
+- user_id - целые числа, -1 вместо NULL;
+- action - номера в словаре значений, словарь хранится в заголовке.
+
+Для чтения периода сначала проверяется диапазон времени из заголовка, затем
+распаковывается только столбец времени (он кэшируется для последних архивов),
+границы периода находятся двоичным поиском, остальные столбцы распаковываются,
+только если в период попала хотя бы одна строка.
+"""
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+MAGIC = b"ACTLOG1\n"
+EPOCH = datetime(1970, 1, 1)
+NO_USER = -1
+COMPRESSION_LEVEL = 9
+
+ActionRecord = namedtuple("ActionRecord", "id user_id action timestamp")
+
+
+def to_micros(moment: datetime) -> int:
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+def _deltas(values) -> array:
+    previous = 0
+    result = array("q")
+    for value in values:
+        result.append(value - previous)
+        previous = value
+    return result
+
+
+def _block(values: array) -> bytes:
+    return zlib.compress(values.tobytes(), COMPRESSION_LEVEL)
+
+
+# Запись строк (id, user_id, action, timestamp) в новый файл архива; возвращает число строк.
+# Существующий файл не перезаписывается (FileExistsError)
+def write_archive(path: str, rows) -> int:
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rows = sorted(rows, key=lambda row: (row[3], row[0]))
+    dictionary, codes = {}, array("I")
+    for row in rows:
+        codes.append(dictionary.setdefault(row[2], len(dictionary)))
+    timestamps = [to_micros(row[3]) for row in rows]
+    blocks = {
+        "id": _block(_deltas(row[0] for row in rows)),
+        "user_id": _block(array("q", (NO_USER if row[1] is None else row[1] for row in rows))),
+        "action": _block(codes),
+        "timestamp": _block(_deltas(timestamps)),
+    }
+    offsets, position = {}, 0
+    for name, block in blocks.items():
+        offsets[name] = [position, len(block)]
+        position += len(block)
+    header = json.dumps({
+        "rows": len(rows),
+        "byteorder": sys.byteorder,
+        "min_timestamp": timestamps[0] if rows else None,
+        "max_timestamp": timestamps[-1] if rows else None,
+        "actions": list(dictionary),
+        "columns": offsets,
+    }).encode()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack(">I", len(header)) + header)
+        for block in blocks.values():
+            f.write(block)
+    os.replace(tmp, path)
+    return len(rows)
+
+
+# Распакованные столбцы времени последних прочитанных архивов: (путь, версия файла) -> array.
+# Файлы архивов не перезаписываются, поэтому столбец можно переиспользовать между запросами
+TIMESTAMP_CACHE_SIZE = 16
+_timestamps_cache = OrderedDict()
+_timestamps_lock = threading.Lock()
+
+
+class ArchiveReader:
+    """
+    Чтение файла архива по столбцам. При открытии читается только заголовок,
+    столбцы - по запросу.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            prefix = f.read(len(MAGIC) + 4)
+            if not prefix.startswith(MAGIC):
+                raise ValueError(f"{path} - не архив журнала действий")
+            size = struct.unpack(">I", prefix[len(MAGIC):])[0]
+            self.header = json.loads(f.read(size))
+            stat = os.fstat(f.fileno())
+        self._data_offset = len(MAGIC) + 4 + size
+        self._version = (stat.st_mtime_ns, stat.st_size)
+
+    def column(self, name: str, typecode: str = "q") -> array:
+        offset, length = self.header["columns"][name]
+        with open(self.path, "rb") as f:
+            f.seek(self._data_offset + offset)
+            block = f.read(length)
+        values = array(typecode)
+        values.frombytes(zlib.decompress(block))
+        if self.header["byteorder"] != sys.byteorder:
+            values.byteswap()
+        return values
+
+    # Моменты строк в микросекундах по возрастанию (из кэша, если архив уже читался)
+    def timestamps(self) -> array:
+        key = (self.path, self._version)
+        with _timestamps_lock:
+            if key in _timestamps_cache:
+                _timestamps_cache.move_to_end(key)
+                return _timestamps_cache[key]
+        values = array("q", accumulate(self.column("timestamp")))
+        with _timestamps_lock:
+            _timestamps_cache[key] = values
+            while len(_timestamps_cache) > TIMESTAMP_CACHE_SIZE:
+                _timestamps_cache.popitem(last=False)
+        return values
+
+    # Пересекается ли период [start, end) с диапазоном времени строк архива (по заголовку)
+    def overlaps(self, start: datetime = None, end: datetime = None) -> bool:
+        if not self.header["rows"]:
+            return False
+        if start is not None and to_micros(start) > self.header["max_timestamp"]:
+            return False
+        return end is None or to_micros(end) > self.header["min_timestamp"]
+
+    # Строки (id, user_id, action, timestamp) периода [start, end); None - без ограничения
+    def rows(self, start: datetime = None, end: datetime = None):
+        if not self.overlaps(start, end):
+            return []
+        timestamps = self.timestamps()
+        low = bisect_left(timestamps, to_micros(start)) if start else 0
+        high = bisect_left(timestamps, to_micros(end)) if end else len(timestamps)
+        if low >= high:
+            return []
+        # Остальные столбцы распаковываются, только если в период попали строки
+        ids = list(accumulate(self.column("id")))
+        user_ids = self.column("user_id")
+        actions = self.header["actions"]
+        codes = self.column("action", "I")
+        return [
+            ActionRecord(ids[i], None if user_ids[i] == NO_USER else user_ids[i], actions[codes[i]], from_micros(timestamps[i]))
+            for i in range(low, high)
+        ]
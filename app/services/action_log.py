@@ -0,0 +1,195 @@
+"""
+Буферизованная запись журнала действий пользователей (ActionLog).
+
+Обработчик запроса только кладет событие в ограниченную очередь процесса
+(без транзакции и ожидания диска). Фоновый поток раз в flush_interval секунд
+или сразу после накопления batch_size событий записывает их в базу одним
+многострочным INSERT на пачку и в той же транзакции дополняет агрегаты
+(app/services/rollups.py).
+
+Очередь ограничена: если база не успевает, новые события отбрасываются и
+учитываются в счетчике dropped, а запросы не замедляются. При остановке
+приложения (shutdown) очередь дописывается в базу.
+
+Временная ошибка базы (OperationalError: "database is locked" на SQLite, пока
+идет другая запись или обслуживание retention) не теряет пачку: она
+возвращается в начало очереди и записывается повторно через retry_delay секунд.
+Пачка считается потерянной (failed) после retry_attempts неудачных попыток
+или при любой другой ошибке SQLAlchemy.
+"""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from app.core.config import settings
+from app.db import models
+from app.db.database import engine
+from app.services.rollups import lock_watermark, roll_up
+
+logger = logging.getLogger(__name__)
+
+
+class ActionLogWriter:
+    """
+    Очередь событий ActionLog и фоновый поток их пакетной записи.
+    """
+
+    def __init__(self, engine, max_queue: int = None, batch_size: int = None,
+                 flush_interval: float = None, put_timeout: float = None,
+                 retry_attempts: int = None, retry_delay: float = None):
+        self.engine = engine
+        self.batch_size = batch_size or settings.action_log_batch_size
+        self.flush_interval = settings.action_log_flush_interval if flush_interval is None else flush_interval
+        self.put_timeout = settings.action_log_put_timeout if put_timeout is None else put_timeout
+        self.retry_attempts = retry_attempts or settings.action_log_retry_attempts
+        self.retry_delay = settings.action_log_retry_delay if retry_delay is None else retry_delay
+        self._queue = queue.Queue(maxsize=max_queue or settings.action_log_queue_size)
+        # Пачка, не записанная из-за временной ошибки, и число ее неудачных попыток;
+        # берется раньше очереди, поэтому порядок событий сохраняется
+        self._retry = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retried = 0
+        self.batches = 0
+
+    # Постановка события в очередь; False - очередь переполнена и событие отброшено
+    def submit(self, user_id: int, action: str, timestamp: datetime = None) -> bool:
+        row = {"user_id": user_id, "action": action, "timestamp": timestamp or datetime.utcnow()}
+        try:
+            if self.put_timeout > 0:
+                self._queue.put(row, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped == 1 or dropped % 1000 == 0:
+                logger.warning(f"Очередь журнала действий переполнена, отброшено событий: {dropped}")
+            return False
+        with self._stats_lock:
+            self.enqueued += 1
+        # Накопилась пачка - поток записывает ее, не дожидаясь интервала
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def _take_batch(self):
+        if self._retry is not None:
+            batch, self._retry = self._retry, None
+            return batch
+        rows = []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows, 0
+
+    def _fail(self, rows: list, error):
+        logger.error(f"Не удалось записать {len(rows)} событий журнала действий: {error}")
+        with self._stats_lock:
+            self.failed += len(rows)
+
+    # Запись всех событий, накопленных к этому моменту; возвращает число записанных.
+    # После временной ошибки запись прерывается, пачка ждет повтора (pending_retry)
+    def flush(self) -> int:
+        written = 0
+        with self._flush_lock:
+            while True:
+                rows, attempts = self._take_batch()
+                if not rows:
+                    return written
+                try:
+                    with self.engine.begin() as connection:
+                        lock_watermark(connection)
+                        connection.execute(insert(models.ActionLog).values(rows))
+                        # Агрегаты по минутам, часам и дням обновляются в той же транзакции
+                        roll_up(connection)
+                except OperationalError as e:
+                    attempts += 1
+                    if attempts >= self.retry_attempts:
+                        self._fail(rows, e)
+                        continue
+                    logger.warning(f"Запись {len(rows)} событий журнала действий отложена (попытка {attempts}): {e}")
+                    with self._stats_lock:
+                        self.retried += len(rows)
+                    self._retry = (rows, attempts)
+                    return written
+                except SQLAlchemyError as e:
+                    self._fail(rows, e)
+                    continue
+                written += len(rows)
+                with self._stats_lock:
+                    self.written += len(rows)
+                    self.batches += 1
+
+    @property
+    def pending_retry(self) -> bool:
+        return self._retry is not None
+
+    # Запись всего, что есть в очереди, с повторами после временных ошибок
+    def drain(self) -> int:
+        written = self.flush()
+        while self.pending_retry:
+            time.sleep(self.retry_delay)
+            written += self.flush()
+        return written
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.retry_delay if self.pending_retry else self.flush_interval)
+            self._wake.clear()
+            self.flush()
+        # Остановка: дописываем все, что осталось в очереди
+        self.drain()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="action-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        timeout = settings.action_log_drain_timeout if timeout is None else timeout
+        if self._thread is None:
+            self.drain()
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Журнал действий не дописан за {timeout} с, в очереди: {self._queue.qsize()}")
+        self._thread = None
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            retry = self._retry
+            return {
+                "queued": self._queue.qsize() + (len(retry[0]) if retry else 0),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "retried": self.retried,
+                "batches": self.batches,
+            }
+
+
+# Общий писатель процесса; фоновый поток запускается в startup приложения
+action_log_writer = ActionLogWriter(engine)
+
+
+def get_action_log_stats() -> dict:
+    return action_log_writer.stats()
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db import models
+from app.services.cache import TTLCache
+from app.services.load_profiles import load_options
+from app.services.standings_service import get_top_teams_async
+
+logger = logging.getLogger(__name__)
+
+# Кэш данных страницы аналитики.
+# Кэш живет в памяти каждого воркера: записи сервисов сбрасывают его сразу,
+# а изменения из других процессов становятся видны не позже чем через ttl.
+dashboard_cache = TTLCache(maxsize=settings.dashboard_cache_size, ttl=settings.dashboard_cache_ttl)
+DASHBOARD_KEY = "dashboard"
+
+# Одновременные промахи внутри процесса ждут одного пересчета, а не запускают свои
+_rebuild_lock = asyncio.Lock()
+
+
+# Запрос лучших бомбардиров вместе с командами
+def top_scorers_query(limit: int = 10):
+    return (
+        select(models.Player)
+        .options(*load_options(models.Player, "list"))
+        .order_by(models.Player.goals.desc())
+        .limit(limit)
+    )
+
+
+# Общее число голов и матчей одним запросом
+def match_totals_query():
+    return select(func.sum(models.Match.home_score + models.Match.away_score), func.count(models.Match.id))
+
+
+# Сбор данных страницы аналитики из базы.
+# Результат содержит только простые значения, без ORM-объектов, чтобы его можно было
+# безопасно отдавать из кэша в разные запросы.
+async def build_dashboard_async(db: AsyncSession) -> dict:
+    top_teams = await get_top_teams_async(db, limit=10)
+    top_scorers = (await db.scalars(top_scorers_query(limit=10))).all()
+    total_goals, total_matches = (await db.execute(match_totals_query())).one()
+    total_goals = total_goals or 0
+    avg_goals_per_match = (total_goals / total_matches) if total_matches > 0 else 0
+
+    return {
+        "top_teams": [
+            {
+                "id": team.id,
+                "name": team.name,
+                "city": team.city,
+                "stadium": team.stadium,
+                "points": team.standing.points,
+                "players_count": len(team.players),
+            }
+            for team in top_teams
+        ],
+        "top_scorers": [
+            {
+                "id": player.id,
+                "name": player.name,
+                "team": {"id": player.team.id, "name": player.team.name},
+                "position": player.position,
+                "goals": player.goals,
+            }
+            for player in top_scorers
+        ],
+        "match_stats": {
+            "total_goals": total_goals,
+            "total_matches": total_matches,
+            "avg_goals_per_match": avg_goals_per_match,
+        },
+    }
+
+
+# Данные страницы аналитики из кэша или из базы при промахе
+async def get_dashboard_async(db: AsyncSession) -> dict:
+    payload = dashboard_cache.get(DASHBOARD_KEY)
+    if payload is not None:
+        return payload
+    async with _rebuild_lock:
+        payload = dashboard_cache.get(DASHBOARD_KEY)
+        if payload is None:
+            generation = dashboard_cache.generation
+            payload = await build_dashboard_async(db)
+            dashboard_cache.set(DASHBOARD_KEY, payload, generation=generation)
+    return payload
+
+
+# Сброс кэша аналитики, вызывается сервисами после записи матчей, игроков и команд
+def invalidate_dashboard():
+    dashboard_cache.invalidate()
+
+
+# Счетчики попаданий и промахов кэша
+def get_dashboard_cache_stats() -> dict:
+    return dashboard_cache.stats()
@@ -0,0 +1,175 @@
+"""
+Потоковая выгрузка таблиц в NDJSON и CSV.
+Строки читаются курсором на стороне сервера пачками по batch_size (yield_per),
+каждая пачка сразу кодируется и отдается, поэтому в памяти находится не больше одной пачки.
+
+Запуск из командной строки:
+    python -m app.services.export_service teams players --format csv --gzip --output-dir exports
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import zlib
+from datetime import date, datetime
+from enum import Enum
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.db import models
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, доступные для выгрузки
+EXPORT_TABLES = {
+    "teams": models.Team.__table__,
+    "players": models.Player.__table__,
+    "matches": models.Match.__table__,
+    "goals": models.Goal.__table__,
+}
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+DEFAULT_BATCH_SIZE = 1000
+
+
+class ExportError(ValueError):
+    """Неизвестная таблица или формат выгрузки."""
+
+
+# Значение ячейки в виде, пригодном для JSON и CSV
+def plain(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def ndjson_chunk(columns, rows) -> bytes:
+    lines = []
+    for row in rows:
+        record = {column: plain(value) for column, value in zip(columns, row)}
+        if orjson is not None:
+            lines.append(orjson.dumps(record))
+        else:
+            lines.append(json.dumps(record, ensure_ascii=False).encode())
+    return b"\n".join(lines) + b"\n" if lines else b""
+
+
+def csv_chunk(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([plain(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+class Encoder:
+    """
+    Кодирование пачек строк в выбранный формат с необязательным потоковым gzip.
+    """
+
+    def __init__(self, columns, fmt: str = "ndjson", compress: bool = False):
+        if fmt not in FORMATS:
+            raise ExportError(f"Неизвестный формат выгрузки: {fmt}")
+        self.columns = list(columns)
+        self.fmt = fmt
+        # wbits=31 - формат gzip (заголовок и контрольная сумма), а не «голый» deflate
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def _out(self, data: bytes) -> bytes:
+        if self._compressor is None:
+            return data
+        return self._compressor.compress(data)
+
+    def header(self) -> bytes:
+        if self.fmt == "csv":
+            return self._out(csv_chunk([self.columns]))
+        return self._out(b"")
+
+    def encode(self, rows) -> bytes:
+        if self.fmt == "csv":
+            return self._out(csv_chunk(rows))
+        return self._out(ndjson_chunk(self.columns, rows))
+
+    def finish(self) -> bytes:
+        if self._compressor is None:
+            return b""
+        return self._compressor.flush()
+
+
+def get_export_table(name: str):
+    try:
+        return EXPORT_TABLES[name]
+    except KeyError:
+        raise ExportError(f"Таблица {name} недоступна для выгрузки")
+
+
+# Имя файла выгрузки, например players.csv.gz
+def export_filename(name: str, fmt: str, compress: bool) -> str:
+    return f"{name}.{fmt}" + (".gz" if compress else "")
+
+
+# Запрос всей таблицы в порядке первичного ключа с чтением пачками
+def export_query(table, batch_size: int):
+    return select(table).order_by(*table.primary_key.columns).execution_options(yield_per=batch_size)
+
+
+# Асинхронная выгрузка для StreamingResponse.
+# Сессия открывается внутри генератора и живет ровно столько, сколько идет передача.
+async def stream_export_async(session_factory, name: str, fmt: str = "ndjson", compress: bool = False,
+                              batch_size: int = DEFAULT_BATCH_SIZE):
+    table = get_export_table(name)
+    encoder = Encoder(table.columns.keys(), fmt, compress)
+    yield encoder.header()
+    async with session_factory() as db:
+        result = await db.stream(export_query(table, batch_size))
+        async for rows in result.partitions():
+            chunk = encoder.encode(rows)
+            if chunk:
+                yield chunk
+    yield encoder.finish()
+
+
+# Синхронная выгрузка таблицы в файл
+def export_to_file(db: Session, name: str, path: str, fmt: str = "ndjson", compress: bool = False,
+                   batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    table = get_export_table(name)
+    encoder = Encoder(table.columns.keys(), fmt, compress)
+    count = 0
+    with open(path, "wb") as f:
+        f.write(encoder.header())
+        for rows in db.execute(export_query(table, batch_size)).partitions():
+            f.write(encoder.encode(rows))
+            count += len(rows)
+        f.write(encoder.finish())
+    logger.info(f"Таблица {name} выгружена в {path}: {count} строк")
+    return count
+
+
+def main(argv=None):
+    from app.db.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка таблиц в NDJSON или CSV")
+    parser.add_argument("tables", nargs="*", default=list(EXPORT_TABLES), help="Таблицы для выгрузки (по умолчанию все)")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="Сжимать файлы gzip")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--output-dir", default=".")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with SessionLocal() as session:
+        for name in args.tables:
+            path = os.path.join(args.output_dir, export_filename(name, args.format, args.gzip))
+            export_to_file(session, name, path, args.format, args.gzip, args.batch_size)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,141 @@
+"""
+Пакетная загрузка команд, игроков, матчей и голов.
+
+Для каждой таблицы существующие ключи читаются одним запросом, входные строки
+очищаются от дублей в памяти, а новые строки вставляются пачками: одна инструкция
+INSERT ... ON CONFLICT DO NOTHING (по уникальным ключам таблиц) выполняется через
+executemany для всей пачки. Повторный запуск с теми же данными ничего не вставляет.
+"""
+import asyncio
+import logging
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+# Уникальные ключи таблиц: по ним отсеиваются дубли и разрешаются конфликты вставки
+TEAM_KEY = ("name",)
+PLAYER_KEY = ("name", "team_id")  # unique_player_in_team
+MATCH_KEY = ("home_team_id", "away_team_id", "date")  # unique_match_constraint
+GOAL_KEY = ("match_id", "player_id", "minute")  # Уникального ограничения нет, дубли отсеиваются только в памяти
+
+
+# Разбиение списка на пачки
+def chunked(items, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# Прогресс загрузки по умолчанию - в лог
+def log_progress(table: str, done: int, total: int):
+    logger.info(f"{table}: загружено {done} из {total}")
+
+
+# INSERT, пропускающий строки с конфликтом уникального ключа.
+# Для таблиц без уникального ограничения (key=None) - обычный INSERT.
+def insert_ignoring_conflicts(table, dialect_name: str, key=None):
+    if key is None:
+        return insert(table)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing(index_elements=list(key))
+    if dialect_name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing(index_elements=list(key))
+    # Для остальных СУБД полагаемся на предварительное чтение ключей
+    return insert(table)
+
+
+# Ключи строк, уже существующих в таблице (один запрос)
+async def existing_keys(session: AsyncSession, model, key) -> set:
+    result = await session.execute(select(*(getattr(model, column) for column in key)))
+    return {tuple(row) for row in result}
+
+
+# Загрузка строк одной таблицы.
+# enrich - необязательная асинхронная функция, дополняющая пачку новых строк
+# перед вставкой (например, ссылками на фотографии); вызывается только для новых строк.
+async def ingest_rows(session: AsyncSession, model, key, rows, batch_size: int = DEFAULT_BATCH_SIZE,
+                      enrich=None, progress=log_progress, unique: bool = True) -> int:
+    table = model.__table__
+    seen = await existing_keys(session, model, key)
+    new_rows = []
+    for row in rows:
+        row_key = tuple(row[column] for column in key)
+        if row_key not in seen:
+            seen.add(row_key)
+            new_rows.append(row)
+
+    stmt = insert_ignoring_conflicts(table, session.bind.dialect.name, key if unique else None)
+    batches = list(chunked(new_rows, batch_size))
+    # Дополнение следующей пачки запускается до вставки текущей,
+    # поэтому сетевые запросы идут параллельно с записью в базу
+    pending = asyncio.ensure_future(enrich(batches[0])) if enrich is not None and batches else None
+    done = 0
+    try:
+        for number, batch in enumerate(batches):
+            if pending is not None:
+                batch = await pending
+                pending = asyncio.ensure_future(enrich(batches[number + 1])) if number + 1 < len(batches) else None
+            result = await session.execute(stmt, batch)
+            # Строки, пропущенные по конфликту ключа (вставлены параллельно), не считаются;
+            # если драйвер не сообщает число строк (-1), считается вся пачка
+            done += result.rowcount if result.rowcount >= 0 else len(batch)
+            progress(table.name, done, len(new_rows))
+    finally:
+        # При ошибке вставки дополнение следующей пачки уже не нужно
+        if pending is not None:
+            pending.cancel()
+            if pending.done() and not pending.cancelled():
+                pending.exception()
+    skipped = len(rows) - len(new_rows)
+    if skipped:
+        logger.info(f"{table.name}: пропущено {skipped} существующих или повторяющихся строк")
+    return done
+
+
+async def ingest_teams(session: AsyncSession, rows, batch_size: int = DEFAULT_BATCH_SIZE, enrich=None,
+                       progress=log_progress) -> int:
+    return await ingest_rows(session, models.Team, TEAM_KEY, rows, batch_size, enrich, progress)
+
+
+async def ingest_players(session: AsyncSession, rows, batch_size: int = DEFAULT_BATCH_SIZE, enrich=None,
+                         progress=log_progress) -> int:
+    return await ingest_rows(session, models.Player, PLAYER_KEY, rows, batch_size, enrich, progress)
+
+
+async def ingest_matches(session: AsyncSession, rows, batch_size: int = DEFAULT_BATCH_SIZE,
+                         progress=log_progress) -> int:
+    return await ingest_rows(session, models.Match, MATCH_KEY, rows, batch_size, progress=progress)
+
+
+async def ingest_goals(session: AsyncSession, rows, batch_size: int = DEFAULT_BATCH_SIZE,
+                       progress=log_progress) -> int:
+    return await ingest_rows(session, models.Goal, GOAL_KEY, rows, batch_size, progress=progress, unique=False)
+
+
+# Загрузка полного набора данных в одной транзакции.
+# Матчи вставляются в обход match_service, поэтому турнирная таблица пересчитывается целиком в конце.
+async def ingest_dataset(session: AsyncSession, teams=(), players=(), matches=(), goals=(),
+                         batch_size: int = DEFAULT_BATCH_SIZE, enrich_teams=None, enrich_players=None,
+                         progress=log_progress) -> dict:
+    from app.services.analytics_service import invalidate_dashboard
+    from app.services.standings_service import rebuild_standings
+    from app.services.stats_engine import invalidate_season_data
+
+    report = {
+        "teams": await ingest_teams(session, list(teams), batch_size, enrich_teams, progress),
+        "players": await ingest_players(session, list(players), batch_size, enrich_players, progress),
+        "matches": await ingest_matches(session, list(matches), batch_size, progress),
+        "goals": await ingest_goals(session, list(goals), batch_size, progress),
+    }
+    if report["matches"] or report["teams"]:
+        await session.run_sync(rebuild_standings)
+    else:
+        await session.commit()
+    invalidate_dashboard()
+    invalidate_season_data()
+    logger.info(f"Загрузка завершена: {report}")
+    return report
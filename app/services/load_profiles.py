@@ -0,0 +1,76 @@
+from sqlalchemy.orm import joinedload, selectinload
+from app.db import models
+
+# Профили загрузки связей.
+# Каждый профиль описывает, какие отношения подгружаются вместе с основной выборкой,
+# чтобы шаблоны не вызывали отдельный SELECT на каждую строку (проблема N+1).
+# "list" - для страниц со списками, "detail" - для страницы одной сущности,
+# "api" - без связей: JSON API подгружает только то, что запрошено в include.
+LOAD_PROFILES = {
+    models.Match: {
+        "list": (
+            joinedload(models.Match.home_team),
+            joinedload(models.Match.away_team),
+        ),
+        "api": (),
+        "detail": (
+            joinedload(models.Match.home_team),
+            joinedload(models.Match.away_team),
+            selectinload(models.Match.goals).joinedload(models.Goal.player),
+        ),
+    },
+    models.Team: {
+        "list": (),
+        "api": (),
+        "detail": (
+            selectinload(models.Team.players),
+        ),
+    },
+    models.Player: {
+        "list": (
+            joinedload(models.Player.team),
+        ),
+        "api": (),
+        "detail": (
+            joinedload(models.Player.team),
+            selectinload(models.Player.goals_scored),
+        ),
+    },
+}
+
+
+# Связи, которые клиент API может запросить параметром include
+INCLUDE_OPTIONS = {
+    models.Team: {
+        "players": selectinload(models.Team.players),
+    },
+    models.Player: {
+        "team": joinedload(models.Player.team),
+    },
+    models.Match: {
+        "home_team": joinedload(models.Match.home_team),
+        "away_team": joinedload(models.Match.away_team),
+    },
+}
+
+
+# Получение опций загрузки для модели и профиля
+def load_options(model, profile: str = "list"):
+    try:
+        return LOAD_PROFILES[model][profile]
+    except KeyError:
+        raise ValueError(f"Неизвестный профиль загрузки '{profile}' для модели {model.__name__}")
+
+
+# Применение профиля загрузки к запросу
+def apply_profile(query, model, profile: str = "list"):
+    return query.options(*load_options(model, profile))
+
+
+# Опции загрузки только для запрошенных связей
+def include_options(model, include=()):
+    available = INCLUDE_OPTIONS.get(model, {})
+    unknown = set(include) - set(available)
+    if unknown:
+        raise ValueError(f"Связи {', '.join(sorted(unknown))} недоступны для модели {model.__name__}")
+    return tuple(available[name] for name in include)
@@ -1,13 +1,20 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.db import models, schemas
+from app.services.analytics_service import invalidate_dashboard
+from app.services.load_profiles import apply_profile, include_options, load_options
+from app.services.pagination import fetch_page
+from app.services.standings_service import apply_result, refresh_forms
+from app.services.stats_engine import invalidate_season_data
 
 # Получение всех матчей
-def get_all_matches(db: Session):
-    return db.query(models.Match).all()
+def get_all_matches(db: Session, profile: str = "list"):
+    return apply_profile(db.query(models.Match), models.Match, profile).all()
 
 # Получение матча по ID
-def get_match_by_id(db: Session, match_id: int):
-    return db.query(models.Match).filter(models.Match.id == match_id).first()
+def get_match_by_id(db: Session, match_id: int, profile: str = "detail"):
+    return apply_profile(db.query(models.Match), models.Match, profile).filter(models.Match.id == match_id).first()
 
 # Создание нового матча
 def create_match(db: Session, match: schemas.MatchCreate):
@@ -19,7 +26,12 @@ def create_match(db: Session, match: schemas.MatchCreate):
         away_score=match.away_score
     )
     db.add(db_match)
+    db.flush()  # Применяем значения по умолчанию для счета до учета в таблице
+    apply_result(db, db_match.home_team_id, db_match.away_team_id, db_match.home_score, db_match.away_score)
+    refresh_forms(db, db_match.home_team_id, db_match.away_team_id)
     db.commit()
+    invalidate_dashboard()
+    invalidate_season_data()
     db.refresh(db_match)
     return db_match
 
@@ -28,9 +40,15 @@ def update_match(db: Session, match_id: int, match_data: schemas.MatchUpdate):
     match = db.query(models.Match).filter(models.Match.id == match_id).first()
     if not match:
         return None
+    # Отменяем старый результат в таблице и учитываем новый
+    apply_result(db, match.home_team_id, match.away_team_id, match.home_score, match.away_score, sign=-1)
     for key, value in match_data.dict(exclude_unset=True).items():
         setattr(match, key, value)
+    apply_result(db, match.home_team_id, match.away_team_id, match.home_score, match.away_score)
+    refresh_forms(db, match.home_team_id, match.away_team_id)
     db.commit()
+    invalidate_dashboard()
+    invalidate_season_data()
     db.refresh(match)
     return match
 
@@ -38,7 +56,44 @@ def update_match(db: Session, match_id: int, match_data: schemas.MatchUpdate):
 def delete_match(db: Session, match_id: int):
     match = db.query(models.Match).filter(models.Match.id == match_id).first()
     if match:
+        apply_result(db, match.home_team_id, match.away_team_id, match.home_score, match.away_score, sign=-1)
         db.delete(match)
+        refresh_forms(db, match.home_team_id, match.away_team_id)
         db.commit()
+        invalidate_dashboard()
+        invalidate_season_data()
         return match
     return None
+
+
+# --- Асинхронные версии для обработчиков FastAPI ---
+
+# Получение всех матчей
+async def get_all_matches_async(db: AsyncSession, profile: str = "list"):
+    result = await db.execute(select(models.Match).options(*load_options(models.Match, profile)))
+    return result.scalars().unique().all()
+
+# Страница матчей с сортировкой по дате и id (keyset-пагинация)
+async def get_matches_page_async(db: AsyncSession, cursor: str = None, limit: int = None, profile: str = "list", include=()):
+    stmt = select(models.Match).options(*load_options(models.Match, profile), *include_options(models.Match, include))
+    return await fetch_page(db, stmt, (models.Match.date, models.Match.id), cursor, limit)
+
+# Получение матча по ID
+async def get_match_by_id_async(db: AsyncSession, match_id: int, profile: str = "detail", include=()):
+    result = await db.execute(
+        select(models.Match)
+        .options(*load_options(models.Match, profile), *include_options(models.Match, include))
+        .where(models.Match.id == match_id)
+    )
+    return result.scalars().first()
+
+# Запись выполняется синхронной версией сервиса внутри run_sync,
+# чтобы логика изменения данных оставалась в одном месте
+async def create_match_async(db: AsyncSession, match: schemas.MatchCreate):
+    return await db.run_sync(create_match, match)
+
+async def update_match_async(db: AsyncSession, match_id: int, match_data: schemas.MatchUpdate):
+    return await db.run_sync(update_match, match_id, match_data)
+
+async def delete_match_async(db: AsyncSession, match_id: int):
+    return await db.run_sync(delete_match, match_id)
@@ -0,0 +1,192 @@
+"""
+Локальные копии фотографий команд и игроков.
+
+Изображение по ссылке url_photo скачивается один раз и сохраняется на диск под
+sha256 от содержимого (одинаковые картинки хранятся в одном экземпляре). Для
+страниц из оригинала строятся миниатюры фиксированных размеров (нужен Pillow;
+без него отдается оригинал). Ссылки из шаблонов содержат версию url_photo,
+поэтому ответы можно кэшировать в браузере надолго.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+from typing import NamedTuple, Optional
+import aiohttp
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db import models
+
+try:
+    from PIL import Image
+    # DecompressionBombError - не OSError: сильно сжатая картинка огромного размера
+    IMAGE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+except ImportError:
+    Image = None
+    IMAGE_ERRORS = (OSError, ValueError)
+
+logger = logging.getLogger(__name__)
+
+KINDS = {"team": models.Team, "player": models.Player}
+# Стороны квадрата миниатюр в пикселях: логотипы в списках (50px на экранах 2x) и карточки
+THUMBNAIL_SIZES = (100, 300)
+DEFAULT_SIZE = 100
+USER_AGENT = "Mozilla/5.0"
+
+
+class MediaUnavailable(Exception):
+    """Изображение не удалось скачать; в ответе можно перенаправить на оригинальный адрес."""
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(f"Не удалось получить изображение {url}: {reason}")
+        self.url = url
+
+
+class MediaFile(NamedTuple):
+    path: str
+    media_type: str
+    etag: str
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# Версия ссылки на фотографию: меняется вместе с url_photo и делает адрес /media неизменяемым
+def url_version(url: str) -> str:
+    return _sha256(url.encode())[:12]
+
+
+# Адрес локальной копии фотографии для шаблонов
+def media_url(kind: str, obj, size: int = DEFAULT_SIZE) -> Optional[str]:
+    if not getattr(obj, "url_photo", None):
+        return None
+    return f"/media/{kind}/{obj.id}?size={size}&v={url_version(obj.url_photo)}"
+
+
+# Миниатюра, вписанная в квадрат size x size; None, если изображение не удалось разобрать
+def make_thumbnail(data: bytes, size: int):
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((size, size))
+            if image.mode in ("RGBA", "LA", "P"):
+                fmt, media_type = "PNG", "image/png"
+            else:
+                fmt, media_type = "JPEG", "image/jpeg"
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, fmt, optimize=True)
+            return buffer.getvalue(), media_type
+    except IMAGE_ERRORS as e:
+        logger.warning(f"Не удалось построить миниатюру: {e}")
+        return None
+
+
+class MediaStore:
+    """
+    Файловое хранилище: originals/<sha256> - оригиналы, thumbs/<sha256>_<size> - миниатюры,
+    sources/<sha256 от url>.json - какой оригинал соответствует ссылке.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        for name in ("originals", "thumbs", "sources"):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def _path(self, *parts) -> str:
+        return os.path.join(self.directory, *parts)
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def source(self, url: str) -> Optional[dict]:
+        try:
+            with open(self._path("sources", _sha256(url.encode()) + ".json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_original(self, url: str, data: bytes, media_type: str) -> dict:
+        source = {"url": url, "hash": _sha256(data), "media_type": media_type}
+        original = self._path("originals", source["hash"])
+        if not os.path.exists(original):
+            self._write(original, data)
+        self._write(self._path("sources", _sha256(url.encode()) + ".json"), json.dumps(source).encode())
+        return source
+
+    # Путь и тип миниатюры; строится при первом обращении
+    def thumbnail(self, source: dict, size: int):
+        for media_type, suffix in (("image/png", ".png"), ("image/jpeg", ".jpg")):
+            path = self._path("thumbs", f"{source['hash']}_{size}{suffix}")
+            if os.path.exists(path):
+                return path, media_type
+        original = self._path("originals", source["hash"])
+        with open(original, "rb") as f:
+            thumbnail = make_thumbnail(f.read(), size)
+        if thumbnail is None:
+            return original, source["media_type"]
+        data, media_type = thumbnail
+        path = self._path("thumbs", f"{source['hash']}_{size}" + (".png" if media_type == "image/png" else ".jpg"))
+        self._write(path, data)
+        return path, media_type
+
+
+_store = None
+_download_locks = {}
+
+
+def get_media_store() -> MediaStore:
+    global _store
+    if _store is None or _store.directory != settings.media_dir:
+        _store = MediaStore(settings.media_dir)
+    return _store
+
+
+# Скачивание изображения с проверкой типа и размера
+async def download_image(url: str):
+    if not url.startswith(("http://", "https://")):
+        raise MediaUnavailable(url, "поддерживаются только адреса http(s)")
+    timeout = aiohttp.ClientTimeout(total=settings.scraper_timeout)
+    try:
+        async with aiohttp.ClientSession(headers={"User-Agent": USER_AGENT}, timeout=timeout) as session:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    raise MediaUnavailable(url, f"статус {response.status}")
+                if not response.content_type.startswith("image/"):
+                    raise MediaUnavailable(url, f"тип {response.content_type}")
+                data = await response.content.read(settings.media_max_bytes + 1)
+                if len(data) > settings.media_max_bytes:
+                    raise MediaUnavailable(url, "файл слишком большой")
+                return data, response.content_type
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise MediaUnavailable(url, str(e)) from e
+
+
+# Получение миниатюры фотографии команды или игрока.
+# None - если сущности или фотографии нет; MediaUnavailable - если источник недоступен.
+async def get_media_async(db: AsyncSession, kind: str, item_id: int, size: int = DEFAULT_SIZE) -> Optional[MediaFile]:
+    model = KINDS[kind]
+    url = await db.scalar(select(model.url_photo).where(model.id == item_id))
+    if not url:
+        return None
+    store = get_media_store()
+    source = store.source(url)
+    if source is None:
+        # Одновременные запросы одной картинки ждут одну загрузку
+        lock = _download_locks.setdefault(url, asyncio.Lock())
+        async with lock:
+            source = store.source(url)
+            if source is None:
+                data, media_type = await download_image(url)
+                source = store.save_original(url, data, media_type)
+        _download_locks.pop(url, None)
+    path, media_type = await asyncio.to_thread(store.thumbnail, source, size)
+    return MediaFile(path=path, media_type=media_type, etag=f'"{source["hash"][:16]}-{size}"')
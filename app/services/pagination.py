@@ -0,0 +1,68 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, NamedTuple, Optional
+from sqlalchemy import DateTime, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или не подходит к порядку сортировки."""
+
+
+class Page(NamedTuple):
+    """Страница результатов и курсор следующей страницы (None, если это последняя)."""
+    items: List[Any]
+    next_cursor: Optional[str]
+    limit: int
+
+
+# Размер страницы с учетом ограничений из настроек
+def clamp_limit(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return settings.page_size
+    return min(limit, settings.max_page_size)
+
+
+# Курсор - значения ключей сортировки последней строки в base64 (непрозрачен для клиента)
+def encode_cursor(values) -> str:
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidCursor(f"Некорректный курсор: {cursor}") from e
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        raise InvalidCursor(f"Курсор не соответствует сортировке: {cursor}")
+    values = []
+    for column, value in zip(columns, payload):
+        try:
+            values.append(datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value)
+        except (TypeError, ValueError) as e:
+            raise InvalidCursor(f"Некорректное значение в курсоре: {value}") from e
+    return values
+
+
+# Выборка страницы по ключу (keyset): WHERE (ключи) > (ключи последней строки) ORDER BY ключи LIMIT n.
+# Последний столбец сортировки должен быть уникальным (обычно id), чтобы порядок был стабильным.
+# Стоимость запроса не зависит от номера страницы, в отличие от OFFSET.
+async def fetch_page(db: AsyncSession, stmt, order_columns, cursor: Optional[str] = None, limit: Optional[int] = None) -> Page:
+    limit = clamp_limit(limit)
+    if cursor:
+        values = decode_cursor(cursor, order_columns)
+        stmt = stmt.where(tuple_(*order_columns) > tuple_(*values))
+    result = await db.scalars(stmt.order_by(*order_columns).limit(limit + 1))
+    rows = result.unique().all()
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in order_columns])
+    return Page(items=items, next_cursor=next_cursor, limit=limit)
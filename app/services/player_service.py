@@ -1,13 +1,18 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.db import models, schemas
+from app.services.analytics_service import invalidate_dashboard
+from app.services.load_profiles import apply_profile, include_options, load_options
+from app.services.pagination import fetch_page
 
 # Получение всех игроков
-def get_all_players(db: Session):
-    return db.query(models.Player).all()
+def get_all_players(db: Session, profile: str = "list"):
+    return apply_profile(db.query(models.Player), models.Player, profile).all()
 
 # Получение игрока по ID
-def get_player_by_id(db: Session, player_id: int):
-    return db.query(models.Player).filter(models.Player.id == player_id).first()
+def get_player_by_id(db: Session, player_id: int, profile: str = "detail"):
+    return apply_profile(db.query(models.Player), models.Player, profile).filter(models.Player.id == player_id).first()
 
 # Создание нового игрока
 def create_player(db: Session, player: schemas.PlayerCreate):
@@ -21,6 +26,7 @@ def create_player(db: Session, player: schemas.PlayerCreate):
     )
     db.add(db_player)
     db.commit()
+    invalidate_dashboard()
     db.refresh(db_player)
     return db_player
 
@@ -32,6 +38,7 @@ def update_player(db: Session, player_id: int, player_data: schemas.PlayerUpdate
     for key, value in player_data.dict(exclude_unset=True).items():
         setattr(player, key, value)
     db.commit()
+    invalidate_dashboard()
     db.refresh(player)
     return player
 
@@ -41,5 +48,38 @@ def delete_player(db: Session, player_id: int):
     if player:
         db.delete(player)
         db.commit()
+        invalidate_dashboard()
         return player
-    return None
\ No newline at end of file
+    return None
+
+
+# --- Асинхронные версии для обработчиков FastAPI ---
+
+# Получение всех игроков
+async def get_all_players_async(db: AsyncSession, profile: str = "list"):
+    result = await db.execute(select(models.Player).options(*load_options(models.Player, profile)))
+    return result.scalars().unique().all()
+
+# Страница игроков с сортировкой по id (keyset-пагинация)
+async def get_players_page_async(db: AsyncSession, cursor: str = None, limit: int = None, profile: str = "list", include=()):
+    stmt = select(models.Player).options(*load_options(models.Player, profile), *include_options(models.Player, include))
+    return await fetch_page(db, stmt, (models.Player.id,), cursor, limit)
+
+# Получение игрока по ID
+async def get_player_by_id_async(db: AsyncSession, player_id: int, profile: str = "detail", include=()):
+    result = await db.execute(
+        select(models.Player)
+        .options(*load_options(models.Player, profile), *include_options(models.Player, include))
+        .where(models.Player.id == player_id)
+    )
+    return result.scalars().first()
+
+# Создание, обновление и удаление игрока - через синхронные функции выше
+async def create_player_async(db: AsyncSession, player: schemas.PlayerCreate):
+    return await db.run_sync(create_player, player)
+
+async def update_player_async(db: AsyncSession, player_id: int, player_data: schemas.PlayerUpdate):
+    return await db.run_sync(update_player, player_id, player_data)
+
+async def delete_player_async(db: AsyncSession, player_id: int):
+    return await db.run_sync(delete_player, player_id)
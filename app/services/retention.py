@@ -0,0 +1,352 @@
+"""
+Хранение журнала действий: партиции по дням или месяцам и срок хранения.
+
+SQLite: новые события пишутся в action_logs. Обслуживание (maintain) переносит
+строки закончившихся периодов в отдельные таблицы action_logs_p<период> одной
+вставкой и одним удалением по индексу timestamp на партицию.
+
+PostgreSQL: action_logs - секционированная по timestamp таблица (перевод -
+команда --convert). Обслуживание заранее создает партиции на ближайшие
+периоды, а закончившиеся отмечает в реестре.
+
+Партиции, вышедшие за срок хранения (ACTION_LOG_RETENTION_DAYS), удаляются
+целиком (DROP TABLE, на PostgreSQL - после DETACH PARTITION). В режиме
+ACTION_LOG_EXPIRE=archive их строки перед удалением сжимаются в колоночный
+файл (app/services/action_archive.py). Запросы за период читают и основную
+таблицу, и отделенные таблицы, и архивы (read_actions). Дневные агрегаты и
+сводки (rollups, sketches) не удаляются и продолжают отвечать за весь период;
+минутные и часовые агрегаты удаляются вместе со строками журнала.
+
+Реестр партиций - таблица action_log_partitions. Запуск (например, из cron):
+    python -m app.services.retention
+"""
+import argparse
+import heapq
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, delete, func, insert, select, text, update
+from app.core.config import settings
+from app.db import models
+from app.services.action_archive import ArchiveReader, write_archive
+
+logger = logging.getLogger(__name__)
+
+ATTACHED, SEALED, ARCHIVED, DROPPED = "attached", "sealed", "archived", "dropped"
+ARCHIVE_SUFFIX = ".actlog"
+
+
+# Начало периода партиции, содержащего момент времени
+def period_start(moment: datetime, granularity: str = None) -> datetime:
+    granularity = granularity or settings.action_log_partition
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.replace(day=1) if granularity == "month" else start
+
+
+def next_period(start: datetime, granularity: str = None) -> datetime:
+    granularity = granularity or settings.action_log_partition
+    if granularity == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def partition_name(start: datetime, granularity: str = None) -> str:
+    granularity = granularity or settings.action_log_partition
+    return f"action_logs_p{start:%Y%m}" if granularity == "month" else f"action_logs_p{start:%Y%m%d}"
+
+
+# Таблица отделенной партиции SQLite (столбцы action_logs, индексы по времени и пользователю)
+def partition_table(name: str) -> Table:
+    table = Table(
+        name, MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer),
+        Column("action", String),
+        Column("timestamp", DateTime),
+    )
+    Index(f"ix_{name}_timestamp", table.c.timestamp)
+    Index(f"ix_{name}_user_id", table.c.user_id)
+    return table
+
+
+def _columns(table):
+    return [table.c.id, table.c.user_id, table.c.action, table.c.timestamp]
+
+
+def register(connection, name: str, start: datetime, end: datetime, state: str, rows: int = 0, archive_path: str = None):
+    registry = models.ActionLogPartition.__table__
+    values = {"period_start": start, "period_end": end, "state": state, "rows": rows, "archive_path": archive_path}
+    if connection.execute(update(registry).where(registry.c.name == name).values(**values)).rowcount == 0:
+        connection.execute(insert(registry).values(name=name, **values))
+
+
+def partitions(connection, states=None, start: datetime = None, end: datetime = None) -> list:
+    registry = models.ActionLogPartition.__table__
+    stmt = select(registry).order_by(registry.c.period_start)
+    if states:
+        stmt = stmt.where(registry.c.state.in_(states))
+    if start is not None:
+        stmt = stmt.where(registry.c.period_end > start)
+    if end is not None:
+        stmt = stmt.where(registry.c.period_start < end)
+    return connection.execute(stmt).all()
+
+
+def is_partitioned(connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('action_logs')"
+    )).first() is not None
+
+
+# Таблица для строк периода и число строк в ней: отделенная таблица периода, а если
+# партиция периода уже архивирована или удалена (строки пришли с опозданием) -
+# новый сегмент <имя>_<n> со своей записью в реестре и своим архивом
+def seal_target(connection, start: datetime, end: datetime):
+    existing = [p for p in partitions(connection, start=start, end=end) if p.period_start == start]
+    for partition in existing:
+        if partition.state == SEALED:
+            return partition.name, partition.rows
+    taken = {p.name for p in existing}
+    name = base = partition_name(start)
+    number = 0
+    while name in taken:
+        number += 1
+        name = f"{base}_{number}"
+    return name, 0
+
+
+# SQLite: перенос строк закончившихся периодов в отдельные таблицы
+def seal_closed_periods(connection, now: datetime) -> list:
+    from app.services.rollups import roll_up
+
+    # Переносятся только строки, уже учтенные в агрегатах
+    roll_up(connection)
+    log = models.ActionLog.__table__
+    current = period_start(now)
+    sealed = []
+    while True:
+        oldest = connection.execute(select(func.min(log.c.timestamp)).where(log.c.timestamp < current)).scalar()
+        if oldest is None:
+            return sealed
+        start = period_start(oldest)
+        end = next_period(start)
+        name, previous = seal_target(connection, start, end)
+        table = partition_table(name)
+        table.create(connection, checkfirst=True)
+        in_period = (log.c.timestamp >= start, log.c.timestamp < end)
+        moved = connection.execute(insert(table).from_select(_columns(table), select(*_columns(log)).where(*in_period))).rowcount
+        connection.execute(delete(log).where(*in_period))
+        register(connection, name, start, end, SEALED, previous + moved)
+        sealed.append(name)
+        logger.info(f"Партиция {name}: перенесено строк {moved}")
+
+
+# PostgreSQL: партиции на текущий и ближайшие периоды, закончившиеся - в реестр
+def ensure_pg_partitions(connection, now: datetime, ahead: int = None) -> list:
+    ahead = settings.action_log_partitions_ahead if ahead is None else ahead
+    start = period_start(now)
+    created = []
+    for _ in range(ahead + 1):
+        end = next_period(start)
+        name = partition_name(start)
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF action_logs "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        created.append(name)
+        start = end
+    current = period_start(now)
+    attached = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('action_logs') AND c.relname LIKE 'action_logs_p%'"
+    )).scalars().all()
+    known = {p.name for p in partitions(connection)}
+    for name in attached:
+        start = _parse_partition_name(name)
+        if name not in known and start is not None and next_period(start) <= current:
+            register(connection, name, start, next_period(start), ATTACHED)
+    return created
+
+
+def _parse_partition_name(name: str):
+    pattern = "%Y%m" if settings.action_log_partition == "month" else "%Y%m%d"
+    try:
+        return datetime.strptime(name.rsplit("_p", 1)[-1], pattern)
+    except ValueError:
+        return None
+
+
+# Свободный путь архива партиции: существующий файл может быть единственной копией строк
+def archive_path(name: str, directory: str = None) -> str:
+    base = os.path.join(directory or settings.action_log_archive_dir, name)
+    path, number = base + ARCHIVE_SUFFIX, 0
+    while os.path.exists(path):
+        number += 1
+        path = f"{base}.{number}{ARCHIVE_SUFFIX}"
+    return path
+
+
+# Удаление (и архивирование) партиций, закончившихся раньше now - срок хранения
+def expire_partitions(connection, now: datetime, mode: str = None, retention_days: int = None, directory: str = None) -> list:
+    mode = mode or settings.action_log_expire
+    retention_days = settings.action_log_retention_days if retention_days is None else retention_days
+    cutoff = now - timedelta(days=retention_days)
+    expired = []
+    for partition in partitions(connection, [SEALED, ATTACHED]):
+        if partition.period_end > cutoff:
+            continue
+        if partition.state == ATTACHED:
+            connection.execute(text(f"ALTER TABLE action_logs DETACH PARTITION {partition.name}"))
+        table = partition_table(partition.name)
+        path = None
+        if mode == "archive":
+            path = archive_path(partition.name, directory)
+            rows = write_archive(path, connection.execute(select(*_columns(table))).all())
+        else:
+            rows = connection.execute(select(func.count()).select_from(table)).scalar()
+        table.drop(connection)
+        register(connection, partition.name, partition.period_start, partition.period_end,
+                 ARCHIVED if path else DROPPED, rows, path)
+        expired.append(partition.name)
+        logger.info(f"Партиция {partition.name}: {'архивирована в ' + path if path else 'удалена'} ({rows} строк)")
+    return expired
+
+
+# Полное обслуживание: партиции текущих периодов и удаление истекших
+def maintain(connection, now: datetime = None, **expire_options) -> dict:
+    from app.services.rollups import prune
+
+    now = now or datetime.utcnow()
+    if is_partitioned(connection):
+        prepared = ensure_pg_partitions(connection, now)
+    elif connection.dialect.name == "sqlite":
+        prepared = seal_closed_periods(connection, now)
+    else:
+        prepared = []
+    expired = expire_partitions(connection, now, **expire_options)
+    # Минутные и часовые агрегаты живут столько же, сколько строки журнала
+    retention_days = expire_options.get("retention_days")
+    retention_days = settings.action_log_retention_days if retention_days is None else retention_days
+    pruned = prune(connection, now - timedelta(days=retention_days))
+    if pruned:
+        logger.info(f"Удалено минутных и часовых агрегатов: {pruned}")
+    return {"prepared": prepared, "expired": expired}
+
+
+# Строки (id, user_id, action, timestamp) периода [start, end) из основной таблицы,
+# отделенных таблиц и архивов в порядке времени; None - без ограничения,
+# user_id - только действия одного пользователя
+def read_actions(connection, start: datetime = None, end: datetime = None, end_inclusive: bool = False,
+                 user_id: int = None) -> list:
+    sources = []
+    for table in [models.ActionLog.__table__] + sealed_tables(connection, start, end):
+        filters = []
+        if start is not None:
+            filters.append(table.c.timestamp >= start)
+        if end is not None:
+            filters.append(table.c.timestamp <= end if end_inclusive else table.c.timestamp < end)
+        if user_id is not None:
+            filters.append(table.c.user_id == user_id)
+        sources.append(connection.execute(
+            select(*_columns(table)).where(*filters).order_by(table.c.timestamp.nulls_first(), table.c.id)
+        ).all())
+    archive_end = end + timedelta(microseconds=1) if end_inclusive and end is not None else end
+    for partition in partitions(connection, [ARCHIVED], start, archive_end):
+        rows = ArchiveReader(partition.archive_path).rows(start, archive_end)
+        sources.append([row for row in rows if user_id is None or row.user_id == user_id])
+    # Строки без времени (возможны только в action_logs) идут первыми
+    return list(heapq.merge(*sources, key=lambda row: (row[3] or datetime.min, row[0])))
+
+
+# Таблицы, помимо action_logs, в которых могут быть строки периода (отделенные партиции SQLite)
+def sealed_tables(connection, start: datetime, end: datetime) -> list:
+    return [partition_table(p.name) for p in partitions(connection, [SEALED], start, end)]
+
+
+# Строки архивов за период (для подсчета концов периода вне агрегатов)
+def archived_rows(connection, start: datetime, end: datetime) -> list:
+    rows = []
+    for partition in partitions(connection, [ARCHIVED], start, end):
+        rows += ArchiveReader(partition.archive_path).rows(start, end)
+    return rows
+
+
+# Строки (user_id, action, timestamp) отделенных таблиц и архивов пачками - для пересчета агрегатов
+def history_chunks(connection, chunk_size: int):
+    for partition in partitions(connection, [SEALED, ARCHIVED]):
+        if partition.state == ARCHIVED:
+            rows = [row[1:] for row in ArchiveReader(partition.archive_path).rows()]
+            for start in range(0, len(rows), chunk_size):
+                yield rows[start:start + chunk_size]
+            continue
+        table = partition_table(partition.name)
+        result = connection.execute(select(table.c.user_id, table.c.action, table.c.timestamp).where(table.c.timestamp.is_not(None)))
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+# PostgreSQL: перевод action_logs в секционированную по timestamp таблицу с переносом строк
+def convert_to_partitioned(connection, now: datetime = None):
+    if connection.dialect.name != "postgresql":
+        raise RuntimeError("Секционирование action_logs поддерживается только на PostgreSQL")
+    if is_partitioned(connection):
+        return
+    now = now or datetime.utcnow()
+    oldest = connection.execute(text("SELECT min(timestamp) FROM action_logs")).scalar() or now
+    connection.execute(text("ALTER TABLE action_logs RENAME TO action_logs_legacy"))
+    connection.execute(text("ALTER SEQUENCE action_logs_id_seq OWNED BY NONE"))
+    connection.execute(text(
+        "CREATE TABLE action_logs ("
+        "id integer NOT NULL DEFAULT nextval('action_logs_id_seq'), "
+        "user_id integer REFERENCES users (id), "
+        "action varchar, "
+        "timestamp timestamp without time zone"
+        ") PARTITION BY RANGE (timestamp)"
+    ))
+    # Строки без времени и вне созданных диапазонов
+    connection.execute(text("CREATE TABLE action_logs_default PARTITION OF action_logs DEFAULT"))
+    start = period_start(oldest)
+    while start <= period_start(now):
+        ensure_pg_partitions(connection, start, ahead=0)
+        start = next_period(start)
+    ensure_pg_partitions(connection, now)
+    connection.execute(text(
+        "INSERT INTO action_logs (id, user_id, action, timestamp) SELECT id, user_id, action, timestamp FROM action_logs_legacy"
+    ))
+    connection.execute(text("ALTER SEQUENCE action_logs_id_seq OWNED BY action_logs.id"))
+    connection.execute(text("DROP TABLE action_logs_legacy"))
+    # Индексы секционированной таблицы создаются во всех партициях
+    for name, column in (("ix_action_logs_id", "id"), ("ix_action_logs_user_id", "user_id"), ("ix_action_logs_timestamp", "timestamp")):
+        connection.execute(text(f"CREATE INDEX {name} ON action_logs ({column})"))
+
+
+def main(argv=None):
+    from sqlalchemy import create_engine
+    from app.core.config import DATABASE_URL
+
+    parser = argparse.ArgumentParser(description="Партиции и срок хранения журнала действий")
+    parser.add_argument("--url", default=DATABASE_URL)
+    parser.add_argument("--convert", action="store_true", help="PostgreSQL: перевести action_logs в секционированную таблицу")
+    parser.add_argument("--expire", choices=("archive", "drop"), default=None)
+    parser.add_argument("--retention-days", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.url)
+    try:
+        with engine.begin() as connection:
+            if args.convert:
+                convert_to_partitioned(connection)
+            result = maintain(connection, mode=args.expire, retention_days=args.retention_days)
+        logger.info(f"Подготовлено партиций: {len(result['prepared'])}, истекло: {len(result['expired'])}")
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
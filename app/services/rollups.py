@@ -0,0 +1,298 @@
+"""
+Агрегаты журнала действий (action_rollups).
+
+Для каждой минуты и часа хранится число событий по действию (user_id = NO_USER),
+для каждого дня - по паре (действие, пользователь). Агрегаты дополняются в той
+же транзакции, в которой пишутся события (см. ActionLogWriter.flush):
+обрабатываются строки action_logs с id больше водяного знака rollup_state,
+после чего знак сдвигается.
+
+Запрос за период [start, end) разбивается на выровненные интервалы: целые дни
+берутся из дневных агрегатов, края - из часовых и минутных, неполные минуты
+на концах периода и строки новее водяного знака - из самого журнала (вместе с
+отделенными партициями и архивами). Запросы по пользователю используют только
+дневные агрегаты, неполные дни на концах читаются из журнала.
+
+Минутные и часовые агрегаты старше срока хранения журнала удаляются при
+обслуживании (prune, вызывается из retention.maintain); края таких периодов
+также читаются из журнала и архивов, дневные агрегаты хранятся всегда.
+
+Вместе с агрегатами дополняются дневные вероятностные сводки (уникальные
+пользователи и частые действия, см. app/services/sketches.py).
+
+Построение агрегатов по существующей истории:
+    python -m app.services.rollups --rebuild
+"""
+import argparse
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.db import models
+from app.services.ingest import chunked
+from app.services.retention import archived_rows, history_chunks, sealed_tables
+from app.services.sketches import update_sketches
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = "action_logs"
+GRANULARITIES = ("minute", "hour", "day")
+STEPS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+NO_ACTION = ""
+NO_USER = 0
+ROLLUP_KEY = ("granularity", "bucket_start", "action", "user_id")
+CHUNK_SIZE = 50000
+UPSERT_BATCH_SIZE = 500
+
+
+# Начало интервала, в который попадает момент времени
+def truncate(moment: datetime, granularity: str) -> datetime:
+    moment = moment.replace(second=0, microsecond=0)
+    if granularity in ("hour", "day"):
+        moment = moment.replace(minute=0)
+    if granularity == "day":
+        moment = moment.replace(hour=0)
+    return moment
+
+
+# Начало первого интервала, который начинается не раньше момента времени
+def ceil(moment: datetime, granularity: str) -> datetime:
+    start = truncate(moment, granularity)
+    return start if start == moment else start + STEPS[granularity]
+
+
+# Минутные и часовые счетчики - по действию, дневные - по действию и пользователю
+def aggregate(rows) -> Counter:
+    counts = Counter()
+    for user_id, action, timestamp in rows:
+        action = action or NO_ACTION
+        counts[("minute", truncate(timestamp, "minute"), action, NO_USER)] += 1
+        counts[("hour", truncate(timestamp, "hour"), action, NO_USER)] += 1
+        counts[("day", truncate(timestamp, "day"), action, user_id or NO_USER)] += 1
+    return counts
+
+
+# Прибавление счетчиков к агрегатам (INSERT ... ON CONFLICT DO UPDATE пачками)
+def upsert_counts(connection, counts: Counter):
+    table = models.ActionRollup.__table__
+    rows = [dict(zip(ROLLUP_KEY, key), count=count) for key, count in counts.items()]
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(connection.dialect.name)
+    if dialect is None:
+        # Для остальных СУБД - обновление существующей строки или вставка новой
+        for row in rows:
+            criteria = [table.c[column] == row[column] for column in ROLLUP_KEY]
+            result = connection.execute(update(table).where(*criteria).values(count=table.c.count + row["count"]))
+            if result.rowcount == 0:
+                connection.execute(insert(table).values(**row))
+        return
+    for batch in chunked(rows, UPSERT_BATCH_SIZE):
+        stmt = dialect.insert(table).values(batch)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=list(ROLLUP_KEY),
+            set_={"count": table.c.count + stmt.excluded["count"]},
+        ))
+
+
+# Водяной знак с блокировкой строки до конца транзакции: на PostgreSQL
+# транзакции, пишущие журнал, выполняются по очереди, и id новых строк
+# не может оказаться меньше уже учтенного (SQLite и так допускает одного писателя)
+def lock_watermark(connection) -> int:
+    state = models.RollupState.__table__
+    last_id = connection.execute(
+        select(state.c.last_id).where(state.c.name == ROLLUP_NAME).with_for_update()
+    ).scalar()
+    if last_id is None:
+        connection.execute(insert(state).values(name=ROLLUP_NAME, last_id=0))
+        return 0
+    return last_id
+
+
+def get_watermark(connection) -> int:
+    state = models.RollupState.__table__
+    last_id = connection.execute(select(state.c.last_id).where(state.c.name == ROLLUP_NAME)).scalar()
+    return last_id or 0
+
+
+# Учет в агрегатах строк журнала новее водяного знака; возвращает число учтенных строк
+def roll_up(connection, chunk_size: int = CHUNK_SIZE) -> int:
+    log = models.ActionLog.__table__
+    state = models.RollupState.__table__
+    last_id = lock_watermark(connection)
+    total = 0
+    while True:
+        rows = connection.execute(
+            select(log.c.id, log.c.user_id, log.c.action, log.c.timestamp)
+            .where(log.c.id > last_id, log.c.timestamp.is_not(None))
+            .order_by(log.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        upsert_counts(connection, aggregate(row[1:] for row in rows))
+        update_sketches(connection, [row[1:] for row in rows])
+        last_id = rows[-1].id
+        total += len(rows)
+        connection.execute(update(state).where(state.c.name == ROLLUP_NAME).values(last_id=last_id))
+        if len(rows) < chunk_size:
+            break
+    return total
+
+
+# Пересчет агрегатов и сводок по всей истории журнала
+def rebuild(connection, chunk_size: int = CHUNK_SIZE) -> int:
+    state = models.RollupState.__table__
+    lock_watermark(connection)
+    connection.execute(delete(models.ActionRollup.__table__))
+    connection.execute(delete(models.ActionSketch.__table__))
+    connection.execute(update(state).where(state.c.name == ROLLUP_NAME).values(last_id=0))
+    # Строки отделенных партиций и архивов (удаленные партиции восстановить нельзя)
+    total = 0
+    for rows in history_chunks(connection, chunk_size):
+        upsert_counts(connection, aggregate(rows))
+        update_sketches(connection, rows)
+        total += len(rows)
+    return total + roll_up(connection, chunk_size)
+
+
+# Разбиение периода [start, end) на куски журнала и выровненные интервалы агрегатов
+# не мельче finest ("minute" или "day")
+def period_plan(start: datetime, end: datetime, finest: str = "minute"):
+    low, high = ceil(start, finest), truncate(end, finest)
+    if low >= high:
+        return [(start, end)] if start < end else [], []
+    raw = [(a, b) for a, b in ((start, low), (high, end)) if a < b]
+    buckets = []
+    levels = GRANULARITIES[GRANULARITIES.index(finest):]
+    for granularity, coarser in zip(levels, levels[1:] + (None,)):
+        inner_low = ceil(low, coarser) if coarser else high
+        inner_high = truncate(high, coarser) if coarser else high
+        if coarser is None or inner_low >= inner_high:
+            buckets.append((granularity, low, high))
+            break
+        buckets += [(granularity, a, b) for a, b in ((low, inner_low), (inner_high, high)) if a < b]
+        low, high = inner_low, inner_high
+    return raw, buckets
+
+
+# Начало дня, с которого хранятся минутные и часовые агрегаты (None - их нет)
+def fine_since(db):
+    first = db.execute(
+        select(func.min(models.ActionRollup.bucket_start)).where(models.ActionRollup.granularity == "hour")
+    ).scalar()
+    return truncate(first, "day") if first is not None else None
+
+
+# План запроса с учетом доступных агрегатов: для запросов по пользователю и для
+# дней до fine_since - только дневные агрегаты, края из журнала
+def query_plan(db, start: datetime, end: datetime, by_user: bool):
+    boundary = None if by_user else fine_since(db)
+    parts = []
+    if boundary is None or start < boundary:
+        parts.append(period_plan(start, end if boundary is None else min(end, boundary), "day"))
+    if boundary is not None and end > boundary:
+        parts.append(period_plan(max(start, boundary), end))
+    return [r for raw, _ in parts for r in raw], [b for _, buckets in parts for b in buckets]
+
+
+# Число действий за период с группировкой по "action" или "user_id" (None - общее число)
+def count_by_period(db, start: datetime, end: datetime, group_by: str = None,
+                    action: str = None, user_id: int = None) -> dict:
+    rollup = models.ActionRollup
+    raw, buckets = query_plan(db, start, end, by_user=user_id is not None or group_by == "user_id")
+    counts = Counter()
+
+    def add(stmt, key_column):
+        if key_column is not None:
+            stmt = stmt.add_columns(key_column).group_by(key_column)
+        for row in db.execute(stmt):
+            if row[0]:
+                counts[row[1] if key_column is not None else None] += row[0]
+
+    # Фильтры и ключ группировки для таблицы с колонками журнала
+    def raw_query(table, *criteria):
+        filters = list(criteria)
+        if action is not None:
+            filters.append(table.c.action == action)
+        if user_id is not None:
+            filters.append(table.c.user_id == user_id)
+        keys = {"action": func.coalesce(table.c.action, NO_ACTION), "user_id": func.coalesce(table.c.user_id, NO_USER)}
+        return select(func.count()).select_from(table).where(*filters), keys[group_by] if group_by else None
+
+    # Концы периода: основная таблица, отделенные партиции и архивы
+    log = models.ActionLog.__table__
+    for a, b in raw:
+        for table in [log] + sealed_tables(db, a, b):
+            add(*raw_query(table, table.c.timestamp >= a, table.c.timestamp < b))
+        for row in archived_rows(db, a, b):
+            if (action is not None and row.action != action) or (user_id is not None and row.user_id != user_id):
+                continue
+            counts[{"action": row.action or NO_ACTION, "user_id": row.user_id or NO_USER}.get(group_by)] += 1
+
+    rollup_filters = []
+    if action is not None:
+        rollup_filters.append(rollup.action == action)
+    if user_id is not None:
+        rollup_filters.append(rollup.user_id == user_id)
+    rollup_key = getattr(rollup, group_by) if group_by else None
+    for granularity, a, b in buckets:
+        add(select(func.sum(rollup.count)).where(
+            rollup.granularity == granularity, rollup.bucket_start >= a, rollup.bucket_start < b, *rollup_filters,
+        ), rollup_key)
+    if buckets:
+        # Строки журнала, еще не учтенные в агрегатах (они всегда в основной таблице).
+        # Первым может идти верхний край периода, поэтому границы - минимум и максимум по всем интервалам
+        low, high = min(a for _, a, _ in buckets), max(b for _, _, b in buckets)
+        add(*raw_query(log, log.c.id > get_watermark(db), log.c.timestamp >= low, log.c.timestamp < high))
+    return dict(counts)
+
+
+# Удаление минутных и часовых агрегатов за дни до before; возвращает число удаленных строк
+def prune(connection, before: datetime) -> int:
+    table = models.ActionRollup.__table__
+    result = connection.execute(delete(table).where(
+        table.c.granularity.in_(("minute", "hour")), table.c.bucket_start < truncate(before, "day"),
+    ))
+    return result.rowcount
+
+
+def count_actions(db, start: datetime, end: datetime, action: str = None, user_id: int = None) -> int:
+    return count_by_period(db, start, end, action=action, user_id=user_id).get(None, 0)
+
+
+# Общее число событий: сумма дневных агрегатов и строки новее водяного знака
+def total_count(db) -> int:
+    rolled = db.execute(
+        select(func.sum(models.ActionRollup.count)).where(models.ActionRollup.granularity == "day")
+    ).scalar() or 0
+    tail = db.execute(
+        select(func.count()).select_from(models.ActionLog).where(models.ActionLog.id > get_watermark(db))
+    ).scalar()
+    return rolled + tail
+
+
+def main(argv=None):
+    from sqlalchemy import create_engine
+    from app.core.config import DATABASE_URL
+
+    parser = argparse.ArgumentParser(description="Агрегаты журнала действий пользователей")
+    parser.add_argument("--url", default=DATABASE_URL)
+    parser.add_argument("--rebuild", action="store_true", help="Пересчитать агрегаты по всей истории")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.url)
+    try:
+        with engine.begin() as connection:
+            if args.rebuild:
+                done = rebuild(connection, args.chunk_size)
+            else:
+                done = roll_up(connection, args.chunk_size)
+        logger.info(f"Учтено в агрегатах строк журнала: {done}")
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,192 @@
+"""
+Загрузка фотографий команд и игроков со страниц поиска.
+
+Запросы выполняются параллельно с ограничением общего числа одновременных
+запросов (семафор) и частоты запросов к одному хосту. Ответы сохраняются в
+дисковый кэш по хэшу URL вместе с ETag/Last-Modified, и повторные запросы
+отправляются условными (If-None-Match/If-Modified-Since): при ответе 304 берется
+тело из кэша. Временные ошибки (сеть, таймаут, 429, 5xx) повторяются с
+экспоненциальной задержкой.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Optional
+from urllib.parse import quote_plus, urlsplit
+import aiohttp
+from bs4 import BeautifulSoup, SoupStrainer
+from app.core.config import settings
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PATH = "/schnellsuche/ergebnis/schnellsuche?query={query}"
+TEAM_PHOTO_CLASS = "vereinprofil_tooltip"
+PLAYER_PHOTO_CLASS = "spielprofil_tooltip"
+USER_AGENT = "Mozilla/5.0"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Ограничение частоты запросов к каждому хосту: между двумя запросами
+    к одному хосту проходит не меньше 1 / rate секунд.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = {}
+        self._locks = {}
+
+    async def wait(self, host: str):
+        if not self.interval:
+            return
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            delay = self._next.get(host, now) - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next[host] = max(now, self._next.get(host, now)) + self.interval
+
+
+class ResponseCache:
+    """
+    Дисковый кэш ответов: тело и метаданные (ETag, Last-Modified) по sha256 от URL.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str, suffix: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + suffix)
+
+    def get(self, url: str):
+        try:
+            with open(self._path(url, ".json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self._path(url, ".body"), "rb") as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None
+
+    def set(self, url: str, body: bytes, etag: Optional[str], last_modified: Optional[str]):
+        meta = {"url": url, "etag": etag, "last_modified": last_modified, "fetched_at": time.time()}
+        # Тело пишется первым: метаданные без тела не считаются записью кэша
+        body_path = self._path(url, ".body")
+        with open(body_path + ".tmp", "wb") as f:
+            f.write(body)
+        os.replace(body_path + ".tmp", body_path)
+        meta_path = self._path(url, ".json")
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+
+# Поиск ссылки на изображение в блоке с заданным классом.
+# SoupStrainer разбирает только нужные блоки, а не весь документ.
+def extract_image(html: str, css_class: str) -> Optional[str]:
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer("div", class_=css_class))
+    image_tag = soup.find("img")
+    return image_tag.get("src") if image_tag else None
+
+
+class Scraper:
+    """
+    Асинхронный клиент для загрузки страниц поиска и извлечения фотографий.
+    Используется как асинхронный контекстный менеджер.
+    """
+
+    def __init__(self, base_url: str = None, cache_dir: str = None, concurrency: int = None,
+                 rate_per_host: float = None, retries: int = None, backoff: float = None, timeout: float = None):
+        self.base_url = (base_url or settings.scraper_base_url).rstrip("/")
+        self.cache = ResponseCache(cache_dir or settings.scraper_cache_dir)
+        self.retries = settings.scraper_retries if retries is None else retries
+        self.backoff = settings.scraper_backoff if backoff is None else backoff
+        self.timeout = settings.scraper_timeout if timeout is None else timeout
+        self._semaphore = asyncio.Semaphore(concurrency or settings.scraper_concurrency)
+        self._limiter = RateLimiter(settings.scraper_rate_per_host if rate_per_host is None else rate_per_host)
+        self._session = None
+        self.stats = {"requests": 0, "revalidated": 0, "retries": 0, "failures": 0}
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            headers={"User-Agent": USER_AGENT}, timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    # Загрузка страницы с учетом кэша; None - если страницу получить не удалось
+    async def fetch(self, url: str) -> Optional[str]:
+        cached = self.cache.get(url)
+        headers = {}
+        if cached:
+            meta, _ = cached
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        host = urlsplit(url).netloc
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                await self._limiter.wait(host)
+                self.stats["requests"] += 1
+                try:
+                    async with self._session.get(url, headers=headers) as response:
+                        if response.status == 304 and cached:
+                            self.stats["revalidated"] += 1
+                            return cached[1].decode("utf-8", errors="replace")
+                        if response.status in RETRY_STATUSES:
+                            continue
+                        if response.status != 200:
+                            logger.warning(f"Страница {url} вернула статус {response.status}")
+                            break
+                        body = await response.read()
+                        self.cache.set(url, body, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                        return body.decode(response.get_encoding() or "utf-8", errors="replace")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Ошибка запроса {url} (попытка {attempt + 1}): {e}")
+
+        self.stats["failures"] += 1
+        # При недоступном источнике лучше устаревшая копия, чем ничего
+        return cached[1].decode("utf-8", errors="replace") if cached else None
+
+    def search_url(self, query: str) -> str:
+        return self.base_url + SEARCH_PATH.format(query=quote_plus(query))
+
+    async def find_photo(self, query: str, css_class: str) -> Optional[str]:
+        html = await self.fetch(self.search_url(query))
+        if html is None:
+            return None
+        return extract_image(html, css_class)
+
+    async def team_photo(self, team_name: str) -> Optional[str]:
+        return await self.find_photo(team_name, TEAM_PHOTO_CLASS)
+
+    async def player_photo(self, player_name: str) -> Optional[str]:
+        return await self.find_photo(player_name, PLAYER_PHOTO_CLASS)
+
+
+# Дополнение пачки строк ссылками на фотографии; запросы пачки выполняются параллельно
+def photo_enricher(find_photo):
+    async def enrich(batch):
+        photos = await asyncio.gather(*(find_photo(row["name"]) for row in batch))
+        for row, url_photo in zip(batch, photos):
+            row["url_photo"] = url_photo
+        return batch
+    return enrich
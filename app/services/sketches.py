@@ -0,0 +1,265 @@
+"""
+Вероятностные сводки журнала действий по дням (action_sketches).
+
+- HyperLogLog - число различных пользователей (ошибка около 1.04 / sqrt(2^precision),
+  для precision=12 - около 1.6%, 4 КиБ на день до сжатия).
+- HeavyHitters - самые частые действия: Count-Min sketch (оценка числа событий
+  сверху, ошибка не больше e / width от общего числа событий с вероятностью
+  1 - e^-depth) и ограниченный список кандидатов с наибольшими оценками.
+
+Обе сводки объединяются без потери точности: "уникальные пользователи за месяц" -
+объединение дневных HyperLogLog, "топ действий за период" - сумма дневных Count-Min.
+Сводки дополняются вместе с агрегатами (см. rollups.roll_up) и хранятся
+сжатыми (zlib) в одной строке на день и вид сводки.
+"""
+import hashlib
+import json
+import math
+import struct
+import zlib
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.db import models
+
+HLL_PRECISION = 12
+CMS_WIDTH = 1024
+CMS_DEPTH = 4
+TOPK_CAPACITY = 64
+
+USERS = "users_hll"
+ACTIONS = "actions_topk"
+
+# 2^-r для всех возможных значений регистра HyperLogLog
+_POWERS = [2.0 ** -rank for rank in range(66)]
+
+
+def _hash(value, size: int = 8) -> int:
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=size).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    Оценка числа различных значений. Регистр хранит максимальный ранг
+    (позицию первой единицы) хэшей, попавших в него.
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: bytearray = None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    def add(self, value):
+        x = _hash(value)
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, *others) -> "HyperLogLog":
+        if not others:
+            return self
+        self.registers = bytearray(map(max, self.registers, *(other.registers for other in others)))
+        return self
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        histogram = [self.registers.count(rank) for rank in range(max(self.registers) + 1)]
+        estimate = alpha * m * m / sum(n * _POWERS[rank] for rank, n in enumerate(histogram))
+        # Малые значения: линейный подсчет по пустым регистрам
+        if estimate <= 2.5 * m and histogram[0]:
+            estimate = m * math.log(m / histogram[0])
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes([self.precision]) + bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        raw = zlib.decompress(data)
+        return cls(raw[0], bytearray(raw[1:]))
+
+
+class CountMinSketch:
+    """
+    Таблица depth x width счетчиков; оценка значения - минимум по строкам.
+    """
+
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH, table: array = None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else array("Q", bytes(8 * width * depth))
+
+    def _indexes(self, item):
+        # Двойное хэширование: h1 + i * h2 для каждой строки
+        x = _hash(item, 16)
+        h1, h2 = x >> 64, (x & (2 ** 64 - 1)) | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, item, count: int = 1):
+        for index in self._indexes(item):
+            self.table[index] += count
+
+    def estimate(self, item) -> int:
+        return min(self.table[index] for index in self._indexes(item))
+
+    def merge(self, *others):
+        if any((self.width, self.depth) != (other.width, other.depth) for other in others):
+            raise ValueError("Размеры Count-Min sketch не совпадают")
+        if others:
+            self.table = array("Q", map(sum, zip(self.table, *(other.table for other in others))))
+
+
+class HeavyHitters:
+    """
+    Самые частые значения: Count-Min sketch и до capacity кандидатов с наибольшей оценкой.
+    """
+
+    def __init__(self, capacity: int = TOPK_CAPACITY, sketch: CountMinSketch = None, candidates=()):
+        self.capacity = capacity
+        self.sketch = sketch or CountMinSketch()
+        self.candidates = set(candidates)
+        self.total = 0
+
+    # Лишние кандидаты отбрасываются пачкой, когда их становится вдвое больше capacity
+    def _trim(self, limit: int = None):
+        if len(self.candidates) > (limit or 2 * self.capacity):
+            ranked = sorted(self.candidates, key=self.sketch.estimate, reverse=True)
+            self.candidates = set(ranked[:self.capacity])
+
+    def add(self, item, count: int = 1):
+        self.sketch.add(item, count)
+        self.total += count
+        self.candidates.add(item)
+        self._trim()
+
+    def merge(self, *others) -> "HeavyHitters":
+        self.sketch.merge(*(other.sketch for other in others))
+        for other in others:
+            self.total += other.total
+            self.candidates |= other.candidates
+        self._trim()
+        return self
+
+    def top(self, limit: int) -> list:
+        ranked = sorted(((item, self.sketch.estimate(item)) for item in self.candidates), key=lambda pair: (-pair[1], pair[0]))
+        return ranked[:limit]
+
+    def to_bytes(self) -> bytes:
+        self._trim(self.capacity)
+        header = json.dumps({
+            "capacity": self.capacity, "width": self.sketch.width, "depth": self.sketch.depth,
+            "total": self.total, "candidates": sorted(self.candidates),
+        }).encode()
+        return zlib.compress(struct.pack(">I", len(header)) + header + self.sketch.table.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HeavyHitters":
+        raw = zlib.decompress(data)
+        size = struct.unpack(">I", raw[:4])[0]
+        header = json.loads(raw[4:4 + size])
+        table = array("Q")
+        table.frombytes(raw[4 + size:])
+        sketch = CountMinSketch(header["width"], header["depth"], table)
+        hitters = cls(header["capacity"], sketch, header["candidates"])
+        hitters.total = header["total"]
+        return hitters
+
+
+KINDS = {USERS: HyperLogLog, ACTIONS: HeavyHitters}
+
+
+def day_start(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# Дни, пересекающиеся с периодом [start, end): [первый день, день после последнего)
+def day_range(start: datetime, end: datetime):
+    last = day_start(end)
+    return day_start(start), last if last == end else last + timedelta(days=1)
+
+
+def add_rows(users: HyperLogLog, actions: HeavyHitters, rows):
+    for user_id, action in rows:
+        if user_id is not None:
+            users.add(user_id)
+        actions.add(action or "")
+
+
+def load_sketches(connection, start: datetime, end: datetime) -> dict:
+    table = models.ActionSketch.__table__
+    result = connection.execute(
+        select(table.c.bucket_start, table.c.kind, table.c.data)
+        .where(table.c.bucket_start >= start, table.c.bucket_start < end)
+    )
+    sketches = {}
+    for bucket_start, kind, data in result:
+        sketches[(bucket_start, kind)] = KINDS[kind].from_bytes(data)
+    return sketches
+
+
+def save_sketches(connection, sketches: dict):
+    table = models.ActionSketch.__table__
+    rows = [{"bucket_start": day, "kind": kind, "data": sketch.to_bytes()} for (day, kind), sketch in sketches.items()]
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(connection.dialect.name)
+    if dialect is None:
+        for row in rows:
+            criteria = [table.c.bucket_start == row["bucket_start"], table.c.kind == row["kind"]]
+            if connection.execute(update(table).where(*criteria).values(data=row["data"])).rowcount == 0:
+                connection.execute(insert(table).values(**row))
+        return
+    for row in rows:
+        stmt = dialect.insert(table).values(**row)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=["bucket_start", "kind"], set_={"data": stmt.excluded.data},
+        ))
+
+
+# Добавление строк журнала (user_id, action, timestamp) в сводки их дней
+def update_sketches(connection, rows):
+    by_day = defaultdict(list)
+    for user_id, action, timestamp in rows:
+        by_day[day_start(timestamp)].append((user_id, action))
+    if not by_day:
+        return
+    first, last = min(by_day), max(by_day)
+    stored = load_sketches(connection, first, last + timedelta(days=1))
+    changed = {}
+    for day, day_rows in by_day.items():
+        users = changed[(day, USERS)] = stored.get((day, USERS)) or HyperLogLog()
+        actions = changed[(day, ACTIONS)] = stored.get((day, ACTIONS)) or HeavyHitters()
+        add_rows(users, actions, day_rows)
+    save_sketches(connection, changed)
+
+
+# Объединенные сводки за дни, пересекающиеся с периодом [start, end), вместе со строками новее водяного знака
+def period_sketches(db, start: datetime, end: datetime):
+    from app.services.rollups import get_watermark
+
+    start, end = day_range(start, end)
+    stored = load_sketches(db, start, end)
+    users = HyperLogLog().merge(*(s for (_, kind), s in stored.items() if kind == USERS))
+    actions = HeavyHitters().merge(*(s for (_, kind), s in stored.items() if kind == ACTIONS))
+    log = models.ActionLog
+    tail = db.execute(
+        select(log.user_id, log.action)
+        .where(log.id > get_watermark(db), log.timestamp >= start, log.timestamp < end)
+    )
+    add_rows(users, actions, tail)
+    return users, actions
+
+
+# Приблизительное число различных пользователей за дни периода
+def distinct_users(db, start: datetime, end: datetime) -> int:
+    users, _ = period_sketches(db, start, end)
+    return users.count()
+
+
+# Самые частые действия за дни периода: [(действие, оценка числа событий), ...]
+def top_actions(db, start: datetime, end: datetime, limit: int = 20) -> list:
+    _, actions = period_sketches(db, start, end)
+    return actions.top(limit)
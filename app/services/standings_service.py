@@ -0,0 +1,176 @@
+import logging
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, contains_eager, joinedload
+from app.db import models
+from app.services.load_profiles import load_options
+
+logger = logging.getLogger(__name__)
+
+# Очки за результат матча
+POINTS = {"W": 3, "D": 1, "L": 0}
+# Сколько последних результатов хранится в поле form
+FORM_LENGTH = 5
+# Порядок строк турнирной таблицы (совпадает с индексом ix_standings_table_order)
+TABLE_ORDER = (
+    models.Standing.points.desc(),
+    models.Standing.goal_difference.desc(),
+    models.Standing.goals_for.desc(),
+)
+
+
+# Результаты матча для хозяев и гостей, None - если матч еще не сыгран
+def match_outcome(home_score, away_score):
+    if home_score is None or away_score is None:
+        return None
+    if home_score > away_score:
+        return "W", "L"
+    if home_score < away_score:
+        return "L", "W"
+    return "D", "D"
+
+
+# Пустая строка таблицы для команды
+def new_standing(team_id: int) -> models.Standing:
+    return models.Standing(
+        team_id=team_id, played=0, won=0, drawn=0, lost=0,
+        goals_for=0, goals_against=0, goal_difference=0, points=0, form="",
+    )
+
+
+def _get_or_create(db: Session, team_id: int) -> models.Standing:
+    standing = db.get(models.Standing, team_id)
+    if standing is None:
+        standing = new_standing(team_id)
+        db.add(standing)
+    return standing
+
+
+# Учет результата матча в таблице: sign=1 - добавить, sign=-1 - отменить.
+# Изменяются только строки двух команд матча, остальные матчи не читаются.
+def apply_result(db: Session, home_team_id: int, away_team_id: int, home_score, away_score, sign: int = 1):
+    outcome = match_outcome(home_score, away_score)
+    if outcome is None:
+        return
+    sides = (
+        (home_team_id, home_score, away_score, outcome[0]),
+        (away_team_id, away_score, home_score, outcome[1]),
+    )
+    for team_id, scored, conceded, result in sides:
+        standing = _get_or_create(db, team_id)
+        standing.played += sign
+        standing.won += sign * (result == "W")
+        standing.drawn += sign * (result == "D")
+        standing.lost += sign * (result == "L")
+        standing.goals_for += sign * scored
+        standing.goals_against += sign * conceded
+        standing.goal_difference = standing.goals_for - standing.goals_against
+        standing.points += sign * POINTS[result]
+        # Поле Team.points отображается в шаблонах, поддерживаем его в актуальном состоянии
+        team = db.get(models.Team, team_id)
+        if team is not None:
+            team.points = standing.points
+
+
+# Пересчет формы команды по последним сыгранным матчам (не больше FORM_LENGTH строк)
+def refresh_form(db: Session, team_id: int):
+    recent = db.execute(
+        select(models.Match.home_team_id, models.Match.home_score, models.Match.away_score)
+        .where(
+            or_(models.Match.home_team_id == team_id, models.Match.away_team_id == team_id),
+            models.Match.home_score.is_not(None),
+            models.Match.away_score.is_not(None),
+        )
+        .order_by(models.Match.date.desc())
+        .limit(FORM_LENGTH)
+    ).all()
+    form = ""
+    for home_team_id, home_score, away_score in recent:
+        home_result, away_result = match_outcome(home_score, away_score)
+        form += home_result if home_team_id == team_id else away_result
+    _get_or_create(db, team_id).form = form
+
+
+# Обновление формы команд, затронутых изменением матчей
+def refresh_forms(db: Session, *team_ids: int):
+    db.flush()
+    for team_id in set(team_ids):
+        refresh_form(db, team_id)
+
+
+# Полный пересчет таблицы по всем матчам (для заполнения и исправления данных)
+def rebuild_standings(db: Session):
+    db.query(models.Standing).delete()
+    standings = {team_id: new_standing(team_id) for team_id in db.scalars(select(models.Team.id))}
+    forms = {team_id: [] for team_id in standings}
+    matches = db.execute(
+        select(models.Match.home_team_id, models.Match.away_team_id, models.Match.home_score, models.Match.away_score)
+        .order_by(models.Match.date.desc())
+    )
+    for home_team_id, away_team_id, home_score, away_score in matches:
+        outcome = match_outcome(home_score, away_score)
+        if outcome is None:
+            continue
+        for team_id, scored, conceded, result in (
+            (home_team_id, home_score, away_score, outcome[0]),
+            (away_team_id, away_score, home_score, outcome[1]),
+        ):
+            standing = standings[team_id]
+            standing.played += 1
+            standing.won += result == "W"
+            standing.drawn += result == "D"
+            standing.lost += result == "L"
+            standing.goals_for += scored
+            standing.goals_against += conceded
+            standing.points += POINTS[result]
+            if len(forms[team_id]) < FORM_LENGTH:
+                forms[team_id].append(result)
+    for team_id, standing in standings.items():
+        standing.goal_difference = standing.goals_for - standing.goals_against
+        standing.form = "".join(forms[team_id])
+        db.add(standing)
+        db.query(models.Team).filter(models.Team.id == team_id).update(
+            {models.Team.points: standing.points}, synchronize_session=False
+        )
+    db.commit()
+    logger.info(f"Турнирная таблица пересчитана для {len(standings)} команд.")
+    return len(standings)
+
+
+# Запрос лучших команд: читает индекс ix_standings_table_order и останавливается на limit строках
+def top_teams_query(limit: int = 10):
+    return (
+        select(models.Team)
+        .join(models.Team.standing)
+        .options(contains_eager(models.Team.standing), *load_options(models.Team, "detail"))
+        .order_by(*TABLE_ORDER)
+        .limit(limit)
+    )
+
+
+# Турнирная таблица целиком
+def get_standings(db: Session):
+    return db.query(models.Standing).options(joinedload(models.Standing.team)).order_by(*TABLE_ORDER).all()
+
+
+# --- Асинхронные версии для обработчиков FastAPI ---
+
+# Турнирная таблица целиком
+async def get_standings_async(db: AsyncSession):
+    result = await db.scalars(
+        select(models.Standing).options(joinedload(models.Standing.team)).order_by(*TABLE_ORDER)
+    )
+    return result.all()
+
+# Лучшие команды по таблице, с игроками для страницы аналитики
+async def get_top_teams_async(db: AsyncSession, limit: int = 10):
+    result = await db.scalars(top_teams_query(limit))
+    return result.all()
+
+
+if __name__ == "__main__":
+    from app.db.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    with SessionLocal() as session:
+        rebuild_standings(session)
@@ -0,0 +1,376 @@
+"""
+Статистика сезона на столбцах NumPy.
+
+Матчи (home_team_id, away_team_id, home_score, away_score, date) и голы
+(match_id, player_id, minute) читаются из базы один раз - одним запросом на
+таблицу - и хранятся отдельными массивами. Турнирная таблица, показатели
+команд дома и в гостях и бомбардиры считаются группировкой по массивам
+(np.bincount, np.lexsort) без цикла по матчам в Python, поэтому пересчет по
+уже загруженным данным занимает доли секунды даже для миллиона матчей.
+
+Загрузка из базы на порядок дороже расчета, поэтому season_stats держит
+SeasonData в кэше по периоду (start, end). Сервисы сбрасывают кэш после записи
+матчей, голов и команд (invalidate_season_data), изменения из других процессов
+видны не позже чем через SEASON_DATA_CACHE_TTL.
+
+Результат совпадает с standings_service.rebuild_standings (очки, разница
+мячей, форма), порядок строк - TABLE_ORDER, при равенстве - по team_id.
+
+Таблица по базе и сравнение с циклом по ORM на синтетических данных:
+    python -m app.services.stats_engine
+    python -m app.services.stats_engine --benchmark --matches 1000000
+"""
+import argparse
+import logging
+import time
+from datetime import datetime
+import numpy as np
+from sqlalchemy import select
+from app.core.config import settings
+from app.db import models
+from app.services.cache import TTLCache
+from app.services.standings_service import FORM_LENGTH, POINTS
+
+logger = logging.getLogger(__name__)
+
+# Загруженные столбцы сезона по периоду (start, end)
+season_data_cache = TTLCache(maxsize=settings.season_data_cache_size, ttl=settings.season_data_cache_ttl)
+
+NO_SCORE = -1
+# Коды результатов: индекс в RESULTS, очки - в RESULT_POINTS
+RESULTS = np.array(["W", "D", "L"])
+WIN, DRAW, LOSS = range(3)
+RESULT_POINTS = np.array([POINTS[result] for result in RESULTS])
+SIDES = ("home", "away")
+
+
+def _column(values, dtype) -> np.ndarray:
+    return np.fromiter(values, dtype=dtype, count=len(values))
+
+
+def _scores(values) -> np.ndarray:
+    return np.fromiter((NO_SCORE if value is None else value for value in values), dtype=np.int64, count=len(values))
+
+
+class SeasonData:
+    """
+    Столбцы матчей и голов. Команды пронумерованы подряд (team_ids[i] - id
+    команды с номером i), ссылки голов на матчи - номера строк матчей.
+    """
+
+    def __init__(self, match_ids, home_team_ids, away_team_ids, home_scores, away_scores, dates,
+                 goal_match_ids=(), goal_player_ids=(), goal_minutes=(), team_ids=()):
+        # Матчи хранятся от новых к старым: форма команды - первые ее матчи в этом порядке
+        dates = np.asarray(dates, dtype="datetime64[us]")
+        order = np.argsort(-dates.astype(np.int64), kind="stable")
+        self.match_ids = np.asarray(match_ids, dtype=np.int64)[order]
+        self.home_scores = np.asarray(home_scores, dtype=np.int64)[order]
+        self.away_scores = np.asarray(away_scores, dtype=np.int64)[order]
+        self.dates = dates[order]
+        # Команды без матчей тоже попадают в таблицу (как в rebuild_standings)
+        team_ids = np.asarray(team_ids, dtype=np.int64)
+        self.team_ids, teams = np.unique(
+            np.concatenate([team_ids, np.asarray(home_team_ids, dtype=np.int64)[order],
+                            np.asarray(away_team_ids, dtype=np.int64)[order]]),
+            return_inverse=True,
+        )
+        # Самый узкий тип номеров: устойчивая сортировка по нему - поразрядная
+        teams = teams.astype(np.min_scalar_type(max(len(self.team_ids) - 1, 0)))
+        self.home = teams[len(team_ids):len(team_ids) + len(order)]
+        self.away = teams[len(team_ids) + len(order):]
+
+        # Голы: номер строки матча и номер игрока; голы матчей вне выборки отбрасываются
+        goal_match_ids = np.asarray(goal_match_ids, dtype=np.int64)
+        by_id = np.argsort(self.match_ids)
+        position = np.searchsorted(self.match_ids, goal_match_ids, sorter=by_id).clip(max=max(len(by_id) - 1, 0))
+        known = self.match_ids[by_id[position]] == goal_match_ids if len(by_id) else np.zeros(len(goal_match_ids), bool)
+        goal_matches = by_id[position[known]]
+        self.player_ids, goal_players = np.unique(np.asarray(goal_player_ids, dtype=np.int64)[known], return_inverse=True)
+        # Голы упорядочены по игроку и матчу: матчи игрока считаются по соседним строкам
+        goals_order = np.lexsort((goal_matches, goal_players))
+        self.goal_matches = goal_matches[goals_order]
+        self.goal_players = goal_players[goals_order]
+        self.goal_minutes = np.asarray(goal_minutes, dtype=np.int64)[known][goals_order]
+
+    @property
+    def teams_count(self) -> int:
+        return len(self.team_ids)
+
+    # Сыгранные матчи: у обоих счетов есть значение
+    @property
+    def played(self) -> np.ndarray:
+        return (self.home_scores != NO_SCORE) & (self.away_scores != NO_SCORE)
+
+    # Загрузка матчей периода [start, end) и их голов; None - без ограничения
+    @classmethod
+    def load(cls, db, start: datetime = None, end: datetime = None) -> "SeasonData":
+        match = models.Match.__table__
+        goal = models.Goal.__table__
+        filters = []
+        if start is not None:
+            filters.append(match.c.date >= start)
+        if end is not None:
+            filters.append(match.c.date < end)
+        rows = db.execute(
+            select(match.c.id, match.c.home_team_id, match.c.away_team_id, match.c.home_score, match.c.away_score, match.c.date)
+            .where(*filters)
+        ).all()
+        ids, home, away, home_scores, away_scores, dates = zip(*rows) if rows else ((),) * 6
+        goals_query = select(goal.c.match_id, goal.c.player_id, goal.c.minute)
+        if filters:
+            goals_query = goals_query.where(goal.c.match_id.in_(select(match.c.id).where(*filters)))
+        goals = db.execute(goals_query).all()
+        goal_matches, goal_players, goal_minutes = zip(*goals) if goals else ((),) * 3
+        # Для всей истории в таблицу входят все команды, для периода - только игравшие в нем
+        team_ids = db.execute(select(models.Team.id)).scalars().all() if not filters else ()
+        return cls(
+            _column(ids, np.int64), _column(home, np.int64), _column(away, np.int64),
+            _scores(home_scores), _scores(away_scores), np.array(dates, dtype="datetime64[us]"),
+            _column(goal_matches, np.int64), _column(goal_players, np.int64), _column(goal_minutes, np.int64),
+            team_ids=_column(team_ids, np.int64),
+        )
+
+
+# Результаты хозяев по сыгранным матчам: коды WIN / DRAW / LOSS
+def home_results(data: SeasonData) -> np.ndarray:
+    return np.where(
+        data.home_scores > data.away_scores, WIN,
+        np.where(data.home_scores == data.away_scores, DRAW, LOSS),
+    )
+
+
+# Показатели команд на одной стороне поля (хозяева или гости)
+def side_totals(data: SeasonData, side: str) -> dict:
+    played = data.played
+    size = data.teams_count
+    teams = (data.home if side == "home" else data.away)[played].astype(np.int64)
+    scored = (data.home_scores if side == "home" else data.away_scores)[played]
+    conceded = (data.away_scores if side == "home" else data.home_scores)[played]
+    results = home_results(data)[played]
+    if side == "away":
+        results = 2 - results
+    by_result = np.bincount(teams * 3 + results, minlength=size * 3).reshape(size, 3)
+    return {
+        "played": np.bincount(teams, minlength=size),
+        "won": by_result[:, WIN],
+        "drawn": by_result[:, DRAW],
+        "lost": by_result[:, LOSS],
+        "goals_for": np.bincount(teams, weights=scored, minlength=size).astype(np.int64),
+        "goals_against": np.bincount(teams, weights=conceded, minlength=size).astype(np.int64),
+        "points": by_result @ RESULT_POINTS,
+    }
+
+
+# Форма: до FORM_LENGTH последних результатов команды, новые слева
+def forms(data: SeasonData) -> list:
+    played = np.flatnonzero(data.played)
+    results = home_results(data)[played]
+    # Хозяева и гости матча подряд, матчи - от новых к старым
+    teams = np.column_stack((data.home[played], data.away[played])).ravel()
+    codes = np.column_stack((results, 2 - results)).ravel()
+    order = np.argsort(teams, kind="stable")
+    teams, codes = teams[order].astype(np.int64), codes[order]
+    starts = np.searchsorted(teams, np.arange(data.teams_count))
+    rank = np.arange(len(teams)) - starts[teams]
+    recent = rank < FORM_LENGTH
+    letters = np.full((data.teams_count, FORM_LENGTH), "", dtype="<U1")
+    letters[teams[recent], rank[recent]] = RESULTS[codes[recent]]
+    return ["".join(row) for row in letters]
+
+
+# Турнирная таблица со сплитами дома и в гостях, в порядке TABLE_ORDER
+def standings(data: SeasonData) -> list:
+    sides = {side: side_totals(data, side) for side in SIDES}
+    totals = {key: sides["home"][key] + sides["away"][key] for key in sides["home"]}
+    totals["goal_difference"] = totals["goals_for"] - totals["goals_against"]
+    order = np.lexsort((data.team_ids, -totals["goals_for"], -totals["goal_difference"], -totals["points"]))
+    team_forms = forms(data)
+    columns = {key: values.tolist() for key, values in totals.items()}
+    split_columns = {side: {key: values.tolist() for key, values in sides[side].items()} for side in SIDES}
+    team_ids = data.team_ids.tolist()
+    table = []
+    for position, i in enumerate(order.tolist(), start=1):
+        row = {"position": position, "team_id": team_ids[i], **{key: values[i] for key, values in columns.items()}}
+        row["form"] = team_forms[i]
+        for side in SIDES:
+            split = {key: values[i] for key, values in split_columns[side].items()}
+            split["goal_difference"] = split["goals_for"] - split["goals_against"]
+            row[side] = split
+        table.append(row)
+    return table
+
+
+# Голы игроков: [{"player_id", "goals", "matches", "average_minute"}, ...] по убыванию голов
+def player_totals(data: SeasonData, limit: int = None) -> list:
+    if not len(data.goal_players):
+        return []
+    size = len(data.player_ids)
+    goals = np.bincount(data.goal_players, minlength=size)
+    # Матчи, в которых игрок забивал: строки, где меняется пара (игрок, матч)
+    first = np.ones(len(data.goal_players), bool)
+    first[1:] = (data.goal_players[1:] != data.goal_players[:-1]) | (data.goal_matches[1:] != data.goal_matches[:-1])
+    matches = np.bincount(data.goal_players[first], minlength=size)
+    minutes = np.bincount(data.goal_players, weights=data.goal_minutes, minlength=size) / goals
+    players = data.player_ids
+    order = np.lexsort((players, -goals))[:limit]
+    return [
+        {"player_id": player, "goals": count, "matches": played, "average_minute": round(minute, 1)}
+        for player, count, played, minute in zip(
+            players[order].tolist(), goals[order].tolist(), matches[order].tolist(), minutes[order].tolist(),
+        )
+    ]
+
+
+# Столбцы сезона из кэша или из базы при промахе
+def cached_season_data(db, start: datetime = None, end: datetime = None) -> SeasonData:
+    key = (start, end)
+    data = season_data_cache.get(key)
+    if data is None:
+        generation = season_data_cache.generation
+        data = SeasonData.load(db, start, end)
+        season_data_cache.set(key, data, generation=generation)
+    return data
+
+
+# Сброс кэша столбцов сезона, вызывается сервисами после записи матчей, голов и команд
+def invalidate_season_data():
+    season_data_cache.invalidate()
+
+
+# Расчет таблицы и бомбардиров по столбцам сезона из кэша
+def season_stats(db, start: datetime = None, end: datetime = None, top_scorers: int = 10) -> dict:
+    data = cached_season_data(db, start, end)
+    return {"standings": standings(data), "top_scorers": player_totals(data, top_scorers)}
+
+
+# Синтетический сезон для замеров: случайные пары команд и счета
+def synthetic(matches: int, teams: int, goals_per_match: float = 2.5, seed: int = 0) -> SeasonData:
+    rng = np.random.default_rng(seed)
+    home = rng.integers(1, teams + 1, matches)
+    away = (home + rng.integers(1, teams, matches) - 1) % teams + 1
+    home_scores, away_scores = rng.poisson(goals_per_match / 2, (2, matches))
+    dates = np.datetime64("2000-01-01", "us") + rng.permutation(matches).astype("timedelta64[m]")
+    goals = int(home_scores.sum() + away_scores.sum())
+    goal_matches = np.repeat(np.arange(1, matches + 1), home_scores + away_scores)
+    goal_players = rng.integers(1, teams * 25 + 1, goals)
+    return SeasonData(
+        np.arange(1, matches + 1), home, away, home_scores, away_scores, dates,
+        goal_matches, goal_players, rng.integers(1, 91, goals),
+    )
+
+
+# Тот же расчет циклом по строкам матчей, как в rebuild_standings
+def loop_standings(rows) -> dict:
+    table = {}
+    for home_team_id, away_team_id, home_score, away_score in rows:
+        if home_score is None or away_score is None:
+            continue
+        outcome = "W" if home_score > away_score else "L" if home_score < away_score else "D"
+        for team_id, scored, conceded, result in (
+            (home_team_id, home_score, away_score, outcome),
+            (away_team_id, away_score, home_score, {"W": "L", "L": "W", "D": "D"}[outcome]),
+        ):
+            row = table.setdefault(team_id, {"played": 0, "won": 0, "drawn": 0, "lost": 0, "goals_for": 0, "goals_against": 0, "points": 0})
+            row["played"] += 1
+            row["won"] += result == "W"
+            row["drawn"] += result == "D"
+            row["lost"] += result == "L"
+            row["goals_for"] += scored
+            row["goals_against"] += conceded
+            row["points"] += POINTS[result]
+    return table
+
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+# Замер на синтетических данных: загрузка и пересчет по столбцам против цикла по ORM-объектам
+def benchmark(matches: int, teams: int, orm_limit: int = 100000) -> dict:
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import Session
+
+    data = synthetic(matches, teams)
+    _, compute = _timed(lambda: (standings(data), player_totals(data, 10)))
+    report = {"matches": matches, "teams": teams, "goals": len(data.goal_players), "vectorized_s": compute}
+
+    # ORM: в памяти SQLite, не больше orm_limit матчей, время масштабируется на весь объем
+    orm_matches = min(matches, orm_limit)
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine, tables=[models.Team.__table__, models.Match.__table__, models.Goal.__table__])
+    with engine.begin() as connection:
+        connection.execute(insert(models.Team.__table__), [{"id": i, "name": f"Team {i}"} for i in range(1, teams + 1)])
+        dates = data.dates[:orm_matches].astype(datetime).tolist()
+        connection.execute(insert(models.Match.__table__), [
+            {"id": i + 1, "home_team_id": h, "away_team_id": a, "home_score": hs, "away_score": as_, "date": d}
+            for i, (h, a, hs, as_, d) in enumerate(zip(
+                data.team_ids[data.home[:orm_matches]].tolist(), data.team_ids[data.away[:orm_matches]].tolist(),
+                data.home_scores[:orm_matches].tolist(), data.away_scores[:orm_matches].tolist(), dates,
+            ))
+        ])
+    with Session(engine) as db:
+        def orm_loop():
+            return loop_standings(
+                (m.home_team_id, m.away_team_id, m.home_score, m.away_score)
+                for m in db.scalars(select(models.Match).order_by(models.Match.date.desc()))
+            )
+
+        _, orm = _timed(orm_loop)
+        db.expunge_all()
+        loaded, load = _timed(SeasonData.load, db)
+        _, subset = _timed(standings, loaded)
+    engine.dispose()
+    scale = matches / orm_matches
+    report.update({
+        "orm_matches": orm_matches,
+        "orm_loop_s": orm * scale,
+        "load_s": load * scale,
+        "vectorized_subset_s": subset,
+        "speedup": orm * scale / compute if compute else None,
+    })
+    return report
+
+
+def main(argv=None):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from app.core.config import DATABASE_URL
+
+    parser = argparse.ArgumentParser(description="Статистика сезона: турнирная таблица и бомбардиры")
+    parser.add_argument("--url", default=DATABASE_URL)
+    parser.add_argument("--start", type=datetime.fromisoformat, help="Начало сезона (ISO-дата)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="Конец сезона, не включая")
+    parser.add_argument("--benchmark", action="store_true", help="Сравнить с циклом по ORM на синтетических данных")
+    parser.add_argument("--matches", type=int, default=1000000)
+    parser.add_argument("--teams", type=int, default=20)
+    parser.add_argument("--orm-limit", type=int, default=100000, help="Сколько матчей обрабатывать циклом по ORM")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        report = benchmark(args.matches, args.teams, args.orm_limit)
+        logger.info(
+            f"{report['matches']} матчей, {report['goals']} голов: пересчет по столбцам {report['vectorized_s']:.3f} с, "
+            f"цикл по ORM {report['orm_loop_s']:.1f} с (замер на {report['orm_matches']} матчах), "
+            f"загрузка столбцов {report['load_s']:.1f} с, ускорение пересчета x{report['speedup']:.0f}"
+        )
+        return report
+
+    engine = create_engine(args.url)
+    try:
+        with Session(engine) as db:
+            stats = season_stats(db, args.start, args.end)
+    finally:
+        engine.dispose()
+    for row in stats["standings"]:
+        logger.info(
+            f"{row['position']:>3}. {row['team_id']:>5}  {row['played']:>3} {row['won']:>3} {row['drawn']:>3} {row['lost']:>3}"
+            f"  {row['goals_for']:>4}:{row['goals_against']:<4} {row['points']:>4}  {row['form']}"
+        )
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,13 +1,20 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.db import models, schemas
+from app.services.analytics_service import invalidate_dashboard
+from app.services.load_profiles import apply_profile, include_options, load_options
+from app.services.pagination import fetch_page
+from app.services.standings_service import new_standing
+from app.services.stats_engine import invalidate_season_data
 
 # Получение команды по ID
-def get_team_by_id(db: Session, team_id: int):
-    return db.query(models.Team).filter(models.Team.id == team_id).first()
+def get_team_by_id(db: Session, team_id: int, profile: str = "detail"):
+    return apply_profile(db.query(models.Team), models.Team, profile).filter(models.Team.id == team_id).first()
 
 # Получение всех команд
-def get_all_teams(db: Session):
-    return db.query(models.Team).all()
+def get_all_teams(db: Session, profile: str = "list"):
+    return apply_profile(db.query(models.Team), models.Team, profile).all()
 
 # Создание новой команды
 def create_team(db: Session, team: schemas.TeamCreate):
@@ -18,7 +25,12 @@ def create_team(db: Session, team: schemas.TeamCreate):
         stadium=team.stadium
     )
     db.add(db_team)
+    db.flush()
+    # Новая команда сразу попадает в турнирную таблицу с нулевыми показателями
+    db.add(new_standing(db_team.id))
     db.commit()
+    invalidate_dashboard()
+    invalidate_season_data()
     db.refresh(db_team)
     return db_team
 
@@ -30,6 +42,8 @@ def update_team(db: Session, team_id: int, team_data: schemas.TeamUpdate):
     for key, value in team_data.dict(exclude_unset=True).items():
         setattr(team, key, value)
     db.commit()
+    invalidate_dashboard()
+    invalidate_season_data()
     db.refresh(team)
     return team
 
@@ -39,5 +53,39 @@ def delete_team(db: Session, team_id: int):
     if team:
         db.delete(team)
         db.commit()
+        invalidate_dashboard()
+        invalidate_season_data()
         return team
     return None
+
+
+# --- Асинхронные версии для обработчиков FastAPI ---
+
+# Получение всех команд
+async def get_all_teams_async(db: AsyncSession, profile: str = "list"):
+    result = await db.execute(select(models.Team).options(*load_options(models.Team, profile)))
+    return result.scalars().unique().all()
+
+# Страница команд с сортировкой по id (keyset-пагинация)
+async def get_teams_page_async(db: AsyncSession, cursor: str = None, limit: int = None, profile: str = "list", include=()):
+    stmt = select(models.Team).options(*load_options(models.Team, profile), *include_options(models.Team, include))
+    return await fetch_page(db, stmt, (models.Team.id,), cursor, limit)
+
+# Получение команды по ID
+async def get_team_by_id_async(db: AsyncSession, team_id: int, profile: str = "detail", include=()):
+    result = await db.execute(
+        select(models.Team)
+        .options(*load_options(models.Team, profile), *include_options(models.Team, include))
+        .where(models.Team.id == team_id)
+    )
+    return result.scalars().first()
+
+# Создание, обновление и удаление команды - через синхронные функции выше
+async def create_team_async(db: AsyncSession, team: schemas.TeamCreate):
+    return await db.run_sync(create_team, team)
+
+async def update_team_async(db: AsyncSession, team_id: int, team_data: schemas.TeamUpdate):
+    return await db.run_sync(update_team, team_id, team_data)
+
+async def delete_team_async(db: AsyncSession, team_id: int):
+    return await db.run_sync(delete_team, team_id)
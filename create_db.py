@@ -1,16 +1,14 @@
 import os
 import logging
-from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
-from app.db.database import Base  # Импортируйте свой базовый класс
-from app.db.models import Team, Match, Player, ActionLog  # Импортируйте свои модели
+from app.db.migrate import upgrade
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Определяем базу данных и создаем движок
-DATABASE_URL="sqlite+aiosqlite:///./instance/soccer_hub.db"  # Путь к вашей базе данных
+DATABASE_URL="sqlite:///./instance/soccer_hub.db"  # Путь к вашей базе данных
 
 def create_db():
     """Создает директорию базы данных и инициализирует базу данных."""
@@ -21,11 +19,8 @@ def create_db():
         logger.info(f"Создана директория для базы данных: {db_directory}")
 
     try:
-        # Создаем движок базы данных
-        engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-
-        # Создаем все таблицы в базе данных
-        Base.metadata.create_all(bind=engine)
+        # Создаем таблицы миграциями до последней ревизии
+        upgrade(DATABASE_URL)
 
         logger.info("База данных и таблицы созданы успешно.")
     except SQLAlchemyError as e:
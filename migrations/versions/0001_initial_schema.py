@@ -0,0 +1,138 @@
+"""initial schema
+
+Схема в том виде, в котором ее создавал Base.metadata.create_all.
+Для существующей базы, созданной через create_all, достаточно выполнить
+`alembic stamp 0001` и затем `alembic upgrade head`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-12-30 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'teams',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('city', sa.String(), nullable=True),
+        sa.Column('founded', sa.Integer(), nullable=True),
+        sa.Column('stadium', sa.String(), nullable=True),
+        sa.Column('points', sa.Integer(), nullable=True),
+        sa.Column('url_photo', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+    )
+    op.create_index('ix_teams_id', 'teams', ['id'])
+    op.create_index('ix_teams_city', 'teams', ['city'])
+
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(), nullable=False),
+        sa.Column('password', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('username'),
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+
+    op.create_table(
+        'standings',
+        sa.Column('team_id', sa.Integer(), nullable=False),
+        sa.Column('played', sa.Integer(), nullable=False),
+        sa.Column('won', sa.Integer(), nullable=False),
+        sa.Column('drawn', sa.Integer(), nullable=False),
+        sa.Column('lost', sa.Integer(), nullable=False),
+        sa.Column('goals_for', sa.Integer(), nullable=False),
+        sa.Column('goals_against', sa.Integer(), nullable=False),
+        sa.Column('goal_difference', sa.Integer(), nullable=False),
+        sa.Column('points', sa.Integer(), nullable=False),
+        sa.Column('form', sa.String(length=5), nullable=False),
+        sa.ForeignKeyConstraint(['team_id'], ['teams.id']),
+        sa.PrimaryKeyConstraint('team_id'),
+    )
+    op.create_index('ix_standings_table_order', 'standings', ['points', 'goal_difference', 'goals_for'])
+
+    op.create_table(
+        'matches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('home_team_id', sa.Integer(), nullable=False),
+        sa.Column('away_team_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('home_score', sa.Integer(), nullable=True),
+        sa.Column('away_score', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['home_team_id'], ['teams.id']),
+        sa.ForeignKeyConstraint(['away_team_id'], ['teams.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('home_team_id', 'away_team_id', 'date', name='unique_match_constraint'),
+    )
+    op.create_index('ix_matches_id', 'matches', ['id'])
+
+    op.create_table(
+        'players',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('position', sa.Enum('FORWARD', 'MIDFIELDER', 'DEFENDER', 'GOALKEEPER', name='positionenum'), nullable=False),
+        sa.Column('goals', sa.Integer(), nullable=True),
+        sa.Column('team_id', sa.Integer(), nullable=False),
+        sa.Column('url_photo', sa.String(), nullable=True),
+        sa.Column('is_starter', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['team_id'], ['teams.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name', 'team_id', name='unique_player_in_team'),
+    )
+    op.create_index('ix_players_id', 'players', ['id'])
+
+    op.create_table(
+        'goals',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('match_id', sa.Integer(), nullable=False),
+        sa.Column('player_id', sa.Integer(), nullable=False),
+        sa.Column('minute', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['match_id'], ['matches.id']),
+        sa.ForeignKeyConstraint(['player_id'], ['players.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_goals_id', 'goals', ['id'])
+
+    op.create_table(
+        'action_logs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('action', sa.String(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_action_logs_id', 'action_logs', ['id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_action_logs_id', table_name='action_logs')
+    op.drop_table('action_logs')
+    op.drop_index('ix_goals_id', table_name='goals')
+    op.drop_table('goals')
+    op.drop_index('ix_players_id', table_name='players')
+    op.drop_table('players')
+    op.drop_index('ix_matches_id', table_name='matches')
+    op.drop_table('matches')
+    op.drop_index('ix_standings_table_order', table_name='standings')
+    op.drop_table('standings')
+    op.drop_index('ix_users_id', table_name='users')
+    op.drop_table('users')
+    op.drop_index('ix_teams_city', table_name='teams')
+    op.drop_index('ix_teams_id', table_name='teams')
+    op.drop_table('teams')
+    sa.Enum(name='positionenum').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,45 @@
+"""hot query indexes
+
+Индексы для сортировок (очки команд, голы игроков), фильтров журнала действий
+и соединений голов и матчей. Составные индексы (команда, дата) служат
+календарем матчей команды и заменяют одиночные индексы по внешним ключам.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-01-10 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = (
+    ('ix_teams_points', 'teams', ['points']),
+    ('ix_players_goals', 'players', ['goals']),
+    ('ix_players_team_id', 'players', ['team_id']),
+    ('ix_matches_home_team_id_date', 'matches', ['home_team_id', 'date']),
+    ('ix_matches_away_team_id_date', 'matches', ['away_team_id', 'date']),
+    ('ix_matches_date', 'matches', ['date']),
+    ('ix_goals_match_id', 'goals', ['match_id']),
+    ('ix_goals_player_id', 'goals', ['player_id']),
+    ('ix_action_logs_user_id', 'action_logs', ['user_id']),
+    ('ix_action_logs_timestamp', 'action_logs', ['timestamp']),
+)
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,37 @@
+"""updated_at indexes
+
+Индексы по updated_at: валидаторы условных запросов читают max(updated_at)
+таблицы прямо из индекса, не просматривая строки.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-01-24 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = (
+    ('ix_teams_updated_at', 'teams', ['updated_at']),
+    ('ix_players_updated_at', 'players', ['updated_at']),
+    ('ix_matches_updated_at', 'matches', ['updated_at']),
+)
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,46 @@
+"""action rollups
+
+Агрегаты журнала действий по минутам, часам и дням (по действию и
+пользователю) и водяной знак агрегации. Заполняются командой
+python -m app.services.rollups --rebuild.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-02-03 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'action_rollups',
+        sa.Column('granularity', sa.String(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('action', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('granularity', 'bucket_start', 'action', 'user_id'),
+    )
+    op.create_table(
+        'rollup_state',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    op.execute(sa.text("INSERT INTO rollup_state (name, last_id) VALUES ('action_logs', 0)"))
+
+
+def downgrade() -> None:
+    op.drop_table('rollup_state')
+    op.drop_table('action_rollups')
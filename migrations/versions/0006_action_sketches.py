@@ -0,0 +1,36 @@
+"""action sketches
+
+Дневные вероятностные сводки журнала действий: HyperLogLog пользователей и
+Count-Min частых действий. Заполняются вместе с агрегатами
+(python -m app.services.rollups --rebuild).
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2025-02-10 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'action_sketches',
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('bucket_start', 'kind'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('action_sketches')
@@ -0,0 +1,42 @@
+"""action log partitions
+
+Реестр партиций журнала действий (отделенные таблицы SQLite, партиции
+PostgreSQL и колоночные архивы). Перевод action_logs на PostgreSQL в
+секционированную таблицу - отдельная команда:
+python -m app.services.retention --convert
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2025-02-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'action_log_partitions',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('period_start', sa.DateTime(), nullable=False),
+        sa.Column('period_end', sa.DateTime(), nullable=False),
+        sa.Column('state', sa.String(), nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=False),
+        sa.Column('archive_path', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    op.create_index('ix_action_log_partitions_period_start', 'action_log_partitions', ['period_start'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_action_log_partitions_period_start', table_name='action_log_partitions')
+    op.drop_table('action_log_partitions')
@@ -1,22 +1,125 @@
-import uvicorn
-from app.main import app
+import logging
 import os
+import uvicorn
+from app.core.config import settings
+from app.core.metrics import prepare_metrics_dir
 
-def main():
-    # Получение параметров из переменных окружения с указанием значений по умолчанию
-    host = os.getenv("HOST", "127.0.0.1")
-    port = int(os.getenv("PORT", 8000))
-    log_level = os.getenv("LOG_LEVEL", "info")
-    reload = os.getenv("RELOAD", "true").lower() == "true"
+logger = logging.getLogger(__name__)
+
+APP = "app.main:app"
 
+# Число воркеров: из настроек или по числу доступных процессу ядер
+def worker_count() -> int:
+    if settings.web_concurrency > 0:
+        return settings.web_concurrency
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:  # Windows и macOS
+        return max(1, os.cpu_count() or 1)
+
+def run_dev(host: str, port: int, log_level: str, reload: bool):
     # Запуск сервера uvicorn с указанными параметрами
     uvicorn.run(
-        "app.main:app",      # Укажите путь к вашему приложению FastAPI
+        APP,                 # Укажите путь к вашему приложению FastAPI
         host=host,           # IP-адрес, на котором будет запущен сервер
         port=port,           # Порт, на котором будет запущен сервер
         log_level=log_level, # Уровень логирования
         reload=reload        # Автоматическая перезагрузка при изменении кода
     )
 
+# Соединения, открытые главным процессом до fork, не должны использоваться в воркерах
+def post_fork(server, worker):
+    from app.db.database import async_engine, engine
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+# Воркер uvicorn для gunicorn: стандартный всегда выбирает loop и http автоматически,
+# здесь они берутся из настроек (EVENT_LOOP, HTTP_IMPL)
+def production_worker():
+    from uvicorn.workers import UvicornWorker
+
+    class ProductionWorker(UvicornWorker):
+        CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, "loop": settings.event_loop, "http": settings.http_impl}
+
+    return ProductionWorker
+
+# Настройки gunicorn из settings
+def gunicorn_options(host: str, port: int, log_level: str, workers: int) -> dict:
+    return {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": production_worker(),
+        "preload_app": True,
+        "keepalive": settings.keepalive_timeout,
+        "backlog": settings.backlog,
+        "graceful_timeout": settings.graceful_timeout,
+        "max_requests": settings.max_requests,
+        "max_requests_jitter": settings.max_requests // 10,
+        "loglevel": log_level,
+        "post_fork": post_fork,
+    }
+
+# Production через gunicorn: приложение загружается один раз в главном процессе (preload)
+# и разделяется воркерами при fork, остановка и перезапуск воркеров - плавные (SIGTERM / SIGHUP).
+def run_gunicorn(host: str, port: int, log_level: str, workers: int):
+    from gunicorn.app.base import BaseApplication
+
+    class ProductionApplication(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options(host, port, log_level, workers).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app.core.templates import precompile
+            from app.main import app
+            # Шаблоны компилируются до fork и разделяются всеми воркерами
+            precompile()
+            return app
+
+    ProductionApplication().run()
+
+# Production без gunicorn (например, на Windows): воркеры uvicorn под его супервизором
+def run_uvicorn_workers(host: str, port: int, log_level: str, workers: int):
+    uvicorn.run(
+        APP,
+        host=host,
+        port=port,
+        log_level=log_level,
+        workers=workers,
+        loop=settings.event_loop,
+        http=settings.http_impl,
+        backlog=settings.backlog,
+        timeout_keep_alive=settings.keepalive_timeout,
+        timeout_graceful_shutdown=settings.graceful_timeout,
+        limit_max_requests=settings.max_requests or None,
+        proxy_headers=True,
+    )
+
+def run_production(host: str, port: int, log_level: str):
+    workers = worker_count()
+    # Метрики воркеров суммируются через снимки в общем каталоге
+    prepare_metrics_dir()
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        logger.info(f"gunicorn не установлен, запуск {workers} воркеров uvicorn")
+        run_uvicorn_workers(host, port, log_level, workers)
+    else:
+        logger.info(f"Запуск {workers} воркеров gunicorn")
+        run_gunicorn(host, port, log_level, workers)
+
+def main():
+    # Получение параметров из переменных окружения с указанием значений по умолчанию
+    host = os.getenv("HOST", "127.0.0.1")
+    port = int(os.getenv("PORT", 8000))
+    log_level = os.getenv("LOG_LEVEL", "info")
+
+    if settings.run_mode == "production":
+        run_production(host, port, log_level)
+    else:
+        reload = os.getenv("RELOAD", "true").lower() == "true"
+        run_dev(host, port, log_level, reload)
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
@@ -0,0 +1,61 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, StaticPool
+from app.core.timing import instrument_engine
+from app.db.database import get_async_db, get_async_sessionmaker, to_async_url
+from app.db.models import Base
+from app.main import app
+
+# Отдельная база в памяти для каждого теста
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+# Файловая база для тестов маршрутов: синхронная сессия для подготовки данных
+# и асинхронная - для обработчиков через подмену get_async_db
+@pytest.fixture
+def file_db(tmp_path):
+    url = f"sqlite:///{tmp_path}/soccer_hub.db"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield url, session
+    session.close()
+    engine.dispose()
+
+@pytest.fixture
+def client(file_db):
+    url, _ = file_db
+    async_engine = create_async_engine(to_async_url(url), poolclass=NullPool)
+    instrument_engine(async_engine.sync_engine)
+    session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_sessionmaker] = lambda: session_factory
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
@@ -1,4 +1,20 @@
+import csv
+import gzip
+import io
+import json
+import os
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.testclient import TestClient
+from app.core.compression import CompressionMiddleware
+from app.core.config import settings
+from app.core.static import PrecompressedStaticFiles, build_static
+from app.db import models
+from app.services.media_service import media_url
 from app.main import app
 
 client = TestClient(app)
@@ -12,3 +28,272 @@ def test_create_team():
     response = client.post("/teams/", json={"name": "Team A", "city": "City A", "founded_year": 2020})
     assert response.status_code == 200
     assert response.json()["name"] == "Team A"
+
+def test_api_pages_follow_cursor_without_gaps(client, file_db):
+    _, db = file_db
+    db.add_all([models.Team(name=f"Team {i}") for i in range(7)])
+    db.commit()
+
+    names, cursor = [], None
+    for expected_size in (3, 3, 1):
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/api/v1/teams", params=params).json()
+        assert len(body["items"]) == expected_size
+        names += [item["name"] for item in body["items"]]
+        cursor = body["next_cursor"]
+    assert cursor is None
+    assert names == [f"Team {i}" for i in range(7)]
+
+def test_api_matches_ordered_by_date_then_id(client, file_db):
+    _, db = file_db
+    db.add_all([models.Team(name="A"), models.Team(name="B")])
+    db.flush()
+    same_day = datetime(2024, 3, 1)
+    db.add_all([
+        models.Match(home_team_id=1, away_team_id=2, date=datetime(2024, 4, 1)),
+        models.Match(home_team_id=2, away_team_id=1, date=same_day),
+        models.Match(home_team_id=1, away_team_id=2, date=same_day),
+    ])
+    db.commit()
+
+    first = client.get("/api/v1/matches", params={"limit": 2}).json()
+    second = client.get("/api/v1/matches", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [m["id"] for m in first["items"] + second["items"]] == [2, 3, 1]
+    assert second["next_cursor"] is None
+
+def test_api_rejects_broken_cursor(client):
+    response = client.get("/api/v1/players", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_api_includes_nested_objects_only_on_request(client, file_db):
+    _, db = file_db
+    team = models.Team(name="Зенит", city="Санкт-Петербург")
+    db.add(team)
+    db.flush()
+    db.add(models.Player(name="Малком", position=models.PositionEnum.FORWARD, team_id=team.id, goals=8))
+    db.commit()
+
+    plain = client.get("/api/v1/players").json()["items"][0]
+    assert "team" not in plain
+    assert plain["position"] == "Forward"
+    assert plain["team_id"] == team.id
+
+    nested = client.get("/api/v1/players", params={"include": "team"}).json()["items"][0]
+    assert nested["team"]["name"] == "Зенит"
+    assert "players" not in nested["team"]
+
+    detail = client.get(f"/api/v1/teams/{team.id}", params={"include": "players"})
+    assert detail.headers["content-type"] == "application/json"
+    assert [p["name"] for p in detail.json()["players"]] == ["Малком"]
+
+def test_api_validates_include_and_missing_entities(client):
+    assert client.get("/api/v1/matches", params={"include": "goals"}).status_code == 400
+    assert client.get("/api/v1/matches/404").status_code == 404
+
+def test_export_streams_ndjson_and_gzipped_csv(client, file_db):
+    _, db = file_db
+    team = models.Team(name="Спартак", city="Москва")
+    db.add(team)
+    db.flush()
+    db.add_all([
+        models.Player(name=f"Игрок {i}", position=models.PositionEnum.DEFENDER, team_id=team.id) for i in range(5)
+    ])
+    db.commit()
+
+    response = client.get("/api/v1/export/players", params={"batch_size": 2})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["name"] for row in rows] == [f"Игрок {i}" for i in range(5)]
+    assert rows[0]["position"] == "Defender"
+
+    response = client.get("/api/v1/export/teams", params={"format": "csv", "gzip": True})
+    assert 'filename="teams.csv.gz"' in response.headers["content-disposition"]
+    reader = csv.DictReader(io.StringIO(gzip.decompress(response.content).decode()))
+    assert [(row["name"], row["city"]) for row in reader] == [("Спартак", "Москва")]
+
+def test_export_rejects_unknown_table_and_format(client):
+    assert client.get("/api/v1/export/users").status_code == 404
+    assert client.get("/api/v1/export/teams", params={"format": "xml"}).status_code == 400
+
+def test_media_proxy_downloads_once_and_serves_cached_thumbnails(client, file_db, tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), "red").save(buffer, "JPEG")
+    image = buffer.getvalue()
+    requests_seen = []
+
+    class ImageHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(image)))
+            self.end_headers()
+            self.wfile.write(image)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(settings, "media_dir", str(tmp_path / "media"))
+    _, db = file_db
+    team = models.Team(name="Зенит", url_photo=f"http://127.0.0.1:{server.server_port}/zenit.jpg")
+    db.add(team)
+    db.commit()
+    try:
+        url = media_url("team", team)
+        first = client.get(url)
+        second = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+        card = client.get(f"/media/team/{team.id}", params={"size": 300})
+    finally:
+        server.shutdown()
+
+    assert first.status_code == 200 and first.headers["content-type"] == "image/jpeg"
+    assert "immutable" in first.headers["cache-control"]
+    assert Image.open(io.BytesIO(first.content)).size == (100, 75)
+    assert second.status_code == 304
+    assert Image.open(io.BytesIO(card.content)).size == (300, 225)
+    # Оригинал скачан один раз, миниатюры обоих размеров построены из локальной копии
+    assert requests_seen == ["/zenit.jpg"]
+    assert client.get("/media/team/999").status_code == 404
+    assert client.get(url.replace("size=100", "size=64")).status_code == 400
+
+def test_conditional_get_answers_304_until_entity_changes(client, file_db):
+    _, db = file_db
+    team = models.Team(name="Зенит", city="Санкт-Петербург")
+    db.add(team)
+    db.commit()
+
+    first = client.get(f"/teams/{team.id}")
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and "s-maxage" in first.headers["cache-control"]
+    assert "last-modified" in first.headers
+
+    cached = client.get(f"/teams/{team.id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b"" and cached.headers["etag"] == etag
+
+    # Новый игрок команды выводится на ее странице: валидатор меняется
+    db.add(models.Player(name="Малком", position=models.PositionEnum.FORWARD, team_id=team.id))
+    db.commit()
+    changed = client.get(f"/teams/{team.id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+    api = client.get("/api/v1/teams", params={"limit": 10})
+    assert client.get("/api/v1/teams", params={"limit": 10}, headers={"If-None-Match": api.headers["etag"]}).status_code == 304
+    # Другие параметры запроса - другая страница и другой валидатор
+    assert client.get("/api/v1/teams", params={"limit": 5}, headers={"If-None-Match": api.headers["etag"]}).status_code == 200
+    assert "etag" not in client.get("/teams/999").headers
+
+def test_if_modified_since_alone_never_hides_deletes_or_new_goals(client, file_db):
+    _, db = file_db
+    home, away, newest = models.Team(name="Зенит"), models.Team(name="Спартак"), models.Team(name="Динамо")
+    db.add_all([home, away, newest])
+    db.flush()
+    player = models.Player(name="Малком", position=models.PositionEnum.FORWARD, team_id=home.id)
+    match = models.Match(home_team_id=home.id, away_team_id=away.id, date=datetime(2024, 5, 1), home_score=1, away_score=0)
+    db.add_all([player, match])
+    db.commit()
+
+    teams = client.get("/api/v1/teams", params={"limit": 10})
+    detail = client.get(f"/api/v1/matches/{match.id}")
+    # Удаление самой новой команды не сдвигает max(updated_at) вперед, у голов updated_at нет
+    db.delete(newest)
+    db.add(models.Goal(match_id=match.id, player_id=player.id, minute=10))
+    db.commit()
+    for url, first in (("/api/v1/teams?limit=10", teams), (f"/api/v1/matches/{match.id}", detail)):
+        since = first.headers["last-modified"]
+        response = client.get(url, headers={"If-Modified-Since": since})
+        assert response.status_code == 200 and response.headers["etag"] != first.headers["etag"]
+
+def test_compression_threshold_streaming_and_skipped_types():
+    page = "<tr><td>Зенит</td></tr>" * 200
+    demo = FastAPI()
+    demo.add_middleware(CompressionMiddleware, minimum_size=500)
+    demo.get("/page")(lambda: HTMLResponse(page))
+    demo.get("/small")(lambda: HTMLResponse("<p>ok</p>"))
+    demo.get("/image")(lambda: Response(b"\x89PNG" * 500, media_type="image/png"))
+    demo.get("/stream")(lambda: StreamingResponse((f"{i}\n".encode() * 100 for i in range(5)), media_type="application/x-ndjson"))
+    demo_client = TestClient(demo)
+
+    response = demo_client.get("/page", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip" and response.text == page
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert int(response.headers["content-length"]) < len(page.encode()) // 10
+    assert "content-encoding" not in demo_client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in demo_client.get("/image", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in demo_client.get("/page", headers={"Accept-Encoding": "identity"}).headers
+    streamed = demo_client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert streamed.headers["content-encoding"] == "gzip"
+    assert streamed.text == "".join(f"{i}\n" * 100 for i in range(5))
+
+def test_static_build_serves_fingerprinted_precompressed_files(tmp_path):
+    source = tmp_path / "src"
+    (source / "css").mkdir(parents=True)
+    (source / "css" / "site.css").write_text("body { color: #333; }\n" * 50)
+    manifest = build_static(str(source), str(tmp_path / "build"))
+    hashed = manifest["css/site.css"]
+    assert hashed.startswith("css/site.") and hashed != "css/site.css"
+
+    demo = FastAPI()
+    demo.mount("/static", PrecompressedStaticFiles(directory=str(tmp_path / "build"), manifest=manifest))
+    demo_client = TestClient(demo)
+    response = demo_client.get(f"/static/{hashed}", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/css")
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.text == "body { color: #333; }\n" * 50
+    plain = demo_client.get("/static/css/site.css", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and "immutable" not in plain.headers["cache-control"]
+    not_modified = demo_client.get(f"/static/{hashed}", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]})
+    assert not_modified.status_code == 304
+
+def test_server_timing_reports_queries_templates_and_slow_sql(client, file_db, monkeypatch, caplog):
+    _, db = file_db
+    db.add_all([models.Team(name=f"Team {i}") for i in range(3)])
+    db.commit()
+    monkeypatch.setattr(settings, "slow_query_ms", 0.0001)
+
+    with caplog.at_level("INFO"):
+        response = client.get("/teams")
+    assert response.status_code == 200
+    timing = {
+        part.split(";")[0].strip(): dict(item.split("=", 1) for item in part.split(";")[1:])
+        for part in response.headers["server-timing"].split(",")
+    }
+    assert set(timing) == {"app", "db", "tpl"}
+    assert timing["db"]["desc"] == '"2 queries"'  # Состояние для ETag и страница команд
+    assert float(timing["tpl"]["dur"]) > 0
+    assert float(timing["app"]["dur"]) >= float(timing["db"]["dur"])
+
+    slow = [r for r in caplog.records if r.name == "app.slow_query"]
+    assert len(slow) == 2 and "SELECT" in slow[0].statement
+    request_log = [r for r in caplog.records if r.name == "app.core.timing"][-1]
+    assert (request_log.route, request_log.status, request_log.db_queries) == ("/teams", 200, 2)
+
+def test_metrics_exposes_route_histograms_and_merges_worker_snapshots(client, tmp_path, monkeypatch):
+    from app.core import metrics
+
+    client.get("/teams")
+    client.get("/teams/999")
+    client.get("/no-such-page")
+    body = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/teams",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/teams/{team_id}",le="+Inf"}' in body
+    assert 'route="unmatched",status="404"' in body
+    assert 'db_pool_connections{engine="sync",state="checked_out"}' in body
+    assert 'cache_requests_total{cache="fragments",result="miss"}' in body
+
+    # Снимок другого (уже завершившегося) воркера: счетчики суммируются, Gauge - нет
+    monkeypatch.setattr(metrics.settings, "metrics_dir", str(tmp_path))
+    other = metrics.Registry()
+    other.counter("http_requests_total", "", ("method", "route", "status")).inc(5, method="GET", route="/x", status=200)
+    other.gauge("http_requests_in_progress", "").set(7)
+    (tmp_path / "1.json").write_text(json.dumps(other.snapshot()))
+    stale = datetime(2020, 1, 1).timestamp()
+    os.utime(tmp_path / "1.json", (stale, stale))
+
+    body = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/x",status="200"} 5' in body
+    assert "http_requests_in_progress 1" in body
+    assert (tmp_path / f"{os.getpid()}.json").exists()
@@ -0,0 +1,804 @@
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+from aiohttp import web
+from collections import Counter
+from datetime import datetime, timedelta
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from app.core.templates import build_environment, fragment_cache, precompile, templates
+from app.db import models, schemas
+from app.db.database import build_engine
+from app.db.index_audit import audit
+from app.db.migrate import SchemaOutOfDate, check_schema, head_revision, upgrade
+from app.services.action_log import ActionLogWriter
+from app.services.analytics_service import get_dashboard_async, get_dashboard_cache_stats, invalidate_dashboard
+from app.services.cache import TTLCache
+from app.services import rollups
+from app.services.ingest import ingest_dataset
+from app.services.scraper import Scraper, photo_enricher
+from app.services.match_service import (
+    create_match, create_match_async, delete_match, get_all_matches, get_all_matches_async, get_match_by_id, update_match,
+)
+from app.services.player_service import get_all_players
+from app.services.standings_service import get_standings, rebuild_standings
+from app.services.team_service import create_team, create_team_async, get_all_teams_async, get_team_by_id, get_team_by_id_async
+
+
+
+# Заполнение базы командами (по 3 игрока в каждой) и матчами между ними
+def seed(db, teams_count: int, matches_count: int, prefix: str = "Team"):
+    teams = [models.Team(name=f"{prefix} {i}", city="City", url_photo=f"http://img/{prefix}/{i}.png") for i in range(teams_count)]
+    db.add_all(teams)
+    db.flush()
+    for team in teams:
+        db.add_all([
+            models.Player(name=f"Player {team.id}-{n}", position=models.PositionEnum.FORWARD, team_id=team.id)
+            for n in range(3)
+        ])
+    start = datetime(2024, 1, 1)
+    for i in range(matches_count):
+        db.add(models.Match(
+            home_team_id=teams[i % teams_count].id,
+            away_team_id=teams[(i + 1) % teams_count].id,
+            date=start + timedelta(days=i),
+            home_score=1,
+            away_score=0,
+        ))
+    db.commit()
+    db.expunge_all()
+
+
+# Подсчет SQL-запросов, выполненных внутри блока
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def render_matches_page(engine, db):
+    with QueryCounter(engine) as counter:
+        templates.get_template("matches.html").render(request=None, matches=get_all_matches(db))
+    return counter.count
+
+
+def render_players_page(engine, db):
+    with QueryCounter(engine) as counter:
+        templates.get_template("players.html").render(request=None, players=get_all_players(db))
+    return counter.count
+
+
+@pytest.mark.parametrize("render_page", [render_matches_page, render_players_page])
+def test_list_page_query_count_is_constant(engine, db, render_page):
+    seed(db, teams_count=4, matches_count=5)
+    small = render_page(engine, db)
+    db.expunge_all()
+
+    seed(db, teams_count=60, matches_count=300, prefix="Extra")
+    large = render_page(engine, db)
+    assert small == large == 1
+
+
+def test_team_detail_loads_players_in_fixed_queries(engine, db):
+    seed(db, teams_count=3, matches_count=1)
+    with QueryCounter(engine) as counter:
+        team = get_team_by_id(db, 1)
+        templates.get_template("team.html").render(request=None, team=team)
+    assert len(team.players) == 3
+    assert counter.count == 2
+
+
+def test_match_detail_loads_both_teams(engine, db):
+    seed(db, teams_count=2, matches_count=1)
+    with QueryCounter(engine) as counter:
+        match = get_match_by_id(db, 1)
+        names = (match.home_team.name, match.away_team.name, list(match.goals))
+    assert names[:2] == ("Team 0", "Team 1")
+    assert counter.count == 2
+
+
+# Асинхронные сервисы на отдельной базе aiosqlite в памяти
+def run_async_scenario(scenario):
+    async def runner():
+        async_engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with async_engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+        session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+        try:
+            return await scenario(session_factory)
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(runner())
+
+
+def test_async_services_create_and_read_with_profiles():
+    async def scenario(session_factory):
+        async with session_factory() as db:
+            home = await create_team_async(db, schemas.TeamCreate(name="Home"))
+            away = await create_team_async(db, schemas.TeamCreate(name="Away"))
+            await create_match_async(db, schemas.MatchCreate(
+                home_team_id=home.id, away_team_id=away.id, date=datetime(2024, 5, 1), home_score=2, away_score=1,
+            ))
+        async with session_factory() as db:
+            matches = await get_all_matches_async(db)
+            teams = await get_all_teams_async(db)
+            # Связи уже загружены профилем "list", ленивой загрузки в асинхронном контексте не происходит
+            return [(m.home_team.name, m.away_team.name) for m in matches], len(teams)
+
+    pairs, teams_count = run_async_scenario(scenario)
+    assert pairs == [("Home", "Away")]
+    assert teams_count == 2
+
+
+def test_async_team_detail_includes_players():
+    async def scenario(session_factory):
+        async with session_factory() as db:
+            team = await create_team_async(db, schemas.TeamCreate(name="Solo"))
+            db.add(models.Player(name="Keeper", position=models.PositionEnum.GOALKEEPER, team_id=team.id))
+            await db.commit()
+        async with session_factory() as db:
+            team = await get_team_by_id_async(db, team.id)
+            missing = await get_team_by_id_async(db, 999)
+            return [p.name for p in team.players], missing
+
+    names, missing = run_async_scenario(scenario)
+    assert names == ["Keeper"]
+    assert missing is None
+
+
+def test_sqlite_engine_profile_and_pool_stats(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path}/soccer_hub.db")
+    try:
+        with engine.connect() as conn:
+            journal_mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+            busy_timeout = conn.execute(text("PRAGMA busy_timeout")).scalar()
+        with engine.connect():
+            pass
+        stats = engine.pool.stats()
+    finally:
+        engine.dispose()
+    assert journal_mode == "wal"
+    assert busy_timeout == 5000
+    assert stats["checkouts"] == 2
+    assert stats["checked_out"] == 0
+    assert stats["max_wait_seconds"] >= 0
+
+
+# Снимок турнирной таблицы для сравнения
+def standings_snapshot(db):
+    return [
+        (s.team_id, s.played, s.won, s.drawn, s.lost, s.goals_for, s.goals_against, s.goal_difference, s.points, s.form)
+        for s in get_standings(db)
+    ]
+
+
+def test_standings_follow_match_writes_and_match_rebuild(db):
+    home = create_team(db, schemas.TeamCreate(name="Home"))
+    away = create_team(db, schemas.TeamCreate(name="Away"))
+    first = create_match(db, schemas.MatchCreate(
+        home_team_id=home.id, away_team_id=away.id, date=datetime(2024, 1, 1), home_score=2, away_score=0,
+    ))
+    second = create_match(db, schemas.MatchCreate(
+        home_team_id=away.id, away_team_id=home.id, date=datetime(2024, 2, 1), home_score=1, away_score=1,
+    ))
+
+    assert standings_snapshot(db) == [
+        (home.id, 2, 1, 1, 0, 3, 1, 2, 4, "DW"),
+        (away.id, 2, 0, 1, 1, 1, 3, -2, 1, "DL"),
+    ]
+    assert db.get(models.Team, home.id).points == 4
+
+    update_match(db, first.id, schemas.MatchUpdate(home_score=0, away_score=3))
+    delete_match(db, second.id)
+    incremental = standings_snapshot(db)
+    assert incremental == [
+        (away.id, 1, 1, 0, 0, 3, 0, 3, 3, "W"),
+        (home.id, 1, 0, 0, 1, 0, 3, -3, 0, "L"),
+    ]
+
+    rebuild_standings(db)
+    assert standings_snapshot(db) == incremental
+
+
+def test_ttl_cache_bounds_entries_and_expires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.services.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # Вытесняет "b", к которому дольше всего не обращались
+    assert cache.get("b") is None
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 1, "size": 1, "maxsize": 2, "hit_ratio": 1 / 3}
+
+
+def test_dashboard_served_from_cache_until_match_write():
+    invalidate_dashboard()
+
+    async def scenario(session_factory):
+        async with session_factory() as db:
+            home = await create_team_async(db, schemas.TeamCreate(name="Home"))
+            away = await create_team_async(db, schemas.TeamCreate(name="Away"))
+            first = await get_dashboard_async(db)
+            before = get_dashboard_cache_stats()
+            second = await get_dashboard_async(db)
+            after = get_dashboard_cache_stats()
+            await create_match_async(db, schemas.MatchCreate(
+                home_team_id=home.id, away_team_id=away.id, date=datetime(2024, 5, 1), home_score=3, away_score=1,
+            ))
+            third = await get_dashboard_async(db)
+            return first, second, third, before, after
+
+    first, second, third, before, after = run_async_scenario(scenario)
+    assert second is first
+    assert after["hits"] == before["hits"] + 1
+    assert first["match_stats"]["total_matches"] == 0
+    assert third["match_stats"] == {"total_goals": 4, "total_matches": 1, "avg_goals_per_match": 4.0}
+    assert third["top_teams"][0]["name"] == "Home"
+
+
+def test_index_audit_finds_no_unexpected_full_scans(engine):
+    results = audit(engine)
+    assert {result["query"] for result in results} >= {"matches.team_fixtures", "analytics.top_teams", "action_logs.by_period"}
+    assert [result for result in results if result["flagged"]] == []
+
+
+def test_bulk_ingest_is_batched_and_idempotent():
+    dataset = dict(
+        teams=[{"name": "Home", "city": "A"}, {"name": "Away", "city": "B"}, {"name": "Home", "city": "A"}],
+        players=[{"name": f"P{i}", "position": "Forward", "team_id": 1 + i % 2, "goals": 0} for i in range(5)],
+        matches=[{"home_team_id": 1, "away_team_id": 2, "date": datetime(2024, 5, 1), "home_score": 3, "away_score": 1}],
+        goals=[{"match_id": 1, "player_id": 1, "minute": minute} for minute in (10, 20, 30, 30)],
+    )
+    progress = []
+
+    async def scenario(session_factory):
+        inserts = []
+
+        def on_execute(conn, cursor, statement, *args):
+            if statement.startswith("INSERT INTO players"):
+                inserts.append(statement)
+
+        async with session_factory() as db:
+            event.listen(db.bind.sync_engine, "before_cursor_execute", on_execute)
+            first = await ingest_dataset(db, batch_size=2, progress=lambda *args: progress.append(args), **dataset)
+            event.remove(db.bind.sync_engine, "before_cursor_execute", on_execute)
+        async with session_factory() as db:
+            second = await ingest_dataset(db, batch_size=2, progress=lambda *args: None, **dataset)
+            standings = (await db.scalars(select(models.Standing).order_by(models.Standing.team_id))).all()
+            return first, second, len(inserts), [(s.team_id, s.points, s.form) for s in standings]
+
+    first, second, inserts, standings = run_async_scenario(scenario)
+    assert first == {"teams": 2, "players": 5, "matches": 1, "goals": 3}
+    assert second == {"teams": 0, "players": 0, "matches": 0, "goals": 0}
+    # 5 игроков пачками по 2 - три выполнения INSERT
+    assert inserts == 3
+    assert ("players", 4, 5) in progress and ("players", 5, 5) in progress
+    assert standings == [(1, 3, "W"), (2, 0, "L")]
+
+
+def test_bulk_ingest_counts_only_rows_actually_inserted(monkeypatch):
+    from app.services import ingest
+
+    async def no_keys(*args):
+        return set()
+
+    async def scenario(session_factory):
+        async with session_factory() as db:
+            await ingest_dataset(db, teams=[{"name": "Home"}, {"name": "Away"}])
+        # Строки, вставленные другим процессом после чтения ключей, отбрасываются ON CONFLICT
+        monkeypatch.setattr(ingest, "existing_keys", no_keys)
+        progress = []
+        async with session_factory() as db:
+            report = await ingest_dataset(
+                db, teams=[{"name": "Home"}, {"name": "Away"}, {"name": "Guest"}], batch_size=2,
+                progress=lambda *args: progress.append(args),
+            )
+        return report, progress
+
+    report, progress = run_async_scenario(scenario)
+    assert report["teams"] == 1
+    assert progress == [("teams", 0, 3), ("teams", 1, 3)]
+
+
+def test_bulk_ingest_cancels_prefetched_enrichment_when_insert_fails():
+    from sqlalchemy.exc import IntegrityError
+    from app.services.ingest import PLAYER_KEY, ingest_rows
+
+    started, cancelled = [], []
+
+    async def enrich(batch):
+        started.append(len(batch))
+        if len(started) > 1:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(len(batch))
+                raise
+        return batch
+
+    async def scenario(session_factory):
+        rows = [{"name": f"P{i}", "position": None, "team_id": 1} for i in range(4)]
+        async with session_factory() as db:
+            with pytest.raises(IntegrityError):
+                await ingest_rows(db, models.Player, PLAYER_KEY, rows, batch_size=2, enrich=enrich, progress=lambda *args: None)
+            await asyncio.sleep(0)
+        return list(cancelled)
+
+    assert run_async_scenario(scenario) == [2]
+    # Дополнение второй пачки было запущено заранее и отменено вместе с ошибкой вставки
+    assert started == [2, 2]
+
+
+# Локальный сервер-заглушка страницы поиска: первый запрос каждого имени отвечает 503,
+# затем отдает страницу с ETag и отвечает 304 на условный запрос.
+async def start_search_stub(log):
+    failed = set()
+
+    async def search(request):
+        query = request.query["query"]
+        log.append((query, request.headers.get("If-None-Match")))
+        if query not in failed:
+            failed.add(query)
+            return web.Response(status=503)
+        if request.headers.get("If-None-Match") == f'"{query}"':
+            return web.Response(status=304)
+        html = f'<html><div class="vereinprofil_tooltip"><img src="/img/{query}.png"></div></html>'
+        return web.Response(text=html, content_type="text/html", headers={"ETag": f'"{query}"'})
+
+    app = web.Application()
+    app.router.add_get("/schnellsuche/ergebnis/schnellsuche", search)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+def test_scraper_retries_caches_and_revalidates(tmp_path):
+    log = []
+
+    async def scenario():
+        runner, base_url = await start_search_stub(log)
+        try:
+            options = dict(base_url=base_url, cache_dir=str(tmp_path), concurrency=4, rate_per_host=0, backoff=0)
+            async with Scraper(**options) as scraper:
+                enrich = photo_enricher(scraper.team_photo)
+                first = await enrich([{"name": "Zenit"}, {"name": "Spartak Moscow"}])
+            async with Scraper(**options) as scraper:
+                second = await scraper.team_photo("Zenit")
+                return first, second, scraper.stats
+        finally:
+            await runner.cleanup()
+
+    first, second, stats = asyncio.run(scenario())
+    assert [row["url_photo"] for row in first] == ["/img/Zenit.png", "/img/Spartak Moscow.png"]
+    # Второй клиент читает кэш с диска: условный запрос и ответ 304 без тела
+    assert second == "/img/Zenit.png"
+    assert stats["revalidated"] == 1 and stats["failures"] == 0
+    assert log.count(("Zenit", None)) == 2 and ("Zenit", '"Zenit"') in log
+
+
+def test_thumbnail_of_decompression_bomb_falls_back(monkeypatch):
+    from app.services.media_service import make_thumbnail
+
+    Image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    Image.new("L", (400, 400)).save(buffer, "PNG")
+    assert make_thumbnail(buffer.getvalue(), 100) is not None
+    # Картинка больше двойного лимита пикселей: Pillow отказывается ее открывать
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 10000)
+    assert make_thumbnail(buffer.getvalue(), 100) is None
+
+
+def test_templates_precompile_into_bytecode_cache(tmp_path):
+    env = build_environment(cache_dir=str(tmp_path), auto_reload=False)
+    count = precompile(env)
+    assert count == len(env.list_templates()) and len(list(tmp_path.iterdir())) == count
+    # Повторное окружение загружает байткод с диска, не компилируя исходники
+    fresh = build_environment(cache_dir=str(tmp_path), auto_reload=False)
+
+    def compile_forbidden(*args, **kwargs):
+        raise AssertionError("шаблон должен загружаться из кэша байткода")
+
+    fresh.compile = compile_forbidden
+    assert "Soccer Hub" in fresh.get_template("index.html").render(request=None)
+
+
+def test_list_rows_rendered_from_fragment_cache_until_entity_changes(db):
+    seed(db, teams_count=4, matches_count=6)
+    fragment_cache.invalidate()
+
+    def render():
+        before = fragment_cache.stats()
+        html = templates.get_template("matches.html").render(request=None, matches=get_all_matches(db))
+        after = fragment_cache.stats()
+        return html, after["hits"] - before["hits"], after["misses"] - before["misses"]
+
+    first, first_hits, first_misses = render()
+    second, second_hits, second_misses = render()
+    assert (first_hits, first_misses) == (0, 6)
+    assert (second_hits, second_misses) == (6, 0) and second == first
+
+    # Переименование команды меняет ее версию: перерисовываются только строки ее матчей
+    team = db.get(models.Team, 1)
+    team.name = "Renamed"
+    db.commit()
+    played = sum(1 for match in get_all_matches(db) if team.id in (match.home_team_id, match.away_team_id))
+    third, third_hits, third_misses = render()
+    assert third_misses == played and third_hits == 6 - played
+    assert third.count('alt="Renamed Logo"') == played
+
+
+def test_schema_check_requires_migrations_to_head(tmp_path):
+    url = f"sqlite:///{tmp_path}/fresh.db"
+    engine = create_engine(url)
+    try:
+        with pytest.raises(SchemaOutOfDate):
+            check_schema(engine)
+        upgrade(url)
+        assert check_schema(engine) == head_revision()
+        # Миграции дают ту же схему, что и модели
+        with engine.connect() as connection:
+            assert compare_metadata(MigrationContext.configure(connection), models.Base.metadata) == []
+    finally:
+        engine.dispose()
+
+
+def test_metrics_dir_reaches_workers_through_environment_only(tmp_path, monkeypatch):
+    from app.core import metrics
+    from app.core.config import Settings
+
+    monkeypatch.delenv("METRICS_DIR", raising=False)
+    directory = str(tmp_path / "metrics")
+    (tmp_path / "metrics").mkdir()
+    (tmp_path / "metrics" / "1.json").write_text("{}")
+    assert metrics.prepare_metrics_dir(directory) == directory
+    # Каталог очищен, настройки не изменены, воркер находит каталог в окружении
+    assert os.listdir(directory) == [] and Settings.metrics_dir == ""
+    assert os.environ["METRICS_DIR"] == directory == metrics.metrics_dir()
+    metrics.collect()
+    assert os.listdir(directory) == [f"{os.getpid()}.json"]
+
+
+def test_action_log_writer_batches_drops_overflow_and_drains_on_stop(engine, db):
+    inserts = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_inserts(conn, cursor, statement, *args):
+        if statement.startswith("INSERT INTO action_logs"):
+            inserts.append(statement)
+
+    writer = ActionLogWriter(engine, max_queue=5, batch_size=3, flush_interval=60)
+
+    accepted = [writer.submit(user_id=1, action=f"view {i}") for i in range(7)]
+    assert accepted == [True] * 5 + [False] * 2
+    assert writer.flush() == 5
+    # Одна многострочная вставка на пачку
+    assert len(inserts) == 2 and inserts[0].count("(?, ?, ?)") == 3
+
+    writer.start()
+    writer.submit(user_id=2, action="late")
+    writer.stop(timeout=5)
+    assert db.query(models.ActionLog).count() == 6
+    assert writer.stats() == {"queued": 0, "enqueued": 6, "written": 6, "dropped": 2, "failed": 0, "retried": 0, "batches": 3}
+
+
+def test_action_log_writer_retries_batches_after_database_locks(engine, db):
+    from sqlalchemy.exc import OperationalError
+
+    locked = {"times": 2}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def lock_database(conn, cursor, statement, *args):
+        if statement.startswith("INSERT INTO action_logs") and locked["times"]:
+            locked["times"] -= 1
+            raise OperationalError(statement, None, Exception("database is locked"))
+
+    writer = ActionLogWriter(engine, batch_size=2, flush_interval=60, retry_attempts=3, retry_delay=0)
+    for i in range(3):
+        writer.submit(user_id=1, action=f"view {i}")
+    # Первая пачка отложена и остается в начале очереди
+    assert writer.flush() == 0 and writer.pending_retry
+    assert writer.stats()["queued"] == 3
+    writer.submit(user_id=1, action="view 3")
+    assert writer.drain() == 4 and not writer.pending_retry
+    actions = [row.action for row in db.query(models.ActionLog).order_by(models.ActionLog.id)]
+    assert actions == [f"view {i}" for i in range(4)]
+    assert writer.stats()["failed"] == 0 and writer.stats()["retried"] == 4
+
+    # Ошибка держится дольше числа попыток - пачка считается потерянной
+    locked["times"] = 3
+    writer.submit(user_id=1, action="lost")
+    writer.stop()
+    assert writer.stats()["failed"] == 1 and db.query(models.ActionLog).count() == 4
+
+
+def test_rollups_answer_period_counts_like_raw_log(engine, db):
+    writer = ActionLogWriter(engine, batch_size=50, flush_interval=60)
+    start = datetime(2024, 5, 1, 22, 50, 30)
+    for i in range(400):
+        writer.submit(user_id=i % 3 or None, action=("view", "click")[i % 2], timestamp=start + timedelta(minutes=7 * i, seconds=i))
+    writer.flush()
+    # Строка, добавленная в обход писателя, новее водяного знака и учитывается из журнала
+    db.add(models.ActionLog(user_id=1, action="view", timestamp=start + timedelta(hours=5)))
+    db.commit()
+
+    def raw_count(a, b, **filters):
+        query = db.query(models.ActionLog).filter(models.ActionLog.timestamp >= a, models.ActionLog.timestamp < b)
+        return query.filter_by(**filters).count()
+
+    periods = [
+        (start, start + timedelta(days=3)),
+        (start + timedelta(seconds=17), start + timedelta(days=1, hours=3, minutes=5, seconds=40)),
+        (datetime(2024, 5, 2), datetime(2024, 5, 3)),
+        (start + timedelta(minutes=3, seconds=1), start + timedelta(minutes=3, seconds=50)),
+    ]
+    for a, b in periods:
+        assert rollups.count_actions(db, a, b) == raw_count(a, b)
+        assert rollups.count_actions(db, a, b, action="click", user_id=2) == raw_count(a, b, action="click", user_id=2)
+    by_action = rollups.count_by_period(db, *periods[1], group_by="action")
+    assert by_action == {action: raw_count(*periods[1], action=action) for action in ("view", "click")}
+    assert rollups.total_count(db) == 401
+
+    # Начало периода выровнено по часу: первым в плане идет верхний минутный край,
+    # а строки новее водяного знака в начале периода все равно учитываются
+    aligned = (datetime(2024, 5, 2, 3), datetime(2024, 5, 2, 5, 30, 15))
+    assert rollups.period_plan(*aligned)[1][0][0] == "minute"
+    db.add(models.ActionLog(user_id=2, action="click", timestamp=aligned[0] + timedelta(minutes=20)))
+    db.commit()
+    assert rollups.count_actions(db, *aligned) == raw_count(*aligned)
+    assert rollups.count_by_period(db, *aligned, group_by="action") == {
+        action: raw_count(*aligned, action=action) for action in ("view", "click") if raw_count(*aligned, action=action)
+    }
+    assert rollups.total_count(db) == 402
+
+    # Дополнение при записи и пересчет по всей истории дают одинаковые агрегаты
+    def stored():
+        db.expire_all()
+        return {(r.granularity, r.bucket_start, r.action, r.user_id): r.count for r in db.query(models.ActionRollup)}
+
+    expected = dict(rollups.aggregate((r.user_id, r.action, r.timestamp) for r in db.query(models.ActionLog)))
+    # Разбивка по пользователям хранится только в дневных агрегатах
+    assert {key[3] for key in expected if key[0] != "day"} == {rollups.NO_USER}
+    assert len([key for key in expected if key[0] == "hour"]) <= 2 * len({key[1] for key in expected if key[0] == "hour"})
+    with engine.begin() as connection:
+        assert rollups.roll_up(connection) == 2
+    assert stored() == expected
+    with engine.begin() as connection:
+        assert rollups.rebuild(connection, chunk_size=64) == 402
+    assert stored() == expected
+
+
+def test_sketches_estimate_distinct_users_and_top_actions(engine, db):
+    from app.services.sketches import HeavyHitters, HyperLogLog, distinct_users, top_actions
+
+    # Объединение дневных HyperLogLog равно HyperLogLog объединения
+    first, second, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for i in range(20000):
+        (first if i % 2 else second).add(i % 15000)
+        both.add(i % 15000)
+    assert first.merge(second).registers == both.registers
+    assert abs(both.count() - 15000) / 15000 < 0.05
+    assert HyperLogLog.from_bytes(both.to_bytes()).count() == both.count()
+
+    writer = ActionLogWriter(engine, batch_size=500, flush_interval=60)
+    day = datetime(2024, 6, 1, 8)
+    actions = ["view"] * 50 + ["click"] * 30 + ["share"] * 10 + [f"rare {i}" for i in range(200)]
+    for i, action in enumerate(actions * 3):
+        writer.submit(user_id=i % 120, action=action, timestamp=day + timedelta(hours=i % 40))
+    writer.flush()
+    db.add(models.ActionLog(user_id=999, action="share", timestamp=day))
+    db.commit()
+
+    top = top_actions(db, day, day + timedelta(days=2), limit=3)
+    assert [action for action, _ in top] == ["view", "click", "share"]
+    assert top[2][1] >= 31  # Count-Min не занижает, строка новее водяного знака учтена
+    assert 115 <= distinct_users(db, day, day + timedelta(days=2)) <= 125
+    hitters = HeavyHitters.from_bytes(db.query(models.ActionSketch).filter_by(kind="actions_topk").first().data)
+    assert len(hitters.candidates) <= hitters.capacity
+
+
+def test_retention_seals_archives_and_still_answers_period_queries(engine, db, tmp_path, monkeypatch):
+    from app.services import action_archive, retention
+
+    writer = ActionLogWriter(engine, batch_size=500, flush_interval=60)
+    start = datetime(2024, 3, 1)
+    for i in range(600):
+        writer.submit(user_id=i % 7 or None, action=("view", "click", "share")[i % 3], timestamp=start + timedelta(hours=4 * i, seconds=i))
+    writer.flush()
+    everything = [tuple(row) for row in db.query(models.ActionLog.id, models.ActionLog.user_id, models.ActionLog.action, models.ActionLog.timestamp)]
+    periods = [(datetime(2024, 3, 5, 10, 0, 30), datetime(2024, 4, 20, 7, 59, 1)), (start, datetime(2024, 7, 1))]
+    expected = [rollups.count_by_period(db, a, b, group_by="action") for a, b in periods]
+
+    with engine.begin() as connection:
+        result = retention.maintain(connection, now=datetime(2024, 6, 10), mode="archive", retention_days=60, directory=str(tmp_path))
+    assert result == {"prepared": ["action_logs_p202403", "action_logs_p202404", "action_logs_p202405"], "expired": ["action_logs_p202403"]}
+    db.expire_all()
+    # В основной таблице остался только текущий месяц, март - в колоночном архиве
+    assert {row.timestamp.month for row in db.query(models.ActionLog)} == {6}
+    states = {p.name: (p.state, p.rows) for p in db.query(models.ActionLogPartition)}
+    assert states["action_logs_p202403"] == ("archived", 186) and states["action_logs_p202404"][0] == "sealed"
+    assert (tmp_path / "action_logs_p202403.actlog").stat().st_size < 186 * 8
+
+    assert [tuple(row) for row in retention.read_actions(db, start, datetime(2024, 7, 1))] == sorted(everything, key=lambda r: (r[3], r[0]))
+    assert [rollups.count_by_period(db, a, b, group_by="action") for a, b in periods] == expected
+    # Минутные и часовые агрегаты старше срока хранения удалены, края читаются из архива и партиций
+    rollup = models.ActionRollup
+    assert db.query(rollup).filter(rollup.granularity != "day", rollup.bucket_start < datetime(2024, 4, 11)).count() == 0
+    assert rollups.fine_since(db) == datetime(2024, 4, 11)
+    by_user = Counter(row[1] or rollups.NO_USER for row in everything if periods[0][0] <= row[3] < periods[0][1])
+    assert rollups.count_by_period(db, *periods[0], group_by="user_id") == dict(by_user)
+    with engine.begin() as connection:
+        assert rollups.rebuild(connection) == 600
+    assert [rollups.count_by_period(db, a, b, group_by="action") for a, b in periods] == expected
+
+    # Края периодов в архиве: столбец времени распаковывается один раз, архив вне периода не читается
+    action_archive._timestamps_cache.clear()
+    blocks = []
+    decompress = action_archive.zlib.decompress
+    monkeypatch.setattr(action_archive.zlib, "decompress", lambda data: blocks.append(len(data)) or decompress(data))
+    edge = (datetime(2024, 3, 5, 10, 0, 30), datetime(2024, 3, 5, 10, 1))
+    assert retention.archived_rows(db, *edge) == retention.archived_rows(db, *edge) == []
+    assert len(blocks) == 1
+    assert retention.archived_rows(db, datetime(2024, 3, 31, 23), datetime(2024, 4, 1)) == []
+    assert len(blocks) == 1
+
+
+def test_stats_engine_matches_rebuilt_standings_and_counts_scorers(db):
+    from app.services import stats_engine
+
+    seed(db, teams_count=5, matches_count=0)
+    teams = [team.id for team in db.query(models.Team).order_by(models.Team.id)]
+    players = {team.id: [p.id for p in team.players] for team in db.query(models.Team)}
+    start = datetime(2024, 1, 1)
+    for i in range(40):
+        home, away = teams[i % 4], teams[(i * 3 + 1) % 4]
+        if home == away:
+            continue
+        scores = (None, None) if i == 39 else (i % 4, (i * 7) % 3)
+        match = models.Match(home_team_id=home, away_team_id=away, date=start + timedelta(days=i), home_score=scores[0], away_score=scores[1])
+        db.add(match)
+        db.flush()
+        db.add_all([models.Goal(match_id=match.id, player_id=players[home][g % 3], minute=10 + g) for g in range(scores[0] or 0)])
+    db.commit()
+    rebuild_standings(db)
+
+    data = stats_engine.SeasonData.load(db)
+    table = stats_engine.standings(data)
+    # Команда без матчей тоже в таблице, порядок и значения - как после rebuild_standings
+    assert [
+        (r["team_id"], r["played"], r["won"], r["drawn"], r["lost"], r["goals_for"], r["goals_against"], r["goal_difference"], r["points"], r["form"])
+        for r in table
+    ] == standings_snapshot(db)
+    for row in table:
+        assert row["points"] == row["home"]["points"] + row["away"]["points"]
+        assert row["goals_for"] == row["home"]["goals_for"] + row["away"]["goals_for"]
+
+    scorers = stats_engine.player_totals(data)
+    goals = db.query(models.Goal.player_id, models.Goal.match_id, models.Goal.minute).all()
+    assert sum(s["goals"] for s in scorers) == len(goals)
+    best = scorers[0]
+    mine = [g for g in goals if g.player_id == best["player_id"]]
+    assert best["goals"] == len(mine) == max(s["goals"] for s in scorers)
+    assert best["matches"] == len({g.match_id for g in mine})
+    assert best["average_minute"] == round(sum(g.minute for g in mine) / len(mine), 1)
+
+    # Период: только матчи и голы внутри него
+    stats_engine.invalidate_season_data()
+    january = stats_engine.season_stats(db, start, datetime(2024, 2, 1))
+    played = db.query(models.Match).filter(models.Match.date < datetime(2024, 2, 1), models.Match.home_score.is_not(None)).count()
+    assert sum(r["played"] for r in january["standings"]) == 2 * played
+    january_goals = db.query(models.Goal).join(models.Match).filter(models.Match.date < datetime(2024, 2, 1)).count()
+    assert sum(s["goals"] for s in stats_engine.player_totals(stats_engine.SeasonData.load(db, start, datetime(2024, 2, 1)))) == january_goals
+    assert len(january["top_scorers"]) <= 10
+
+    # Повторный расчет берет столбцы из кэша, запись матча сбрасывает кэш
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert stats_engine.season_stats(db, start, datetime(2024, 2, 1)) == january
+        assert statements == []
+        create_match(db, schemas.MatchCreate(home_team_id=teams[0], away_team_id=teams[4], date=start, home_score=1, away_score=0))
+        statements.clear()
+        again = stats_engine.season_stats(db, start, datetime(2024, 2, 1))
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    assert statements and sum(r["played"] for r in again["standings"]) == 2 * played + 2
+
+
+def test_retention_keeps_late_rows_of_archived_periods_in_new_segments(engine, db, tmp_path):
+    from app import analytics
+    from app.services import retention
+
+    writer = ActionLogWriter(engine, batch_size=500, flush_interval=60)
+    for day in range(10):
+        writer.submit(user_id=1, action="view", timestamp=datetime(2024, 1, 2 + day, 12))
+    writer.flush()
+    options = dict(mode="archive", retention_days=90, directory=str(tmp_path))
+    with engine.begin() as connection:
+        assert retention.maintain(connection, now=datetime(2024, 5, 1), **options)["expired"] == ["action_logs_p202401"]
+
+    # Опоздавшая строка закрытого и архивированного месяца: новый сегмент, старый архив не тронут
+    first_archive = (tmp_path / "action_logs_p202401.actlog").read_bytes()
+    writer.submit(user_id=1, action="late", timestamp=datetime(2024, 1, 6))
+    writer.submit(user_id=1, action="sealed", timestamp=datetime(2024, 3, 3))
+    writer.submit(user_id=2, action="sealed", timestamp=datetime(2024, 3, 4))
+    writer.submit(user_id=1, action="current", timestamp=datetime(2024, 5, 1, 8))
+    writer.flush()
+    with engine.begin() as connection:
+        result = retention.maintain(connection, now=datetime(2024, 5, 2), **options)
+    assert result == {"prepared": ["action_logs_p202401_1", "action_logs_p202403"], "expired": ["action_logs_p202401_1"]}
+    assert (tmp_path / "action_logs_p202401.actlog").read_bytes() == first_archive
+    db.expire_all()
+    assert {p.name: (p.state, p.rows) for p in db.query(models.ActionLogPartition)} == {
+        "action_logs_p202401": ("archived", 10), "action_logs_p202401_1": ("archived", 1),
+        "action_logs_p202403": ("sealed", 2),
+    }
+    rows = analytics.get_actions_by_period(db, datetime(2024, 1, 1), datetime(2024, 2, 1))
+    assert len(rows) == 11 and [row.timestamp for row in rows] == sorted(row.timestamp for row in rows)
+    # История пользователя: архивы, отделенная партиция и основная таблица
+    history = analytics.get_user_actions(db, 1)
+    assert len(history) == 13 and {row.user_id for row in history} == {1}
+    assert [row.action for row in history[-3:]] == ["view", "sealed", "current"]
+    assert [row.action for row in analytics.get_user_actions(db, 2)] == ["sealed"]
+
+    # Архив с занятым именем не перезаписывается
+    with pytest.raises(FileExistsError):
+        retention.write_archive(str(tmp_path / "action_logs_p202401.actlog"), [])
+    assert retention.archive_path("action_logs_p202401", str(tmp_path)).endswith("action_logs_p202401.1.actlog")
+
+
+def test_gunicorn_config_follows_environment_settings():
+    pytest.importorskip("gunicorn")
+    # Настройки читаются при импорте, поэтому конфигурация строится в отдельном процессе
+    script = """
+import json, run
+from gunicorn.config import Config
+options = run.gunicorn_options("0.0.0.0", 9000, "warning", 3)
+config = Config()
+for key, value in options.items():
+    config.set(key, value)
+print(json.dumps({
+    "bind": config.bind, "workers": config.workers, "keepalive": config.keepalive, "backlog": config.backlog,
+    "graceful_timeout": config.graceful_timeout, "max_requests": config.max_requests,
+    "max_requests_jitter": config.max_requests_jitter, "preload_app": config.preload_app,
+    "worker_kwargs": config.worker_class.CONFIG_KWARGS, "post_fork": config.post_fork.__name__,
+}))
+"""
+    env = dict(os.environ, EVENT_LOOP="asyncio", HTTP_IMPL="h11", KEEPALIVE_TIMEOUT="17", BACKLOG="512",
+               GRACEFUL_TIMEOUT="45", MAX_REQUESTS="1000", METRICS_DIR="")
+    output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True).stdout
+    assert json.loads(output.splitlines()[-1]) == {
+        "bind": ["0.0.0.0:9000"], "workers": 3, "keepalive": 17, "backlog": 512, "graceful_timeout": 45,
+        "max_requests": 1000, "max_requests_jitter": 100, "preload_app": True,
+        "worker_kwargs": {"loop": "asyncio", "http": "h11"}, "post_fork": "post_fork",
+    }
+
+    # После fork воркер получает новые пулы соединений
+    import run
+    from app.db import database
+
+    pools = database.engine.pool, database.async_engine.sync_engine.pool
+    run.post_fork(None, None)
+    assert database.engine.pool is not pools[0] and database.async_engine.sync_engine.pool is not pools[1]